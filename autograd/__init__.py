@@ -3,6 +3,9 @@ from .differential_operators import (
     make_vjp, grad, multigrad_dict, elementwise_grad, value_and_grad,
     grad_and_aux, hessian_tensor_product, hessian_vector_product, hessian,
     jacobian, tensor_jacobian_product, vector_jacobian_product, grad_named,
-    checkpoint, make_hvp, make_jvp, make_ggnvp, deriv, holomorphic_grad)
+    checkpoint, make_hvp, make_jvp, make_ggnvp, deriv, holomorphic_grad,
+    make_tape_vjp, make_batched_vjp, make_batched_jvp, jacobian_fwd,
+    linearize, linear_transpose)
+from .profiler import profile
 from .builtins import isinstance, type, tuple, list, dict
 from autograd.core import primitive_with_deprecation_warnings as primitive
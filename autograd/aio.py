@@ -0,0 +1,72 @@
+"""Awaitable versions of the differential operators, for asyncio programs.
+
+    vg = aio.value_and_grad(loss)
+    value, gradient = await vg(params, data)
+
+The computation runs on a thread pool, so the event loop isn't blocked. This
+is safe because trace levels are kept per thread. Cancelling the awaitable
+stops the computation at the next primitive, in the forward or the backward
+pass, raising TraceCancelled in the worker. Requires Python 3."""
+from __future__ import absolute_import
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import differential_operators
+from .tracer import trace_stack, TraceCancelled
+from .wrap_util import wraps
+
+shared_executor = []
+shared_executor_lock = threading.Lock()
+def get_executor():
+    """The thread pool used when no executor is given. It is started on first
+    use and stopped by `shutdown`."""
+    with shared_executor_lock:
+        if not shared_executor:
+            shared_executor.append(ThreadPoolExecutor())
+        return shared_executor[0]
+
+def shutdown(wait=True):
+    with shared_executor_lock:
+        if shared_executor:
+            shared_executor.pop().shutdown(wait)
+
+def awaitable(operator):
+    """Makes an awaitable version of a differential operator. It takes one more
+    keyword argument, `executor`: a concurrent.futures executor, by default
+    the shared thread pool."""
+    @wraps(operator, "{fun}", "Awaitable version of `{fun}`.\n{doc}")
+    def aio_operator(fun, *op_args, **op_kwargs):
+        executor = op_kwargs.pop('executor', None)
+        return AsyncFunction(operator(fun, *op_args, **op_kwargs), executor)
+    return aio_operator
+
+class AsyncFunction(object):
+    """Calling it submits the wrapped function to the executor and returns an
+    asyncio future for the result."""
+    def __init__(self, fun, executor=None):
+        self.fun = fun
+        self.executor = executor
+        wraps(fun)(self)
+
+    def __call__(self, *args, **kwargs):
+        executor = self.executor or get_executor()
+        cancel_event = threading.Event()
+        cfuture = executor.submit(run_request, self.fun, cancel_event, args, kwargs)
+        future = asyncio.wrap_future(cfuture)
+        def on_done(future):
+            if future.cancelled():
+                cancel_event.set()
+        future.add_done_callback(on_done)
+        return future
+
+def run_request(fun, cancel_event, args, kwargs):
+    trace_stack.cancel_event = cancel_event
+    try:
+        return fun(*args, **kwargs)
+    finally:
+        trace_stack.cancel_event = None
+
+grad           = awaitable(differential_operators.grad)
+value_and_grad = awaitable(differential_operators.value_and_grad)
+jacobian       = awaitable(differential_operators.jacobian)
+hessian        = awaitable(differential_operators.hessian)
@@ -133,6 +133,12 @@ class ContainerVSpace(VSpace):
         for i, vs in self._kv_pairs(self.shape):
             for x in vs.standard_basis():
                 yield self._subval(zero, i, x)
+    def batch_stack(self, xs):
+        return self._map(lambda vs, *x: vs.batch_stack(x), *xs)
+    def batch_unstack(self, xs):
+        unstacked = self._map(lambda vs, x: vs.batch_unstack(x), xs)
+        batch_size = min(map(len, self._values(unstacked)))
+        return [self._map(lambda vs, x: x[i], unstacked) for i in range(batch_size)]
     def _add(self, xs, ys):
         return self._map(lambda vs, x, y: vs._add(x, y), xs, ys)
     def _mut_add(self, xs, ys):
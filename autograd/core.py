@@ -1,58 +1,207 @@
+import os
 from itertools import count
-from functools import reduce
-from .tracer import trace, primitive, toposort, Node, Box, isbox, getval
+from functools import reduce, partial
+from .tracer import (trace, primitive, toposort, Node, Box, isbox, getval,
+                     notrace_primitives, registry_lock, trace_stack,
+                     check_cancelled)
 from .util import func, subval
 
 # -------------------- reverse mode --------------------
 
-def make_vjp(fun, x):
+def make_vjp(fun, x, consume=False, executor=None):
+    """If `consume` is True, the returned vjp can only be called once, and the
+    backward pass frees each node's VJP closure (and with it the forward
+    intermediates it holds) as soon as it has been applied. If `executor` (a
+    concurrent.futures executor) is given, the backward pass runs the VJPs of
+    large nodes on it concurrently; see `parallel_backward_pass`."""
     start_node = VJPNode.new_root()
     end_value, end_node =  trace(start_node, fun, x)
+    backward = (backward_pass if executor is None
+                else partial(parallel_backward_pass, executor=executor))
     if end_node is None:
         def vjp(g): return vspace(x).zeros()
+    elif consume:
+        vjp = consuming_vjp(backward, end_node)
     else:
-        def vjp(g): return backward_pass(g, end_node)
+        def vjp(g): return backward(g, end_node)
     return vjp, end_value
 
-def backward_pass(g, end_node):
+def consuming_vjp(backward_pass, end_node):
+    end_nodes = [end_node]
+    def vjp(g):
+        if not end_nodes:
+            raise RuntimeError("This vjp has already been used and its graph freed.")
+        return backward_pass(g, end_nodes.pop(), consume=True)
+    return vjp
+
+def backward_pass(g, end_node, consume=False):
+    profiler = trace_stack.profiler
+    if profiler is not None:
+        return profiler.backward_pass(g, end_node, consume)
     outgrads = {end_node : (g, False)}
     for node in toposort(end_node):
+        check_cancelled()
         outgrad = outgrads.pop(node)
         ingrads = node.vjp(outgrad[0])
+        if consume:
+            node.recipe = None
         for parent, ingrad in zip(node.parents, ingrads):
             outgrads[parent] = add_outgrads(outgrads.get(parent), ingrad)
     return outgrad[0]
 
+def parallel_backward_pass(g, end_node, consume=False, executor=None, min_size=10000):
+    """Like `backward_pass`, but once all the children of a node have been
+    applied, if its outgrad has at least `min_size` elements, its VJP is
+    submitted to `executor` together with those of the chain of single-child
+    ancestors above it. VJPs of independent branches (which often release the
+    GIL in BLAS) then overlap. The ingrads are still accumulated in the order
+    `backward_pass` uses, so the result is exactly the same."""
+    if trace_stack.top >= 0 or trace_stack.profiler is not None:
+        # Nested in another trace, the VJPs would record onto it from other
+        # threads. When profiling, the VJPs are timed one at a time.
+        return backward_pass(g, end_node, consume)
+    order = list(toposort(end_node))
+    num_children = dict.fromkeys(order, 0)
+    for node in order:
+        for parent in node.parents:
+            num_children[parent] += 1
+    pending_children = dict(num_children)
+    outgrads = {end_node : (g, False)}
+    started = {}
+    def start(node):
+        outgrad = outgrads.pop(node)[0]
+        if node.parents and getattr(outgrad, 'size', 0) >= min_size:
+            chain = [node]
+            while len(node.parents) == 1 and num_children[node.parents[0]] == 1 \
+                  and node.parents[0].parents:
+                node = node.parents[0]
+                chain.append(node)
+            future = executor.submit(apply_chain, chain, outgrad)
+            for i, member in enumerate(chain):
+                started[member] = (None, future, i)
+        else:
+            started[node] = (outgrad, None, None)
+    start(end_node)
+    for node in order:
+        check_cancelled()
+        outgrad, future, i = started.pop(node)
+        ingrads = node.vjp(outgrad) if future is None else future.result()[i]
+        if consume:
+            node.recipe = None
+        for parent, ingrad in zip(node.parents, ingrads):
+            if parent in started:
+                continue  # The next node of a chain, which got this ingrad already
+            outgrads[parent] = add_outgrads(outgrads.get(parent), ingrad)
+            pending_children[parent] -= 1
+            if pending_children[parent] == 0:
+                start(parent)
+    return outgrad
+
+def apply_chain(chain, outgrad):
+    ingrads_list = []
+    for node in chain:
+        ingrads = tuple(node.vjp(outgrad))
+        ingrads_list.append(ingrads)
+        outgrad = add_outgrads(None, ingrads[0])[0] if ingrads else None
+    return ingrads_list
+
 class VJPNode(Node):
-    __slots__ = ['parents', 'vjp']
+    """Stores the recipe for its VJP and only builds it when the backward pass
+    reaches the node, so tracing alone (or a pruned node) never calls the
+    vjpmaker. The built VJP then replaces the recipe, so later backward passes
+    through the same graph reuse it. Values the VJPs were declared not to use
+    are dropped at once."""
+    __slots__ = ['parents', 'recipe']
     def __init__(self, value, fun, args, kwargs, parent_argnums, parents):
         self.parents = parents
-        try:
-            vjpmaker = primitive_vjps[fun]
-        except KeyError:
-            fun_name = getattr(fun, '__name__', fun)
-            raise NotImplementedError("VJP of {} wrt argnums {} not defined"
-                                      .format(fun_name, parent_argnums))
-        self.vjp = vjpmaker(parent_argnums, value, args, kwargs)
+        vjpmaker = primitive_vjps.get(fun) or get_vjpmaker(fun, parent_argnums)
+        vjpmaker, value, args = residual_recipe(fun, parent_argnums, vjpmaker, value, args)
+        self.recipe = (vjpmaker, parent_argnums, value, args, kwargs)
 
     def initialize_root(self):
         self.parents = []
-        self.vjp = lambda g: ()
+        self.recipe = (root_vjpmaker, (), None, (), {})
+
+    def vjp(self, g):
+        recipe = self.recipe
+        if type(recipe) is not tuple:
+            return recipe(g)
+        vjpmaker, parent_argnums, value, args, kwargs = recipe
+        vjp = self.recipe = vjpmaker(parent_argnums, value, args, kwargs)
+        return vjp(g)
+
+def root_vjpmaker(parent_argnums, ans, args, kwargs):
+    return lambda g: ()
+
+def get_vjpmaker(fun, parent_argnums):
+    try:
+        return primitive_vjps[fun]
+    except KeyError:
+        fun_name = getattr(fun, '__name__', fun)
+        if fun in primitive_jvps:
+            linear_argnums = [argnum for argnum in parent_argnums
+                              if argnum in primitive_linear_argnums.get(fun, ())]
+            if not linear_argnums:
+                return transposed_jvp(fun)
+            raise NotImplementedError(
+                "VJP of {} wrt argnums {} not defined. Its JVP wrt argnums {} is "
+                "{} itself ('same' or def_linear), which can't be transposed "
+                "by tracing it, so give its transpose with defvjp."
+                .format(fun_name, parent_argnums, linear_argnums, fun_name))
+        raise NotImplementedError("VJP of {} wrt argnums {} not defined"
+                                  .format(fun_name, parent_argnums))
 
 primitive_vjps = {}
-def defvjp_argnums(fun, vjpmaker):
+primitive_residuals = {}
+primitive_argnum_residuals = {}
+def defvjp_argnums(fun, vjpmaker, residuals=None):
+    """`residuals`, if given, lists the values the VJPs use: 'ans' and/or
+    argnums. The nodes replace the others by placeholders carrying only their
+    metadata before `vjpmaker` is called, so the VJPs can't keep them alive."""
     primitive_vjps[fun] = vjpmaker
+    primitive_residuals[fun] = residuals
+    primitive_argnum_residuals.pop(fun, None)
+    needed_residuals_cache.clear()
 
-def defvjp_argnum(fun, vjpmaker):
+def defvjp_argnum(fun, vjpmaker, residuals=None):
     def vjp_argnums(argnums, *args):
         vjps = [vjpmaker(argnum, *args) for argnum in argnums]
         return lambda g: (vjp(g) for vjp in vjps)
-    defvjp_argnums(fun, vjp_argnums)
+    defvjp_argnums(fun, vjp_argnums, residuals)
 
 def defvjp(fun, *vjpmakers, **kwargs):
+    """The optional `residuals` keyword is a list aligned with `vjpmakers`,
+    giving for each VJP the values it uses ('ans' and/or argnums), or None if
+    it may use all of them. See `defvjp_argnums`."""
     argnums = kwargs.get('argnums', count())
+    residuals = kwargs.get('residuals')
+    if residuals is None:
+        residuals = [None] * len(vjpmakers)
+    specs = list(zip(argnums, vjpmakers, residuals))
     vjps_dict = {argnum : translate_vjp(vjpmaker, fun, argnum)
-                 for argnum, vjpmaker in zip(argnums, vjpmakers)}
+                 for argnum, vjpmaker, _ in specs}
+    defvjp_argnums(fun, vjp_argnums_from_dict(fun, vjps_dict))
+    if None not in residuals:
+        primitive_residuals[fun] = set().union(*residuals)
+        primitive_argnum_residuals[fun] = {argnum : needed for argnum, _, needed in specs}
+        needed_residuals_cache.clear()
+
+needed_residuals_cache = {}
+def needed_residuals(fun, argnums):
+    """The values used by the VJPs of `fun` wrt `argnums`, or None if they
+    weren't declared."""
+    try:
+        return needed_residuals_cache[fun, argnums]
+    except KeyError:
+        argnum_residuals = primitive_argnum_residuals.get(fun)
+        if argnum_residuals is None:
+            needed = primitive_residuals.get(fun)
+        else:
+            needed = set().union(*(argnum_residuals.get(argnum, ()) for argnum in argnums))
+        needed_residuals_cache[fun, argnums] = needed
+        return needed
+
+def vjp_argnums_from_dict(fun, vjps_dict):
     def vjp_argnums(argnums, ans, args, kwargs):
         L = len(argnums)
         # These first two cases are just optimizations
@@ -79,17 +228,262 @@ def defvjp(fun, *vjpmakers, **kwargs):
         else:
             vjps = [vjps_dict[argnum](ans, *args, **kwargs) for argnum in argnums]
             return lambda g: (vjp(g) for vjp in vjps)
-
-    defvjp_argnums(fun, vjp_argnums)
+    return vjp_argnums
 
 def translate_vjp(vjpfun, fun, argnum):
     if vjpfun is None:
-        return lambda ans, *args, **kwargs: lambda g: vspace(args[argnum]).zeros()
+        def zero_vjp(ans, *args, **kwargs):
+            vs = vspace(args[argnum])
+            return lambda g: vs.zeros()
+        return zero_vjp
     elif callable(vjpfun):
         return vjpfun
     else:
         raise Exception("Bad VJP '{}' for '{}'".format(vjpfun, fun.__name__))
 
+residual_placeholders = {}
+def placeholder(x):
+    make_placeholder = residual_placeholders.get(type(x))
+    return make_placeholder(x) if make_placeholder else x
+
+def replace_unneeded(ans, args, needed):
+    if 'ans' not in needed:
+        ans = placeholder(ans)
+    args = tuple([arg if argnum in needed else placeholder(arg)
+                  for argnum, arg in enumerate(args)])
+    return ans, args
+
+def drop_unneeded(fun, argnums, ans, args):
+    needed = needed_residuals(fun, argnums)
+    if needed is None:
+        return ans, args
+    return replace_unneeded(ans, args, needed)
+
+# If True (or if the environment variable AUTOGRAD_CHECK_RESIDUALS is set), nodes
+# keep all the values, and their VJPs compare their ingrads with those of the
+# VJPs given the placeholders, raising ResidualsError if they differ. A missing
+# residual declaration then fails loudly instead of giving wrong gradients.
+check_residuals = bool(os.environ.get('AUTOGRAD_CHECK_RESIDUALS'))
+
+class ResidualsError(Exception):
+    pass
+
+def residual_recipe(fun, argnums, vjpmaker, ans, args):
+    """The vjpmaker, answer and args a node keeps for its VJP."""
+    if check_residuals and needed_residuals(fun, argnums) is not None:
+        return partial(checked_vjpmaker, fun, vjpmaker), ans, args
+    ans, args = drop_unneeded(fun, argnums, ans, args)
+    return vjpmaker, ans, args
+
+def checked_vjpmaker(fun, vjpmaker, argnums, ans, args, kwargs):
+    vjp = vjpmaker(argnums, ans, args, kwargs)
+    dropped_ans, dropped_args = drop_unneeded(fun, argnums, ans, args)
+    dropped_vjp = vjpmaker(argnums, dropped_ans, dropped_args, kwargs)
+    def checked_vjp(g):
+        ingrads = tuple(vjp(g))
+        for argnum, ingrad, dropped in zip(argnums, ingrads, dropped_vjp(g)):
+            if not same_ingrads(ingrad, dropped):
+                raise ResidualsError(
+                    "The VJP of {} wrt argnum {} reads values that aren't among "
+                    "its declared residuals {}".format(
+                        getattr(fun, '__name__', fun), argnum,
+                        sorted(needed_residuals(fun, argnums), key=str)))
+        return ingrads
+    return checked_vjp
+
+def same_ingrads(x, y):
+    import numpy as onp
+    x, y = getval(x), getval(y)
+    if type(x) in sparse_object_types:
+        x = x.mut_add(x.vs.zeros())
+    if type(y) in sparse_object_types:
+        y = y.mut_add(y.vs.zeros())
+    if x is None or y is None:
+        return x is y
+    elif type(x) in (tuple, list):
+        return len(x) == len(y) and all(map(same_ingrads, x, y))
+    elif type(x) is dict:
+        return x.keys() == y.keys() and all(same_ingrads(x[k], y[k]) for k in x)
+    return onp.allclose(x, y, rtol=1e-12, atol=0., equal_nan=True)
+
+# -------------------- tape-based reverse mode --------------------
+
+def make_tape_vjp(fun, x, consume=False):
+    """Like make_vjp, but records the graph on a Tape. Nodes get sequential
+    ids, so the backward pass is a reverse sweep over the tape with no
+    toposort and no dicts keyed by node."""
+    start_node = TapeNode.new_root()
+    end_value, end_node = trace(start_node, fun, x)
+    if end_node is None:
+        def vjp(g): return vspace(x).zeros()
+    elif consume:
+        vjp = consuming_vjp(tape_backward_pass, end_node)
+    else:
+        def vjp(g): return tape_backward_pass(g, end_node)
+    return vjp, end_value
+
+def tape_backward_pass(g, end_node, consume=False):
+    parents, vjps = end_node.tape.parents, end_node.tape.vjps
+    outgrads = [None] * (end_node.id + 1)
+    outgrads[end_node.id] = (g, False)
+    for i in range(end_node.id, 0, -1):
+        outgrad = outgrads[i]
+        if outgrad is None:
+            continue
+        check_cancelled()
+        outgrads[i] = None
+        ingrads = vjps[i](outgrad[0])
+        if consume:
+            vjps[i] = None
+        for parent, ingrad in zip(parents[i], ingrads):
+            outgrads[parent] = add_outgrads(outgrads[parent], ingrad)
+    return outgrads[0][0]
+
+class Tape(object):
+    __slots__ = ['parents', 'vjps']
+    def __init__(self):
+        self.parents = [()]
+        self.vjps = [None]
+
+class TapeNode(Node):
+    __slots__ = ['tape', 'id']
+    def __init__(self, value, fun, args, kwargs, parent_argnums, parents):
+        vjpmaker = primitive_vjps.get(fun) or get_vjpmaker(fun, parent_argnums)
+        tape = self.tape = parents[0].tape
+        self.id = len(tape.vjps)
+        tape.parents.append([parent.id for parent in parents])
+        vjpmaker, value, args = residual_recipe(fun, parent_argnums, vjpmaker, value, args)
+        tape.vjps.append(vjpmaker(parent_argnums, value, args, kwargs))
+
+    def initialize_root(self):
+        self.tape = Tape()
+        self.id = 0
+
+notrace_primitives[TapeNode] = notrace_primitives[VJPNode]
+
+# -------------------- selective checkpointing --------------------
+
+def record_saved(fun, x, save):
+    """Evaluates `fun` at `x`, tracing it to see its primitive calls. Returns
+    the value and a list with one (primitive, output) pair per call, where the
+    output is None unless `save(primitive, output nbytes)` is True."""
+    saved = []
+    start_node = RecordNode.new_root(saved, save)
+    end_value, _ = trace(start_node, fun, x)
+    return end_value, saved
+
+def make_replay_vjp(fun, x, saved):
+    """Like make_vjp, but the primitive calls reuse the outputs in `saved`
+    (from `record_saved` on the same function and argument types) instead of
+    recomputing them."""
+    start_node = ReplayNode.new_root(saved)
+    end_value, end_node = trace(start_node, fun, x)
+    if end_node is None:
+        def vjp(g): return vspace(x).zeros()
+    else:
+        def vjp(g): return backward_pass(g, end_node)
+    return vjp, end_value
+
+class RecordNode(Node):
+    __slots__ = ['saved', 'save']
+    def __init__(self, value, fun, args, kwargs, parent_argnums, parents):
+        self.saved, self.save = parents[0].saved, parents[0].save
+        self.saved.append((fun, value if self.save(fun, nbytes(value)) else None))
+
+    def initialize_root(self, saved, save):
+        self.saved, self.save = saved, save
+
+class ReplayNode(VJPNode):
+    __slots__ = ['saved']
+    replays = True
+    def __init__(self, value, fun, args, kwargs, parent_argnums, parents):
+        VJPNode.__init__(self, value, fun, args, kwargs, parent_argnums, parents)
+        self.saved = parents[0].saved
+
+    def initialize_root(self, saved):
+        VJPNode.initialize_root(self)
+        self.saved = iter(saved)
+
+    def evaluate(self, fun, args, kwargs):
+        saved_fun, value = next(self.saved, (None, None))
+        if saved_fun is fun and value is not None:
+            return value
+        return fun(*args, **kwargs)
+
+notrace_primitives[RecordNode] = notrace_primitives[VJPNode]
+notrace_primitives[ReplayNode] = notrace_primitives[VJPNode]
+
+def nbytes(value):
+    if type(value) in (tuple, list):
+        return sum(map(nbytes, value))
+    return getattr(value, 'nbytes', 8)
+
+# -------------------- batched reverse mode --------------------
+
+def make_batched_vjp(fun, x):
+    """Like make_vjp, but the returned vjp takes a batch of cotangents stacked
+    along a new leading axis and pulls them all back in a single backward
+    pass, returning the input cotangents stacked the same way."""
+    start_node = BatchedVJPNode.new_root()
+    end_value, end_node = trace(start_node, fun, x)
+    if end_node is None:
+        def vjp(G):
+            batch_size = len(vspace(end_value).batch_unstack(G))
+            return vspace(x).batch_stack([vspace(x).zeros()] * batch_size)
+    else:
+        def vjp(G): return backward_pass(G, end_node)
+    return vjp, end_value
+
+class BatchedVJPNode(Node):
+    __slots__ = ['parents', 'vjp']
+    def __init__(self, value, fun, args, kwargs, parent_argnums, parents):
+        self.parents = parents
+        vjpmaker = get_vjpmaker(fun, parent_argnums)
+        batched_vjpmaker = primitive_batched_vjps.get(fun)
+        if batched_vjpmaker:
+            self.vjp = batched_vjpmaker(parent_argnums, value, args, kwargs)
+        else:
+            parent_args = [args[argnum] for argnum in parent_argnums]
+            vjpmaker, value, args = residual_recipe(fun, parent_argnums, vjpmaker,
+                                                    value, args)
+            self.vjp = loop_over_batch(vjpmaker(parent_argnums, value, args, kwargs),
+                                       value, parent_args)
+
+    def initialize_root(self):
+        self.parents = []
+        self.vjp = lambda g: ()
+
+notrace_primitives[BatchedVJPNode] = notrace_primitives[VJPNode]
+
+def loop_over_batch(vjp, ans, parent_args):
+    ans_vs = vspace(ans)
+    parent_vss = [vspace(arg) for arg in parent_args]
+    def batched_vjp(G):
+        ingrads = zip(*[vjp(g) for g in ans_vs.batch_unstack(G)])
+        return [vs.batch_stack([densify(vs, g) for g in gs])
+                for vs, gs in zip(parent_vss, ingrads)]
+    return batched_vjp
+
+def densify(vs, g):
+    return sparse_add(vs, None, g) if type(g) in sparse_object_types else g
+
+primitive_batched_vjps = {}
+def defvjp_batched_argnums(fun, vjpmaker):
+    primitive_batched_vjps[fun] = vjpmaker
+
+def defvjp_batched(fun, *vjpmakers, **kwargs):
+    """Like defvjp, but each VJP maps a batch of cotangents, stacked along a
+    new leading axis, to the batch of cotangents of its argument. Primitives
+    without batched VJPs are handled by looping over the batch."""
+    argnums = kwargs.get('argnums', count())
+    vjps_dict = dict(zip(argnums, vjpmakers))
+    defvjp_batched_argnums(fun, vjp_argnums_from_dict(fun, vjps_dict))
+
+def defvjp_batched_same(fun):
+    """Flags that the VJPs of `fun` already broadcast over a leading batch axis
+    of the cotangent, so they can be used as its batched VJPs."""
+    defvjp_batched_argnums(fun, primitive_vjps[fun])
+
 # -------------------- forward mode --------------------
 
 def make_jvp(fun, x):
@@ -102,24 +496,32 @@ def make_jvp(fun, x):
             return end_value, end_node.g
     return jvp
 
+class JVPNotDefined(NotImplementedError):
+    pass
+
+def get_jvpmaker(fun, parent_argnums):
+    try:
+        return primitive_jvps[fun]
+    except KeyError:
+        name = getattr(fun, '__name__', fun)
+        raise JVPNotDefined("JVP of {} wrt argnums {} not defined"
+                            .format(name, parent_argnums))
+
 class JVPNode(Node):
     __slots__ = ['g']
     def __init__(self, value, fun, args, kwargs, parent_argnums, parents):
         parent_gs = [parent.g for parent in parents]
-        try:
-            jvpmaker = primitive_jvps[fun]
-        except KeyError:
-            name = getattr(fun, '__name__', fun)
-            raise NotImplementedError("JVP of {} wrt argnums {} not defined"
-                                      .format(name, parent_argnums))
+        jvpmaker = get_jvpmaker(fun, parent_argnums)
         self.g = jvpmaker(parent_argnums, parent_gs, value, args, kwargs)
 
     def initialize_root(self, g):
         self.g = g
 
 primitive_jvps = {}
+primitive_linear_argnums = {}
 def defjvp_argnums(fun, jvpmaker):
     primitive_jvps[fun] = jvpmaker
+    primitive_linear_argnums.pop(fun, None)
 
 def defjvp_argnum(fun, jvpmaker):
     def jvp_argnums(argnums, gs, ans, args, kwargs):
@@ -128,14 +530,16 @@ def defjvp_argnum(fun, jvpmaker):
     defjvp_argnums(fun, jvp_argnums)
 
 def defjvp(fun, *jvpfuns, **kwargs):
-    argnums = kwargs.get('argnums', count())
+    argnums = list(zip(kwargs.get('argnums', count()), jvpfuns))
     jvps_dict = {argnum : translate_jvp(jvpfun, fun, argnum)
-                 for argnum, jvpfun in zip(argnums, jvpfuns)}
+                 for argnum, jvpfun in argnums}
     def jvp_argnums(argnums, gs, ans, args, kwargs):
         return sum_outgrads(jvps_dict[argnum](g, ans, *args, **kwargs)
                             for argnum, g in zip(argnums, gs))
 
     defjvp_argnums(fun, jvp_argnums)
+    primitive_linear_argnums[fun] = {argnum for argnum, jvpfun in argnums
+                                     if jvpfun == 'same'}
 
 def translate_jvp(jvpfun, fun, argnum):
     if jvpfun is None:
@@ -152,6 +556,151 @@ def def_linear(fun):
     """Flags that a function is linear wrt all args"""
     defjvp_argnum(fun, lambda argnum, g, ans, args, kwargs:
                   fun(*subval(args, argnum, g), **kwargs))
+    primitive_linear_argnums[fun] = AllArgnums()
+
+class AllArgnums(object):
+    def __contains__(self, argnum):
+        return True
+
+# -------------------- transposition --------------------
+
+def linear_transpose(fun, x):
+    """Returns the transpose of `fun`, which must be linear, as a function
+    from output cotangents to input cotangents. Only the vspace of `x` is
+    used: `fun` is traced once at zero."""
+    vjp, _ = make_vjp(fun, vspace(x).zeros())
+    return vjp
+
+def transposed_jvp(fun):
+    """Derives a VJP maker for a primitive that only has a JVP. Its JVP is
+    linear in the tangents, so the VJP is the transpose of the JVP with the
+    primal values bound, which is traced once per node for all its argnums
+    together. This needs the JVP to be written in terms of other primitives,
+    so it doesn't apply to argnums in which `fun` is itself linear ('same' or
+    `def_linear`)."""
+    jvpmaker = primitive_jvps[fun]
+    def vjpmaker(argnums, ans, args, kwargs):
+        return linear_transpose(
+            partial(transposed_jvp_args, jvpmaker, argnums, ans, args, kwargs),
+            tuple(args[argnum] for argnum in argnums))
+    return vjpmaker
+
+def transposed_jvp_args(jvpmaker, argnums, ans, args, kwargs, gs):
+    return jvpmaker(argnums, list(gs), ans, args, kwargs)
+
+# -------------------- linearized forward mode --------------------
+
+def linearize(fun, x):
+    """Traces `fun` at `x` once, recording each primitive's JVP with its primal
+    values bound. Returns `(fun(x), jvp)`, where `jvp(g)` runs the recorded JVPs
+    without tracing or boxing and without re-evaluating `fun`. Each JVP rule
+    still runs in full on every call, so factors it computes from the primal
+    values alone, like the cos(x) in the JVP of sin, are recomputed each time."""
+    start_node = LinearNode.new_root()
+    end_value, end_node = trace(start_node, fun, x)
+    if end_node is None:
+        def jvp(g): return vspace(end_value).zeros()
+    else:
+        program = end_node.program
+        steps = live_steps(program.parents, end_node.id)
+        def jvp(g): return linear_forward_pass(g, program, steps, end_node.id)
+    return end_value, jvp
+
+def live_steps(parents, end_id):
+    live = [False] * (end_id + 1)
+    live[end_id] = True
+    for i in range(end_id, 0, -1):
+        if live[i]:
+            for parent in parents[i]:
+                live[parent] = True
+    return [i for i in range(1, end_id + 1) if live[i]]
+
+def linear_forward_pass(g, program, steps, end_id):
+    parents, jvps = program.parents, program.jvps
+    gs = [None] * (end_id + 1)
+    gs[0] = g
+    for i in steps:
+        gs[i] = jvps[i]([gs[parent] for parent in parents[i]])
+    return gs[end_id]
+
+class LinearProgram(object):
+    __slots__ = ['parents', 'jvps']
+    def __init__(self):
+        self.parents = [()]
+        self.jvps = [None]
+
+class LinearNode(Node):
+    __slots__ = ['program', 'id']
+    def __init__(self, value, fun, args, kwargs, parent_argnums, parents):
+        jvpmaker = get_jvpmaker(fun, parent_argnums)
+        program = self.program = parents[0].program
+        self.id = len(program.jvps)
+        program.parents.append([parent.id for parent in parents])
+        program.jvps.append(
+            lambda parent_gs: jvpmaker(parent_argnums, parent_gs, value, args, kwargs))
+
+    def initialize_root(self):
+        self.program = LinearProgram()
+        self.id = 0
+
+notrace_primitives[LinearNode] = notrace_primitives[JVPNode]
+
+# -------------------- batched forward mode --------------------
+
+def make_batched_jvp(fun, x):
+    """Like make_jvp, but the returned jvp takes a batch of tangents stacked
+    along a new leading axis and pushes them all forward in a single trace,
+    returning the output tangents stacked the same way."""
+    def jvp(G):
+        start_node = BatchedJVPNode.new_root(G)
+        end_value, end_node = trace(start_node, fun, x)
+        if end_node is None:
+            batch_size = len(vspace(x).batch_unstack(G))
+            end_vs = vspace(end_value)
+            return end_value, end_vs.batch_stack([end_vs.zeros()] * batch_size)
+        else:
+            return end_value, end_node.g
+    return jvp
+
+class BatchedJVPNode(Node):
+    __slots__ = ['g']
+    def __init__(self, value, fun, args, kwargs, parent_argnums, parents):
+        parent_gs = [parent.g for parent in parents]
+        jvpmaker = get_jvpmaker(fun, parent_argnums)
+        batched_jvpmaker = primitive_batched_jvps.get(fun)
+        if batched_jvpmaker:
+            self.g = batched_jvpmaker(parent_argnums, parent_gs, value, args, kwargs)
+        else:
+            unstacked_gs = [vspace(args[argnum]).batch_unstack(G)
+                            for argnum, G in zip(parent_argnums, parent_gs)]
+            self.g = vspace(value).batch_stack(
+                [jvpmaker(parent_argnums, gs, value, args, kwargs)
+                 for gs in zip(*unstacked_gs)])
+
+    def initialize_root(self, G):
+        self.g = G
+
+notrace_primitives[BatchedJVPNode] = notrace_primitives[JVPNode]
+
+primitive_batched_jvps = {}
+def defjvp_batched_argnums(fun, jvpmaker):
+    primitive_batched_jvps[fun] = jvpmaker
+
+def defjvp_batched(fun, *jvpfuns, **kwargs):
+    """Like defjvp, but each JVP maps a batch of tangents, stacked along a new
+    leading axis, to the batch of output tangents. Primitives without batched
+    JVPs are handled by looping over the batch."""
+    argnums = kwargs.get('argnums', count())
+    jvps_dict = dict(zip(argnums, jvpfuns))
+    def jvp_argnums(argnums, Gs, ans, args, kwargs):
+        return sum_outgrads(jvps_dict[argnum](G, ans, *args, **kwargs)
+                            for argnum, G in zip(argnums, Gs))
+    defjvp_batched_argnums(fun, jvp_argnums)
+
+def defjvp_batched_same(fun):
+    """Flags that the JVPs of `fun` already broadcast over a leading batch axis
+    of the tangents, so they can be used as its batched JVPs."""
+    defjvp_batched_argnums(fun, primitive_jvps[fun])
 
 # -------------------- vector behavior --------------------
 
@@ -195,6 +744,8 @@ class VSpace(object):
     def ones(self):           assert False, repr(self)
     def standard_basis(self): assert False, repr(self)
     def randn(self):          assert False, repr(self)
+    def batch_stack(self, xs):  assert False, repr(self)
+    def batch_unstack(self, x): assert False, repr(self)
 
     @primitive
     def mut_add(self, x_prev, x_new):
@@ -223,10 +774,8 @@ class VSpace(object):
 
     @classmethod
     def register(cls, value_type, vspace_maker=None):
-        if vspace_maker:
-            VSpace.mappings[value_type] = vspace_maker
-        else:
-            VSpace.mappings[value_type] = cls
+        with registry_lock:
+            VSpace.mappings[value_type] = vspace_maker or cls
 
 def vspace(value):
     try:
@@ -264,6 +813,9 @@ defvjp(func(VSpace.covector), None,
 defvjp(func(VSpace.scalar_mul), None,
        lambda ans, vs, x, a: lambda g: vs.covector(vs.scalar_mul(vs.covector(g), a)),
        lambda ans, vs, x, a: lambda g: vs.inner_prod(g, vs.covector(x)))
+defvjp_batched_same(sparse_add)
+defvjp_batched_same(func(VSpace.add))
+defvjp_batched_same(func(VSpace.mut_add))
 
 # -------------------- core forward mode grads --------------------
 
@@ -274,6 +826,9 @@ defjvp(func(VSpace.add),     None, identity_jvp, identity_jvp)
 defjvp(func(VSpace.scalar_mul), None, 'same', 'same')
 defjvp(func(VSpace.inner_prod), None, 'same', 'same')
 defjvp(func(VSpace.covector),   None, 'same')
+defjvp_batched_same(sparse_add)
+defjvp_batched_same(func(VSpace.mut_add))
+defjvp_batched_same(func(VSpace.add))
 
 # -------------------- deprecation warnings -----------------------
 
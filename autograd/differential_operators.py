@@ -5,15 +5,30 @@ from collections import OrderedDict
 from inspect import getargspec
 import warnings
 
-from .wrap_util import unary_to_nary
+from .wrap_util import unary_to_nary, wraps
 from .builtins import tuple as atuple
-from .core import make_vjp as _make_vjp, make_jvp as _make_jvp
-from .extend import primitive, defvjp_argnum, vspace
+from .core import (make_vjp as _make_vjp, make_jvp as _make_jvp,
+                   make_tape_vjp as _make_tape_vjp,
+                   make_batched_vjp as _make_batched_vjp,
+                   make_batched_jvp as _make_batched_jvp,
+                   linearize as _linearize,
+                   linear_transpose as _linear_transpose,
+                   record_saved as _record_saved,
+                   make_replay_vjp as _make_replay_vjp,
+                   JVPNotDefined)
+from .extend import primitive, defvjp_argnum, defvjp_argnums, vspace
+from .tracer import isbox, getval, find_top_boxed_args
+from .util import subvals
 
 import autograd.numpy as np
 
 make_vjp = unary_to_nary(_make_vjp)
 make_jvp = unary_to_nary(_make_jvp)
+make_tape_vjp = unary_to_nary(_make_tape_vjp)
+make_batched_vjp = unary_to_nary(_make_batched_vjp)
+make_batched_jvp = unary_to_nary(_make_batched_jvp)
+linearize = unary_to_nary(_linearize)
+linear_transpose = unary_to_nary(_linear_transpose)
 
 @unary_to_nary
 def grad(fun, x):
@@ -22,7 +37,7 @@ def grad(fun, x):
     positional argument number `argnum`. The returned function takes the same
     arguments as `fun`, but returns the gradient instead. The function `fun`
     should be scalar-valued. The gradient has the same type as the argument."""
-    vjp, ans = _make_vjp(fun, x)
+    vjp, ans = _make_vjp(fun, x, consume=True)
     if not vspace(ans).size == 1:
         raise TypeError("Grad only applies to real scalar-output functions. "
                         "Try jacobian, elementwise_grad or holomorphic_grad.")
@@ -30,7 +45,7 @@ def grad(fun, x):
 
 @unary_to_nary
 def elementwise_grad(fun, x):
-    vjp, ans = _make_vjp(fun, x)
+    vjp, ans = _make_vjp(fun, x, consume=True)
     if vspace(ans).iscomplex:
         raise TypeError("Elementwise_grad only applies to real-output functions.")
     return vjp(vspace(ans).ones())
@@ -40,7 +55,7 @@ def deriv(fun, x):
     return _make_jvp(fun, x)(vspace(x).ones())[1]
 
 @unary_to_nary
-def jacobian(fun, x):
+def jacobian(fun, x, mode='rev'):
     """
     Returns a function which computes the Jacobian of `fun` with respect to
     positional argument number `argnum`, which must be a scalar or array. Unlike
@@ -48,12 +63,42 @@ def jacobian(fun, x):
     take derivatives with respect to some argument types (like lists or dicts).
     If the input to `fun` has shape (in1, in2, ...) and the output has shape
     (out1, out2, ...) then the Jacobian has shape (out1, out2, ..., in1, in2, ...).
+
+    With mode='rev' the Jacobian is computed in one batched backward pass over
+    the output basis, and with mode='fwd' in one batched forward trace over the
+    input basis (see `jacobian_fwd`). mode='auto' first evaluates `fun`
+    without tracing, to get the size of its output, and then uses forward mode
+    if that is at least the size of the input (and every primitive has a
+    JVP), or else reverse mode.
     """
-    vjp, ans = _make_vjp(fun, x)
+    if mode not in ('auto', 'fwd', 'rev'):
+        raise ValueError("mode must be 'auto', 'fwd' or 'rev', not {}".format(mode))
+    if mode == 'auto':
+        mode = 'fwd' if vspace(fun(getval(x))).size >= vspace(x).size else 'rev'
+        if mode == 'fwd':
+            try:
+                return jacobian_fwd(fun)(x)
+            except JVPNotDefined:
+                pass
+    elif mode == 'fwd':
+        return jacobian_fwd(fun)(x)
+    vjp, ans = _make_batched_vjp(fun, x)
     ans_vspace = vspace(ans)
     jacobian_shape = ans_vspace.shape + vspace(x).shape
-    grads = map(vjp, ans_vspace.standard_basis())
-    return np.reshape(np.stack(grads), jacobian_shape)
+    grads = vjp(np.stack(list(ans_vspace.standard_basis())))
+    return np.reshape(grads, jacobian_shape)
+
+@unary_to_nary
+def jacobian_fwd(fun, x):
+    """
+    Like `jacobian`, but uses forward mode: the standard basis of the input
+    space is pushed through `fun` as one batch of tangents, in a single trace.
+    Cheaper than `jacobian` when the input is smaller than the output.
+    """
+    x_vspace = vspace(x)
+    ans, grads = _make_batched_jvp(fun, x)(np.stack(list(x_vspace.standard_basis())))
+    jacobian_shape = vspace(ans).shape + x_vspace.shape
+    return np.reshape(np.moveaxis(grads, 0, -1), jacobian_shape)
 
 @unary_to_nary
 def holomorphic_grad(fun, x):
@@ -68,9 +113,16 @@ def grad_named(fun, argname):
     return grad(fun, arg_index)
 
 @unary_to_nary
-def hessian(fun, x):
-    "Returns a function that computes the exact Hessian."
-    return jacobian(jacobian(fun))(x)
+def hessian(fun, x, mode='fwd'):
+    """Returns a function that computes the exact Hessian. By default this is
+    forward-over-reverse, falling back to reverse-over-reverse if some
+    primitive has no JVP. `mode` is passed to the outer `jacobian`."""
+    if mode == 'fwd':
+        try:
+            return jacobian_fwd(jacobian(fun, mode='rev'))(x)
+        except JVPNotDefined:
+            mode = 'rev'
+    return jacobian(jacobian(fun, mode='rev'), mode=mode)(x)
 
 @unary_to_nary
 def make_hvp(fun, x):
@@ -103,23 +155,36 @@ vector_jacobian_product = tensor_jacobian_product
 @unary_to_nary
 def make_jvp_reversemode(fun, x):
     """Builds a function for evaluating the Jacobian-vector product at a
-    point. Roughly 1.5x more FLOPs than forward-mode, plus memory requirements
-    that scale with the number of primitives applied in the evaluation of f, as
-    well as other overheads. See j-towns.github.io/2017/06/12/A-new-trick.html."""
-    vjp, y = _make_vjp(fun, x)
-    vjp_vjp, _ = _make_vjp(vjp, vspace(y).zeros())
-    return vjp_vjp  # vjp_vjp is just jvp by linearity
+    point. The primal is traced once with `linearize`, so each product only
+    runs the recorded JVP rules, not `fun`. If some primitive has no JVP, falls back
+    to transposing the VJP, which costs roughly 1.5x more FLOPs than
+    forward-mode. See j-towns.github.io/2017/06/12/A-new-trick.html."""
+    try:
+        return _linearize(fun, x)[1]
+    except JVPNotDefined:
+        vjp, y = _make_vjp(fun, x)
+        return _linear_transpose(vjp, y)
 
 # TODO(mattjj): update this function using make_jvp and const_graph
-def make_ggnvp(f, g=lambda x: 1./2*np.sum(x**2, axis=-1), f_argnum=0):
+def make_ggnvp(f, g=lambda x: 1./2*np.sum(x**2, axis=-1), f_argnum=0, batched=False):
     """Builds a function for evaluating generalized-Gauss-Newton-vector products
-    at a point. Slightly more expensive than mixed-mode."""
+    at a point. Slightly more expensive than mixed-mode. If `batched` is True,
+    the returned function takes a stack of vectors along a new leading axis
+    (so `x` must be an array), and computes all their products in one
+    backward pass through each graph."""
     @unary_to_nary
     def _make_ggnvp(f, x):
-        f_vjp, f_x = _make_vjp(f, x)
-        g_hvp, grad_g_x = _make_vjp(grad(g), f_x)
-        f_jvp, _ = _make_vjp(f_vjp, vspace(grad_g_x).zeros())
-        def ggnvp(v): return f_vjp(g_hvp(f_jvp(v)))
+        if not batched:
+            f_vjp, f_x = _make_vjp(f, x)
+            g_hvp, grad_g_x = _make_vjp(grad(g), f_x)
+            f_jvp, _ = _make_vjp(f_vjp, vspace(grad_g_x).zeros())
+            def ggnvp(v): return f_vjp(g_hvp(f_jvp(v)))
+            return ggnvp
+        f_vjp, f_x = _make_batched_vjp(f, x)
+        g_hvp, grad_g_x = _make_batched_vjp(grad(g), f_x)
+        f_jvp, _ = _make_batched_vjp(lambda u: f_vjp(u[None])[0],
+                                     vspace(grad_g_x).zeros())
+        def ggnvp(V): return f_vjp(g_hvp(f_jvp(V)))
         return ggnvp
     return _make_ggnvp(f, f_argnum)
 
@@ -127,7 +192,7 @@ def make_ggnvp(f, g=lambda x: 1./2*np.sum(x**2, axis=-1), f_argnum=0):
 def value_and_grad(fun, x):
     """Returns a function that returns both value and gradient. Suitable for use
     in scipy.optimize"""
-    vjp, ans = _make_vjp(fun, x)
+    vjp, ans = _make_vjp(fun, x, consume=True)
     if not vspace(ans).size == 1:
         raise TypeError("value_and_grad only applies to real scalar-output "
                         "functions. Try jacobian, elementwise_grad or "
@@ -138,7 +203,7 @@ def value_and_grad(fun, x):
 def grad_and_aux(fun, x):
     """Builds a function that returns the gradient of the first output and the
     (unmodified) second output of a function that returns two outputs."""
-    vjp, (ans, aux) = _make_vjp(lambda x: atuple(fun(x)), x)
+    vjp, (ans, aux) = _make_vjp(lambda x: atuple(fun(x)), x, consume=True)
     return vjp((vspace(ans).ones(), vspace(aux).zeros())), aux
 
 def multigrad_dict(fun):
@@ -184,14 +249,55 @@ def multigrad_dict(fun):
 
     return gradfun
 
-def checkpoint(fun):
+def checkpoint(fun, save=None):
     """Returns a checkpointed version of `fun`, where intermediate values
     computed during the forward pass of `fun` are discarded and then recomputed
     for the backward pass. Useful to save memory, effectively trading off time
     and memory. See e.g. arxiv.org/abs/1604.06174.
+
+    `save` selects primitive outputs to keep instead, so that only the others
+    are recomputed. It is either a collection of primitive names, such as
+    ('dot', 'einsum'), or a function of the primitive and the size of its
+    output in bytes returning whether to keep it. `fun` must then make the
+    same primitive calls on each evaluation.
     """
-    def wrapped_grad(argnum, ans, args, kwargs):
-        return make_vjp(fun, argnum)(*args, **kwargs)[0]
-    wrapped = primitive(fun)
-    defvjp_argnum(wrapped, wrapped_grad)
+    if save is None:
+        def wrapped_grad(argnum, ans, args, kwargs):
+            return make_vjp(fun, argnum)(*args, **kwargs)[0]
+        wrapped = primitive(fun)
+        defvjp_argnum(wrapped, wrapped_grad)
+        return wrapped
+
+    if not callable(save):
+        save_names = frozenset(save)
+        save = lambda primitive_fun, nbytes: primitive_fun.__name__ in save_names
+
+    @primitive
+    def checkpointed(saved, argnums, *args, **kwargs):
+        if not argnums:
+            return fun(*args, **kwargs)
+        ans, saved[:] = _record_saved(argnums_fun(fun, argnums, args, kwargs),
+                                      tuple(args[i] for i in argnums), save)
+        return ans
+
+    def checkpointed_vjp(argnums, ans, args, kwargs):
+        saved, saved_argnums, args = args[0], args[1], args[2:]
+        argnums = tuple(argnum - 2 for argnum in argnums)
+        if argnums != saved_argnums or any(isbox(arg) for arg in args):
+            saved = []  # Higher-order derivatives recompute everything
+        vjp, _ = _make_replay_vjp(argnums_fun(fun, argnums, args, kwargs),
+                                  tuple(args[i] for i in argnums), saved)
+        return vjp
+
+    defvjp_argnums(checkpointed, checkpointed_vjp)
+
+    @wraps(fun)
+    def wrapped(*args, **kwargs):
+        argnums = tuple(argnum for argnum, _ in find_top_boxed_args(args)[0])
+        return checkpointed([], argnums, *args, **kwargs)
     return wrapped
+
+def argnums_fun(fun, argnums, args, kwargs):
+    def unary_fun(x):
+        return fun(*subvals(args, zip(argnums, x)), **kwargs)
+    return unary_fun
@@ -1,5 +1,9 @@
 # Exposes API for extending autograd
 from .tracer import Box, primitive, register_notrace, notrace_primitive
-from .core import (SparseObject, VSpace, vspace, VJPNode, JVPNode,
-                   defvjp_argnums, defvjp_argnum, defvjp,
-                   defjvp_argnums, defjvp_argnum, defjvp, def_linear)
+from .core import (SparseObject, VSpace, vspace, VJPNode, JVPNode, TapeNode,
+                   BatchedVJPNode, defvjp_argnums, defvjp_argnum, defvjp,
+                   defvjp_batched_argnums, defvjp_batched, defvjp_batched_same,
+                   defjvp_argnums, defjvp_argnum, defjvp, def_linear,
+                   BatchedJVPNode, defjvp_batched_argnums, defjvp_batched,
+                   defjvp_batched_same, LinearNode,
+                   residual_placeholders)
@@ -1,2 +1,7 @@
 from .tracers import const_graph
 from .flatten import flatten
+from .compiled import compiled_grad, compiled_value_and_grad
+from .sparsity import sparse_jacobian, sparse_hessian
+from .data_parallel import data_parallel_grad
+from .loops import scan, fori_loop, checkpointed_loop
+from .ode import odeint
@@ -0,0 +1,424 @@
+"""Gradients computed by replaying a recorded program of primitive calls.
+
+The first call for a given input signature traces `fun` once and records every
+primitive call in a flat instruction list. Later calls with the same
+signature replay the forward and backward passes from that list, without
+creating Boxes or graph nodes. As with `const_graph`, the control flow of
+`fun` is frozen at trace time. Calls of non-differentiable primitives (like
+comparisons, floor or argmax) are recorded too: those returning arrays are
+recomputed on replay, and the others are recomputed and checked against the
+traced value, re-tracing `fun` if it changed.
+
+Before its first replay a program is optimized: calls of the same primitive on
+the same inputs and constants are merged, calls the output doesn't depend on
+are dropped, and chains of elementwise ufuncs, each feeding only the next, are
+fused into single instructions. `Program.report` says how many were removed."""
+from __future__ import absolute_import
+import warnings
+from collections import namedtuple, defaultdict
+import numpy as onp
+from autograd.tracer import (trace_stack, new_box, isbox, Node, box_type_mappings,
+                             notrace_primitives)
+from autograd.core import (primitive_vjps, needed_residuals, replace_unneeded,
+                           drop_unneeded, add_outgrads, vspace, VJPNode)
+from autograd.util import subvals
+from autograd.wrap_util import wrap_nary_f
+
+class ProgramNode(Node):
+    __slots__ = ['program', 'slot']
+    def __init__(self, value, fun, args, kwargs, parent_argnums, parents):
+        self.program = parents[0].program
+        self.slot = self.program.record(value, fun, args, kwargs, parent_argnums,
+                                        [parent.slot for parent in parents])
+
+    def initialize_root(self, program, slot):
+        self.program = program
+        self.slot = slot
+
+    @classmethod
+    def notrace(cls, f_wrapped, argvals, kwargs, argnums, parents, trace):
+        ans = f_wrapped(*argvals, **kwargs)
+        program = parents[0].program
+        slots = [parent.slot for parent in parents]
+        if type(ans) is onp.ndarray:
+            slot = program.record_forward(ans, f_wrapped, argvals, kwargs, argnums, slots)
+            return new_box(ans, trace, ProgramNode.new_root(program, slot))
+        program.record_guard(ans, f_wrapped, argvals, kwargs, argnums, slots)
+        return ans
+
+notrace_primitives[ProgramNode] = notrace_primitives[VJPNode]
+
+class GuardFailed(Exception):
+    pass
+
+class Guard(object):
+    """A call of a non-differentiable primitive whose result was used as a
+    constant by the trace. Replaying it raises GuardFailed if the result
+    differs."""
+    def __init__(self, fun, expected):
+        self.fun = fun
+        self.expected = expected
+
+    def __call__(self, *args, **kwargs):
+        ans = self.fun(*args, **kwargs)
+        if not same_value(ans, self.expected):
+            raise GuardFailed()
+        return ans
+
+def same_value(x, y):
+    if type(x) is not type(y):
+        return False
+    elif type(x) in (list, tuple):
+        return len(x) == len(y) and all(map(same_value, x, y))
+    elif type(x) is onp.ndarray:
+        return onp.array_equal(x, y)
+    return bool(x == y)
+
+class PartialVJP(object):
+    """The VJP maker of a call whose boxed arguments include outputs of
+    non-differentiable primitives. Those get None as their cotangent."""
+    def __init__(self, vjpmaker, argnums, differentiable):
+        self.vjpmaker = vjpmaker
+        self.argnums = tuple(argnum for argnum, d in zip(argnums, differentiable) if d)
+        self.differentiable = differentiable
+
+    def __call__(self, argnums, ans, args, kwargs):
+        vjp = self.vjpmaker(self.argnums, ans, args, kwargs)
+        def partial_vjp(g):
+            ingrads = iter(vjp(g))
+            return [next(ingrads) if d else None for d in self.differentiable]
+        return partial_vjp
+
+GraphReport = namedtuple('GraphReport', ['num_recorded', 'num_duplicates',
+                                         'num_dead', 'num_fused'])
+
+class Program(object):
+    """A flat list of primitive calls. Slots 0..num_inputs-1 hold the inputs
+    and instruction i writes its output to slot num_inputs + i."""
+    def __init__(self, num_inputs):
+        self.num_inputs = num_inputs
+        self.num_slots = num_inputs
+        self.instructions = []
+        self.output = None
+        self.constant = None
+        self.report = None
+        self.metadata = {}
+        self.kwarg_names = []
+        self.nondifferentiable = set()
+        self.guards = []
+
+    def record(self, value, fun, args, kwargs, argnums, parents):
+        differentiable = [parent not in self.nondifferentiable for parent in parents]
+        if not any(differentiable):
+            return self.record_forward(value, fun, args, kwargs, argnums, parents)
+        try:
+            vjpmaker = primitive_vjps[fun]
+        except KeyError:
+            fun_name = getattr(fun, '__name__', fun)
+            raise NotImplementedError("VJP of {} wrt argnums {} not defined"
+                                      .format(fun_name, argnums))
+        if not all(differentiable):
+            vjpmaker = PartialVJP(vjpmaker, argnums, differentiable)
+        return self.add(value, fun, args, kwargs, argnums, parents, vjpmaker)
+
+    def record_forward(self, value, fun, args, kwargs, argnums, parents):
+        """Records a call that is replayed but not differentiated."""
+        slot = self.add(value, fun, args, kwargs, argnums, parents, None)
+        self.nondifferentiable.add(slot)
+        return slot
+
+    def record_guard(self, value, fun, args, kwargs, argnums, parents):
+        slot = self.add(value, Guard(fun, value), args, kwargs, argnums, parents, None)
+        self.guards.append(slot)
+
+    def add(self, value, fun, args, kwargs, argnums, parents, vjpmaker):
+        slot = self.num_slots
+        self.metadata[slot] = (type(value), onp.shape(value), getattr(value, 'dtype', None))
+        args = subvals(args, [(argnum, None) for argnum in argnums])
+        self.instructions.append((slot, fun, args, kwargs, argnums, parents, vjpmaker))
+        self.num_slots += 1
+        return slot
+
+    def finalize(self, output):
+        num_recorded = len(self.instructions)
+        canonical = self.eliminate_common_subexpressions()
+        num_duplicates = num_recorded - len(self.instructions)
+        self.output = canonical.get(output, output)
+        live = set(self.guards) if output is None else {self.output} | set(self.guards)
+        instructions = []
+        for instruction in reversed(self.instructions):
+            if instruction[0] in live:
+                live.update(instruction[5])
+                instructions.append(instruction)
+        self.instructions = instructions[::-1]
+        num_live = len(self.instructions)
+        self.fuse_elementwise_chains()
+        self.report = GraphReport(num_recorded, num_duplicates,
+                                  num_recorded - num_duplicates - num_live,
+                                  num_live - len(self.instructions))
+        self.metadata = None
+
+    def eliminate_common_subexpressions(self):
+        """Merges instructions calling the same primitive on the same slots and
+        constants, rewriting their users to read the first one's slot. Returns
+        the mapping from removed slots to the slots that replace them."""
+        canonical, seen, instructions = {}, {}, []
+        for slot, fun, args, kwargs, argnums, parents, vjpmaker in self.instructions:
+            parents = [canonical.get(p, p) for p in parents]
+            key = (fun, tuple(zip(argnums, parents)),
+                   tuple(map(constant_key, args)), constant_key(kwargs))
+            if key in seen:
+                canonical[slot] = seen[key]
+            else:
+                seen[key] = slot
+                instructions.append((slot, fun, args, kwargs, argnums, parents, vjpmaker))
+        self.instructions = instructions
+        return canonical
+
+    def fuse_elementwise_chains(self):
+        """Replaces each chain of elementwise ufunc calls, where every call but
+        the last is used only by the next one, with a FusedChain instruction
+        in the position of its last call."""
+        uses = defaultdict(int, {self.output : 1})
+        for instruction in self.instructions:
+            for parent in instruction[5]:
+                uses[parent] += 1
+        chains, open_chains = {}, {}
+        for instruction in self.instructions:
+            slot, fun, _, kwargs, _, parents, vjpmaker = instruction
+            if not is_elementwise(fun, kwargs) or vjpmaker is None \
+               or type(vjpmaker) is PartialVJP:
+                continue
+            chain = next((open_chains.pop(p) for p in parents
+                          if p in open_chains and uses[p] == parents.count(p)), [])
+            chain.append(instruction)
+            chains[slot] = open_chains[slot] = chain
+        instructions = []
+        for instruction in self.instructions:
+            chain = chains.get(instruction[0])
+            if chain is None or len(chain) == 1:
+                instructions.append(instruction)
+            elif chain[-1] is instruction:
+                fused = FusedChain(chain, self.metadata)
+                num_inputs = len(fused.inputs)
+                instructions.append((instruction[0], fused, (None,) * num_inputs, {},
+                                     tuple(range(num_inputs)), fused.inputs,
+                                     fused.vjpmaker))
+        self.instructions = instructions
+
+    def forward(self, inputs):
+        vals = list(inputs) + [None] * (self.num_slots - self.num_inputs)
+        argvals_list = []
+        for slot, fun, args, kwargs, argnums, parents, _ in self.instructions:
+            argvals = subvals(args, zip(argnums, [vals[p] for p in parents]))
+            if type(fun) is FusedChain:
+                vals[slot], argvals = fun.forward(argvals)
+            else:
+                vals[slot] = fun(*argvals, **kwargs)
+            argvals_list.append(argvals)
+        return vals, argvals_list
+
+    def make_vjp(self, inputs):
+        """Replays the forward pass on `inputs` and returns the output together
+        with a function mapping an output cotangent to a list of input
+        cotangents (None for inputs the output doesn't depend on)."""
+        vals, argvals_list = self.forward(inputs)
+        if self.output is None:
+            return self.constant, lambda g: [None] * self.num_inputs
+        # Only keep the values that the VJPs were declared to use.
+        saved = [save_residuals(fun, argnums, vjpmaker, vals[slot], argvals)
+                 for (slot, fun, _, _, argnums, _, vjpmaker), argvals
+                 in zip(self.instructions, argvals_list)]
+        ans = vals[self.output]
+        del vals, argvals_list
+        def vjp(g):
+            outgrads = [None] * self.num_slots
+            outgrads[self.output] = (g, False)
+            for instruction, (ans, argvals) in zip(reversed(self.instructions),
+                                                   reversed(saved)):
+                slot, _, _, kwargs, argnums, parents, vjpmaker = instruction
+                outgrad = outgrads[slot]
+                if outgrad is None:
+                    continue
+                outgrads[slot] = None
+                ingrads = vjpmaker(argnums, ans, argvals, kwargs)(outgrad[0])
+                for parent, ingrad in zip(parents, ingrads):
+                    if ingrad is not None:
+                        outgrads[parent] = add_outgrads(outgrads[parent], ingrad)
+            return [outgrad and outgrad[0] for outgrad in outgrads[:self.num_inputs]]
+        return ans, vjp
+
+def constant_key(x):
+    # Unhashable constants (like arrays) only match the very same object,
+    # which the recorded instructions keep alive.
+    t = type(x)
+    if t in (list, tuple):
+        return (t,) + tuple(map(constant_key, x))
+    elif t is dict:
+        return (t,) + tuple((k, constant_key(x[k])) for k in sorted(x))
+    elif t is slice:
+        return (t, x.start, x.stop, x.step)
+    try:
+        hash(x)
+    except TypeError:
+        return (id(x),)
+    return (t, x)
+
+def save_residuals(fun, argnums, vjpmaker, ans, argvals):
+    if vjpmaker is None:
+        return None, None
+    elif type(fun) is FusedChain:
+        return None, argvals  # argvals are the residuals the chain saved
+    elif type(vjpmaker) is PartialVJP:
+        argnums = vjpmaker.argnums
+    return drop_unneeded(fun, argnums, ans, argvals)
+
+def is_elementwise(fun, kwargs):
+    raw_fun = getattr(fun, 'fun', None)
+    return not kwargs and isinstance(raw_fun, onp.ufunc) and raw_fun.nout == 1
+
+PREV = -1
+
+class FusedChain(object):
+    """A chain of elementwise ufunc calls, each taking the previous one's
+    output, run as one instruction with one combined VJP. A call writes its
+    output over the previous one's when neither VJP needs that value and the
+    shapes and dtypes match, so the chain allocates fewer temporaries."""
+    def __init__(self, instructions, metadata):
+        self.inputs = []
+        self.steps = []
+        prev, prev_needed = None, None
+        for slot, fun, args, _, argnums, parents, vjpmaker in instructions:
+            sources = []
+            for parent in parents:
+                if parent == prev:
+                    sources.append(PREV)
+                else:
+                    if parent not in self.inputs:
+                        self.inputs.append(parent)
+                    sources.append(self.inputs.index(parent))
+            needed = needed_residuals(fun, argnums)
+            in_place = (prev is not None and prev_needed is not None and needed is not None
+                        and 'ans' not in prev_needed
+                        and not any(argnum in needed for argnum, source
+                                    in zip(argnums, sources) if source == PREV)
+                        and metadata[prev] == metadata[slot]
+                        and metadata[slot][0] is onp.ndarray)
+            self.steps.append((fun, args, argnums, sources, vjpmaker, needed, in_place))
+            prev, prev_needed = slot, needed
+
+    def forward(self, inputs):
+        """Returns the chain's output and the residuals for `backward`."""
+        boxed = any(map(isbox, inputs))
+        ans, saved = None, []
+        for fun, args, argnums, sources, _, needed, in_place in self.steps:
+            argvals = subvals(args, [(argnum, ans if source == PREV else inputs[source])
+                                     for argnum, source in zip(argnums, sources)])
+            if in_place and not boxed:
+                ans = fun.fun(*argvals, out=ans)
+            else:
+                ans = fun(*argvals)
+            saved.append((ans, argvals) if needed is None
+                         else replace_unneeded(ans, argvals, needed))
+        return ans, saved
+
+    def backward(self, saved, g):
+        ingrads = [None] * len(self.inputs)
+        for (_, _, argnums, sources, vjpmaker, _, _), (ans, argvals) in zip(
+                reversed(self.steps), reversed(saved)):
+            outgrad = None
+            for source, ingrad in zip(sources, vjpmaker(argnums, ans, argvals, {})(g)):
+                if source == PREV:
+                    outgrad = add_outgrads(outgrad, ingrad)
+                else:
+                    ingrads[source] = add_outgrads(ingrads[source], ingrad)
+            g = outgrad and outgrad[0]
+        return [ingrad[0] for ingrad in ingrads]
+
+    def vjpmaker(self, argnums, ans, saved, kwargs):
+        return lambda g: self.backward(saved, g)
+
+def compile_program(fun, args, kwargs):
+    kwarg_names = input_kwarg_names(kwargs)
+    inputs = list(args) + [kwargs[name] for name in kwarg_names]
+    program = Program(len(inputs))
+    program.kwarg_names = kwarg_names
+    with trace_stack.new_trace() as t:
+        boxed_inputs = [new_box(x, t, ProgramNode.new_root(program, i))
+                        if type(x) in box_type_mappings else x
+                        for i, x in enumerate(inputs)]
+        boxed_kwargs = dict(kwargs, **dict(zip(kwarg_names, boxed_inputs[len(args):])))
+        end_box = fun(*boxed_inputs[:len(args)], **boxed_kwargs)
+        if isbox(end_box) and end_box._trace == t:
+            program.finalize(end_box._node.slot)
+        else:
+            warnings.warn("Output seems independent of input.")
+            program.constant = end_box
+            program.finalize(None)
+    return program
+
+def input_kwarg_names(kwargs):
+    # Keyword arguments of a differentiable type are inputs of the program
+    # (not differentiated), the others are part of its signature.
+    return sorted(name for name in kwargs if type(kwargs[name]) in box_type_mappings)
+
+def signature(x):
+    t = type(x)
+    if isbox(x):
+        return signature(x._value)
+    elif t in (list, tuple):
+        return (t,) + tuple(map(signature, x))
+    elif t is dict:
+        return (t,) + tuple((k, signature(x[k])) for k in sorted(x))
+    elif t in box_type_mappings:
+        return (t, getattr(x, 'shape', None), getattr(x, 'dtype', None))
+    else:
+        return (t, x)
+
+def compiled_value_and_grad(fun, argnum=0):
+    """Like `value_and_grad`, but traces `fun` only once per signature (types,
+    shapes and dtypes of the array arguments and values of the others) and
+    replays the recorded program on later calls. All arguments of a
+    differentiable type, positional or keyword, are inputs of the program, so
+    they may change between calls; `fun` must not close over values that
+    change. If a non-array result of a non-differentiable primitive changes,
+    `fun` is traced again. The recorded programs are kept in the `programs`
+    attribute of the returned function, keyed by signature."""
+    programs = {}
+    @wrap_nary_f(fun, compiled_value_and_grad, argnum)
+    def value_and_grad_fun(*args, **kwargs):
+        key = signature((args, kwargs))
+        program = programs.get(key)
+        if program is None:
+            program = programs[key] = compile_program(fun, args, kwargs)
+        inputs = list(args) + [kwargs[name] for name in program.kwarg_names]
+        try:
+            ans, vjp = program.make_vjp(inputs)
+        except GuardFailed:
+            program = programs[key] = compile_program(fun, args, kwargs)
+            ans, vjp = program.make_vjp(inputs)
+        if program.output is None:
+            grads = [None] * len(args)
+        else:
+            if not vspace(ans).size == 1:
+                raise TypeError("compiled_value_and_grad only applies to real "
+                                "scalar-output functions.")
+            grads = vjp(vspace(ans).ones())
+        def grad_wrt(i):
+            return grads[i] if grads[i] is not None else vspace(args[i]).zeros()
+        if isinstance(argnum, int):
+            return ans, grad_wrt(argnum)
+        else:
+            return ans, tuple(map(grad_wrt, argnum))
+    value_and_grad_fun.programs = programs
+    return value_and_grad_fun
+
+def compiled_grad(fun, argnum=0):
+    """Like `grad`, but replays a recorded program after the first call for
+    each input signature. See `compiled_value_and_grad`."""
+    value_and_grad_fun = compiled_value_and_grad(fun, argnum)
+    @wrap_nary_f(fun, compiled_grad, argnum)
+    def grad_fun(*args, **kwargs):
+        return value_and_grad_fun(*args, **kwargs)[1]
+    grad_fun.programs = value_and_grad_fun.programs
+    return grad_fun
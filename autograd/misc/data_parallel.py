@@ -0,0 +1,94 @@
+"""Gradients of losses summed over a minibatch, computed by splitting the data
+across a pool of worker processes. The flattened parameters and the per-worker
+gradients live in shared memory, so on each step only the data shards are sent
+to the workers."""
+from __future__ import absolute_import
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+import numpy as onp
+from autograd.differential_operators import grad
+from autograd.misc.flatten import flatten
+from autograd.util import subvals
+
+def data_parallel_grad(fun, shard_argnum=1, n_workers=None, argnum=0):
+    """Returns a function which computes the gradient of `fun` with respect to
+    positional argument number `argnum`, which may be any nesting of tuples,
+    lists and dicts of arrays. The arrays in positional argument(s)
+    `shard_argnum` are split along their first axis into `n_workers` shards
+    (by default one per CPU), the gradient for each shard is computed in a
+    worker process and the results are summed. So `fun` must be a sum over
+    the examples in its sharded arguments; terms that don't depend on the
+    data, such as a prior, should be added outside of it. Unless the
+    processes are forked, `fun` must be picklable. Pools are started on the
+    first call for each parameter structure; `.close()` shuts them down."""
+    shard_argnums = shard_argnum if isinstance(shard_argnum, tuple) else (shard_argnum,)
+    n_workers = n_workers or multiprocessing.cpu_count()
+    pools = {}
+
+    def data_parallel_grad_fun(*args, **kwargs):
+        flat_params, unflatten = flatten(args[argnum])
+        key = structure(args[argnum])
+        if key not in pools:
+            pools[key] = ShardPool(fun, argnum, args[argnum], n_workers)
+        pool = pools[key]
+        shards = zip(*[onp.array_split(args[i], n_workers) for i in shard_argnums])
+        shard_args = [subvals(args, [(argnum, None)] + list(zip(shard_argnums, shard)))
+                      for shard in shards if len(shard[0])]
+        return unflatten(pool.grad(flat_params, shard_args, kwargs))
+
+    def close():
+        for pool in pools.values():
+            pool.close()
+        pools.clear()
+
+    data_parallel_grad_fun.close = close
+    data_parallel_grad_fun.__name__ = "data_parallel_grad_of_{}".format(
+        getattr(fun, '__name__', '[unknown name]'))
+    return data_parallel_grad_fun
+
+def structure(value):
+    t = type(value)
+    if t in (list, tuple):
+        return (t, tuple(map(structure, value)))
+    elif t is dict:
+        return (t, tuple((k, structure(value[k])) for k in sorted(value)))
+    else:
+        return onp.shape(value)
+
+class ShardPool(object):
+    """Worker processes sharing a buffer for the flattened parameters and one
+    gradient buffer per worker."""
+    def __init__(self, fun, argnum, example_params, n_workers):
+        self.size = len(flatten(example_params)[0])
+        params_buffer = RawArray('d', self.size)
+        grads_buffer = RawArray('d', self.size * n_workers)
+        self.params = onp.frombuffer(params_buffer)
+        self.grads = onp.frombuffer(grads_buffer).reshape((n_workers, self.size))
+        self.pool = multiprocessing.Pool(
+            n_workers, initializer=init_worker,
+            initargs=(fun, argnum, example_params, params_buffer, grads_buffer))
+
+    def grad(self, flat_params, shard_args, kwargs):
+        self.params[:] = flat_params
+        tasks = [(i, args, kwargs) for i, args in enumerate(shard_args)]
+        self.pool.map(shard_grad, tasks, chunksize=1)
+        return onp.sum(self.grads[:len(tasks)], axis=0)
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+worker = {}
+def init_worker(fun, argnum, example_params, params_buffer, grads_buffer):
+    size = len(params_buffer)
+    worker['grad_fun'] = grad(fun, argnum)
+    worker['argnum'] = argnum
+    worker['unflatten'] = flatten(example_params)[1]
+    worker['params'] = onp.frombuffer(params_buffer)
+    worker['grads'] = onp.frombuffer(grads_buffer).reshape((-1, size))
+
+def shard_grad(task):
+    i, args, kwargs = task
+    params = worker['unflatten'](worker['params'])
+    g = worker['grad_fun'](*subvals(args, [(worker['argnum'], params)]), **kwargs)
+    worker['grads'][i] = flatten(g)[0]
@@ -1,23 +1,129 @@
-from autograd.extend import primitive, defvjp, vspace
+from autograd.extend import primitive, defvjp, defjvp, vspace
 from autograd.builtins import tuple
-from autograd import make_vjp
+from autograd.tracer import isbox
+from autograd import make_vjp, make_jvp, linearize
+from autograd.misc.flatten import flatten as flatten_container
+import numpy as onp
+import warnings
 
 @primitive
-def fixed_point(f, a, x0, distance, tol):
+def fixed_point(f, a, x0, distance, tol, solver='gmres'):
+    """Iterates `f(a)` from `x0` until `distance` between successive iterates
+    is at most `tol`. Derivatives wrt `a` use the implicit function theorem at
+    the fixed point x*: with J the Jacobian of `f(a)` at x*, the VJP solves
+    (I - J^T) u = g and the JVP solves (I - J) t = b. With solver='gmres' the
+    solve is matrix-free GMRES on J linearized once at x*, to relative residual
+    `tol`. With solver='iterate', or when computing higher derivatives, it
+    iterates u = J^T u + g like the forward map, re-tracing `f` on each step."""
     _f = f(a)
     x, x_prev = _f(x0), x0
     while distance(x, x_prev) > tol:
         x, x_prev = _f(x), x
     return x
 
-def fixed_point_vjp(ans, f, a, x0, distance, tol):
+def fixed_point_vjp(ans, f, a, x0, distance, tol, solver='gmres'):
+    vjp_a, _ = make_vjp(lambda x, y: f(x)(y))(a, ans)
+    if solver == 'gmres' and not (isbox(a) or isbox(ans)):
+        vjp_x, _ = make_vjp(f(a))(ans)
+        vs = vspace(ans)
+        def vjp(g):
+            if isbox(g):
+                return vjp_a(iterate_vjp(f, a, ans, g, distance, tol))
+            u = gmres(lambda u: vs.add(u, vs.scalar_mul(vjp_x(u), -1)), g, vs, tol)
+            return vjp_a(u)
+        return vjp
+    return lambda g: vjp_a(iterate_vjp(f, a, ans, g, distance, tol))
+
+def iterate_vjp(f, a, x_star, g, distance, tol):
     def rev_iter(params):
         a, x_star, x_star_bar = params
         vjp_x, _ = make_vjp(f(a))(x_star)
         vs = vspace(x_star)
         return lambda g: vs.add(vjp_x(g), x_star_bar)
-    vjp_a, _ = make_vjp(lambda x, y: f(x)(y))(a, ans)
-    return lambda g: vjp_a(fixed_point(rev_iter, tuple((a, ans, g)),
-                           vspace(x0).zeros(), distance, tol))
+    return fixed_point(rev_iter, tuple((a, x_star, g)), vspace(x_star).zeros(),
+                       distance, tol, solver='iterate')
 
 defvjp(fixed_point, None, fixed_point_vjp, None)
+
+def fixed_point_jvp(g, ans, f, a, x0, distance, tol, solver='gmres'):
+    _, b = make_jvp(lambda a: f(a)(ans))(a)(g)
+    if solver == 'gmres' and not any(map(isbox, (g, ans, a, b))):
+        vs = vspace(ans)
+        try:
+            _, jvp_x = linearize(f(a))(ans)
+        except NotImplementedError:
+            jvp_x = lambda t: make_jvp(f(a))(ans)(t)[1]
+        return gmres(lambda t: vs.add(t, vs.scalar_mul(jvp_x(t), -1)), b, vs, tol)
+    def fwd_iter(params):
+        a, x_star, x_star_dot = params
+        vs = vspace(x_star)
+        return lambda t: vs.add(make_jvp(f(a))(x_star)(t)[1], x_star_dot)
+    return fixed_point(fwd_iter, tuple((a, ans, b)), vspace(ans).zeros(),
+                       distance, tol, solver='iterate')
+
+defjvp(fixed_point, None, fixed_point_jvp, None)
+
+def gmres(matvec, b, vs, tol, restart=50, max_restarts=20):
+    """Solves matvec(x) = b for x in the vspace `vs` with restarted GMRES,
+    until the residual is at most `tol` times that of x = 0, warning if that
+    takes more than `max_restarts` restarts. The Krylov basis is kept as rows
+    of a flat numpy array. Complex values are solved for as pairs of real and
+    imaginary parts, since derivatives of non-holomorphic functions are only
+    linear over the reals."""
+    b_flat, unflatten = flatten(b)
+    if onp.iscomplexobj(b_flat):
+        n, unflatten_complex = len(b_flat), unflatten
+        to_real = lambda v: onp.concatenate([onp.real(v), onp.imag(v)])
+        unflatten = lambda v: unflatten_complex(v[:n] + 1j * v[n:])
+    else:
+        to_real = lambda v: v
+    flat_matvec = lambda v: to_real(flatten(matvec(unflatten(v)))[0])
+    return unflatten(flat_gmres(flat_matvec, to_real(b_flat), tol, restart, max_restarts))
+
+def flat_gmres(matvec, b, tol, restart, max_restarts):
+    restart = min(restart, len(b))
+    b_norm = onp.linalg.norm(b)
+    x = onp.zeros_like(b)
+    r = b
+    for _ in range(max_restarts):
+        beta = onp.linalg.norm(r)
+        if beta <= tol * b_norm:
+            break
+        V = onp.zeros((restart + 1, len(b)), dtype=b.dtype)
+        H = onp.zeros((restart + 1, restart))
+        cs, sn = onp.zeros(restart), onp.zeros(restart)
+        e = onp.zeros(restart + 1)
+        V[0], e[0] = r / beta, beta
+        for j in range(restart):
+            w = matvec(V[j])
+            for _ in range(2):  # Gram-Schmidt, repeated once for stability
+                h = onp.dot(V[:j + 1], w)
+                w = w - onp.dot(h, V[:j + 1])
+                H[:j + 1, j] += h
+            H[j + 1, j] = onp.linalg.norm(w)
+            if H[j + 1, j] > 0:
+                V[j + 1] = w / H[j + 1, j]
+            for i in range(j):  # Apply the previous Givens rotations
+                H[i, j], H[i + 1, j] = (cs[i] * H[i, j] + sn[i] * H[i + 1, j],
+                                        -sn[i] * H[i, j] + cs[i] * H[i + 1, j])
+            denom = onp.hypot(H[j, j], H[j + 1, j])
+            cs[j], sn[j] = H[j, j] / denom, H[j + 1, j] / denom
+            H[j, j], H[j + 1, j] = denom, 0.
+            e[j], e[j + 1] = cs[j] * e[j], -sn[j] * e[j]
+            if abs(e[j + 1]) <= tol * b_norm:
+                break
+        y = onp.linalg.solve(onp.triu(H[:j + 1, :j + 1]), e[:j + 1])
+        x = x + onp.dot(y, V[:j + 1])
+        r = b - matvec(x)
+    else:
+        residual = onp.linalg.norm(r) / b_norm if b_norm else 0.
+        if residual > tol:
+            warnings.warn("GMRES did not converge in {} restarts: relative residual "
+                          "{:.2e} > tol {:.2e}".format(max_restarts, residual, tol))
+    return x
+
+def flatten(value):
+    if type(value) in (float, onp.ndarray) or onp.isscalar(value):
+        shape = onp.shape(value)
+        return onp.ravel(value), lambda v: onp.reshape(v, shape)
+    return flatten_container(value)
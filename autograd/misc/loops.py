@@ -0,0 +1,218 @@
+"""Loops that are recorded as a single primitive. The graph of the loop body is
+only built one iteration at a time, inside the loop's VJP (or JVP), so a long
+loop costs one node in the outer graph instead of one per operation of every
+iteration."""
+from __future__ import absolute_import
+from autograd.extend import primitive, defvjp_argnums, defjvp_argnums, vspace
+from autograd.differential_operators import make_vjp, make_jvp
+from autograd.builtins import tuple as atuple, list as alist, dict as adict
+from autograd.tracer import getval
+import autograd.numpy as np
+import numpy as onp
+
+def scan(step, carry, xs=None, params=None, length=None, memory_budget=None):
+    """Computes `carry, y = step(carry, x)` for each `x` along the first axis of
+    the array `xs`, and returns the final carry and the `y`s stacked into an
+    array. If `params` is given, it is passed as a third argument,
+    `step(carry, x, params)`. The function can be differentiated with respect
+    to `carry`, `xs` and `params`, which may be any nesting of tuples, lists
+    and dicts of arrays; it shouldn't close over differentiated values. If
+    `xs` is None, `step` gets None for `x` and `length` gives the number of
+    iterations. By default the backward pass stores the carry going into every
+    iteration; `memory_budget` (in bytes) limits the stored carries, see
+    `checkpointed_loop`."""
+    if xs is not None:
+        length = len(xs)
+    elif length is None:
+        raise ValueError("scan needs either xs or length")
+    step_fun = step if params is not None else lambda c, x, p: step(c, x)
+    return scan_loop(step_fun, pack(carry), xs, pack(params), length, True,
+                     snaps=budget_snaps(memory_budget, carry))
+
+def checkpointed_loop(step, n_steps, memory_budget=None):
+    """Returns a function `loop(carry, params=None)` which computes
+    `carry = step(carry)` (or `step(carry, params)`) `n_steps` times, and can
+    be differentiated like `scan`. Its backward pass keeps at most
+    `memory_budget` bytes of carries besides the input one, placing them by
+    Griewank's binomial (revolve) schedule, which recomputes the fewest
+    iterations possible within the budget. After each backward pass,
+    `loop.stats` holds the peak number of stored carries ('checkpoints'),
+    their size ('peak_bytes') and how many times each iteration was run on
+    average, not counting the one traced for its VJP ('recompute_factor')."""
+    stats = {}
+    def loop(carry, params=None):
+        if params is not None:
+            step_fun = lambda c, x, p: (step(c, p), None)
+        else:
+            step_fun = lambda c, x, p: (step(c), None)
+        return scan_loop(step_fun, pack(carry), None, pack(params), n_steps, False,
+                         snaps=budget_snaps(memory_budget, carry), stats=stats)
+    loop.stats = stats
+    loop.__name__ = "checkpointed_loop_of_{}".format(getattr(step, '__name__', '[unknown name]'))
+    return loop
+
+def fori_loop(lower, upper, body, carry, params=None):
+    """Computes `carry = body(i, carry)` (or `body(i, carry, params)` if
+    `params` is given) for `i` in `range(lower, upper)` and returns the final
+    carry. Differentiable like `scan`."""
+    if params is not None:
+        step_fun = lambda c, i, p: (body(i, c, p), None)
+    else:
+        step_fun = lambda c, i, p: (body(i, c), None)
+    return scan_loop(step_fun, pack(carry), np.arange(lower, upper), pack(params),
+                     max(upper - lower, 0), False)
+
+@primitive
+def scan_loop(step, carry, xs, params, length, with_ys, snaps=None, stats=None):
+    ys = []
+    for i in range(length):
+        carry, y = step(carry, xs if xs is None else xs[i], params)
+        ys.append(y)
+    if with_ys and not length:
+        # Runs the step on a dummy x, only to find the shape of the ys
+        x = None if xs is None else onp.zeros(onp.shape(xs)[1:], onp.result_type(xs))
+        y = step(carry, x, params)[1]
+        return carry, onp.zeros((0,) + onp.shape(y), onp.result_type(y))
+    return (carry, np.stack(ys)) if with_ys else carry
+
+def advance(step, carry, xs, params, start, stop):
+    for i in range(start, stop):
+        carry = step(carry, xs if xs is None else xs[i], params)[0]
+    return carry
+
+def reversed_carries(step, carry, xs, params, length, snaps=None, stats=None):
+    """Yields the carry going into each iteration, last first. At most `snaps`
+    carries besides the first one are stored at a time (any number if None).
+    Implemented as a loop over a stack of checkpoints rather than recursion,
+    since the schedule can be as deep as the loop is long."""
+    snaps = length if snaps is None else snaps
+    carry_bytes = nbytes(carry) if stats is not None else None
+    checkpoints = [(0, carry)]
+    end, advanced, peak = length, 0, 0
+    while end > 0:
+        start, carry = checkpoints[-1]
+        free = snaps - len(checkpoints) + 1
+        if end - start > 1 and free > 0:
+            split = start + revolve_split(end - start, free + 1)
+            checkpoints.append((split, advance(step, carry, xs, params, start, split)))
+            advanced += split - start
+            peak = max(peak, len(checkpoints) - 1)
+        else:
+            yield end - 1, advance(step, carry, xs, params, start, end - 1)
+            advanced += end - 1 - start
+            end -= 1
+            if end == start:
+                checkpoints.pop()
+    if stats is not None:
+        stats['checkpoints'] = peak
+        stats['peak_bytes'] = peak * carry_bytes
+        stats['recompute_factor'] = float(length + advanced) / length if length else 0.
+
+def revolve_split(steps, snaps):
+    """Number of iterations to advance before storing the next checkpoint, when
+    reversing `steps` iterations with `snaps` checkpoints including the one at
+    the start. Follows Griewank and Walther's revolve (ACM TOMS 26, 2000)."""
+    reps, beta = 0, 1
+    while beta < steps:
+        reps += 1
+        beta = beta * (reps + snaps) // reps  # binomial(snaps + reps, reps)
+    bino1 = beta * reps // (snaps + reps)
+    bino2 = bino1 * snaps // (snaps + reps - 1) if snaps > 1 else 1
+    if snaps == 1:
+        bino3 = 0
+    else:
+        bino3 = bino2 * (snaps - 1) // (snaps + reps - 2) if snaps > 2 else 1
+    bino4 = bino2 * (reps - 1) // snaps
+    bino5 = bino3 * (snaps - 2) // reps if snaps > 2 else 0
+    if steps <= bino1 + bino3:
+        split = bino4
+    elif steps >= beta - bino5:
+        split = bino1
+    else:
+        split = steps - bino2 - bino3
+    return min(max(split, 1), steps - 1)
+
+def budget_snaps(memory_budget, carry):
+    if memory_budget is None:
+        return None
+    return int(memory_budget // max(nbytes(carry), 1))
+
+def nbytes(value):
+    value = getval(value)
+    t = type(value)
+    if t in (tuple, list):
+        return sum(map(nbytes, value))
+    elif t is dict:
+        return sum(map(nbytes, value.values()))
+    return onp.asarray(getval(value)).nbytes
+
+def diff_step(step, with_ys):
+    def step_out(carry, x, params):
+        out = step(carry, x, params)
+        return pack(out if with_ys else out[0])
+    return step_out
+
+def pack(value):
+    # Plain containers of boxes aren't boxes themselves, so the carry and params
+    # passed to scan_loop, and the values returned by the step, have to be
+    # rebuilt with autograd's containers.
+    t = type(value)
+    if t is tuple:
+        return atuple([pack(v) for v in value])
+    elif t is list:
+        return alist([pack(v) for v in value])
+    elif t is dict:
+        return adict({k: pack(v) for k, v in value.items()})
+    return value
+
+def scan_vjp(argnums, ans, args, kwargs):
+    step, carry, xs, params, length, with_ys = args
+    snaps, stats = kwargs.get('snaps'), kwargs.get('stats')
+    step_argnums = tuple(argnum - 1 for argnum in (1, 2, 3)
+                         if argnum == 1 or argnum in argnums)
+    step_vjp_maker = make_vjp(diff_step(step, with_ys), step_argnums)
+    def vjp(g):
+        g_carry, g_ys = g if with_ys else (g, None)
+        g_xs, g_params = [None] * length, vspace(params).zeros() if 3 in argnums else None
+        for i, carry_i in reversed_carries(step, carry, xs, params, length, snaps, stats):
+            step_vjp, _ = step_vjp_maker(carry_i, xs if xs is None else xs[i], params)
+            g_step = step_vjp((g_carry, g_ys[i]) if with_ys else g_carry)
+            g_carry = g_step[0]
+            if 2 in argnums:
+                g_xs[i] = g_step[1]
+            if 3 in argnums:
+                g_params = vspace(params).add(g_params, g_step[-1])
+        if 2 in argnums:
+            g_xs = np.stack(g_xs) if length else vspace(xs).zeros()
+        ingrads = {1: g_carry, 2: g_xs, 3: g_params}
+        return tuple(ingrads[argnum] for argnum in argnums)
+    return vjp
+
+defvjp_argnums(scan_loop, scan_vjp)
+
+def scan_jvp(argnums, gs, ans, args, kwargs):
+    step, carry, xs, params, length, with_ys = args
+    tangents = dict(zip(argnums, gs))
+    step_argnums = tuple(argnum - 1 for argnum in (1, 2, 3)
+                         if argnum == 1 or argnum in argnums)
+    step_jvp_maker = make_jvp(diff_step(step, with_ys), step_argnums)
+    g_carry = tangents[1] if 1 in argnums else vspace(carry).zeros()
+    g_ys = []
+    for i in range(length):
+        step_tangents = [g_carry]
+        if 2 in argnums:
+            step_tangents.append(tangents[2][i])
+        if 3 in argnums:
+            step_tangents.append(tangents[3])
+        step_jvp = step_jvp_maker(carry, xs if xs is None else xs[i], params)
+        out, g_out = step_jvp(tuple(step_tangents))
+        if with_ys:
+            (carry, _), (g_carry, g_y) = out, g_out
+            g_ys.append(g_y)
+        else:
+            carry, g_carry = out, g_out
+    if with_ys:
+        return g_carry, np.stack(g_ys) if length else vspace(ans[1]).zeros()
+    return g_carry
+
+defjvp_argnums(scan_loop, scan_jvp)
@@ -0,0 +1,161 @@
+"""ODE integration with gradients by the adjoint method. The backward pass
+integrates the adjoint ODE from the last time to the first, taking VJPs of the
+dynamics with `make_vjp` at each stage, so memory doesn't grow with the number
+of steps. See e.g. arxiv.org/abs/1806.07366."""
+from __future__ import absolute_import
+from __future__ import division
+from autograd.extend import primitive, defvjp_argnums
+from autograd.differential_operators import make_vjp
+from autograd.tracer import getval
+from autograd.misc.flatten import flatten
+from autograd.misc.loops import pack
+import autograd.numpy as np
+
+def odeint(f, y0, t, params=(), method='rk45', rtol=1e-6, atol=1e-9, step_size=None,
+           max_steps=10000):
+    """Integrates dy/dt = f(y, t, params) from y(t[0]) = y0, returning the
+    solution at each time in the sequence `t`, stacked along a new first axis.
+    `y0` is an array and `params` any nesting of tuples, lists and dicts of
+    arrays. With method='rk45' (Dormand-Prince) the step size is adapted to
+    keep the local error within `atol + rtol * |y|`; 'rk4' and 'euler' take
+    fixed steps of at most `step_size` between consecutive times in `t`. The
+    result can be differentiated with respect to `y0`, `t` and `params`.
+    With 'rk45', a RuntimeError is raised if more than `max_steps` steps are
+    taken between two consecutive times, the step size becomes negligible
+    compared to t, or the error estimate isn't finite, e.g. for stiff problems
+    or solutions that blow up."""
+    if method not in tableaus:
+        raise ValueError("method must be one of {}, not {}".format(sorted(tableaus), method))
+    if method != 'rk45' and step_size is None:
+        raise ValueError("method {} needs a step_size".format(method))
+    if type(t) in (list, tuple):
+        t = np.array(t, dtype=float)
+    return odeint_primitive(f, y0, t, pack(params), method, rtol, atol, step_size,
+                            max_steps)
+
+@primitive
+def odeint_primitive(f, y0, t, params, method, rtol, atol, step_size, max_steps):
+    shape = np.shape(y0)
+    flat_f = lambda y, t: np.ravel(f(np.reshape(y, shape), t, params))
+    y, h = np.ravel(y0), None
+    ys = [y]
+    for t0, t1 in zip(t[:-1], t[1:]):
+        y, h = integrate(flat_f, y, t0, t1, method, rtol, atol, step_size, max_steps, h)
+        ys.append(y)
+    return np.reshape(np.stack(ys), (len(t),) + shape)
+
+def odeint_vjp(argnums, ans, args, kwargs):
+    f, y0, t, params, method, rtol, atol, step_size, max_steps = args
+    shape, size = np.shape(y0), np.size(y0)
+    if type(params) in (tuple, list, dict) and not params:
+        flat_params, unflatten = np.zeros(0), lambda p: params
+    else:
+        flat_params, unflatten = flatten(params)
+    f_flat = lambda y, t: np.ravel(f(np.reshape(y, shape), t, params))
+    def dynamics_vjp(y, t, flat_params):
+        return make_vjp(lambda y, t, p: np.ravel(f(np.reshape(y, shape), t, unflatten(p))),
+                        (0, 1, 2))(y, t, flat_params)
+    def augmented(state, t):
+        # The state is (y, adjoint of y, adjoint of params), concatenated
+        y, a = state[:size], state[size:2 * size]
+        vjp, dy = dynamics_vjp(y, t, flat_params)
+        a_y, _, a_p = vjp(a)
+        return np.concatenate([dy, -a_y, -a_p])
+    def vjp(g):
+        ys, gs = np.reshape(ans, (len(t), size)), np.reshape(g, (len(t), size))
+        a, a_params, h = gs[-1], np.zeros(len(flat_params)), None
+        g_t = []
+        for i in range(len(t) - 1, 0, -1):
+            if 2 in argnums:
+                g_t.append(np.dot(gs[i], f_flat(ys[i], t[i])))
+            state = np.concatenate([ys[i], a, a_params])
+            state, h = integrate(augmented, state, t[i], t[i - 1], method,
+                                 rtol, atol, step_size, max_steps, h)
+            a, a_params = state[size:2 * size] + gs[i - 1], state[2 * size:]
+        ingrads = {1: np.reshape(a, shape), 3: unflatten(a_params)}
+        if 2 in argnums:
+            a_prop = a - gs[0]
+            g_t.append(-np.dot(a_prop, f_flat(ys[0], t[0])) if len(t) > 1 else 0.)
+            ingrads[2] = np.stack(g_t[::-1])
+        return tuple(ingrads[argnum] for argnum in argnums)
+    return vjp
+
+defvjp_argnums(odeint_primitive, odeint_vjp)
+
+def integrate(f, y, t0, t1, method, rtol, atol, step_size, max_steps, h=None):
+    """Integrates the flat ODE dy/dt = f(y, t) from `t0` to `t1`. Returns y(t1)
+    and, for 'rk45', the last step size tried, as a first guess for the next
+    interval."""
+    if t0 == t1:
+        return y, h
+    tableau = tableaus[method]
+    if method != 'rk45':
+        n_steps = max(int(np.ceil(abs(getval(t1) - getval(t0)) / step_size)), 1)
+        dt = (t1 - t0) / n_steps
+        for i in range(n_steps):
+            y = rk_step(f, y, t0 + i * dt, dt, tableau)[0]
+        return y, h
+    direction = np.sign(getval(t1) - getval(t0))
+    t, k = t0, f(y, t0)
+    h = initial_step(y, k, t1 - t0, rtol, atol) if h is None else abs(h)
+    n_steps = 0
+    while direction * (getval(t1) - getval(t)) > 0:
+        if n_steps == max_steps:
+            raise RuntimeError("odeint took {} steps from t={} without reaching t={}"
+                               .format(max_steps, getval(t0), getval(t1)))
+        n_steps += 1
+        dt = direction * min(h, abs(getval(t1) - getval(t)))
+        last = abs(dt) >= abs(getval(t1) - getval(t))
+        y_new, k_new, error = rk_step(f, y, t, dt, tableau, k)
+        scale = atol + rtol * np.maximum(np.abs(getval(y)), np.abs(getval(y_new)))
+        error_norm = np.sqrt(np.mean((getval(error) / scale) ** 2))
+        if not np.isfinite(error_norm):
+            raise RuntimeError("odeint got a non-finite error estimate at t={}"
+                               .format(getval(t)))
+        if error_norm <= 1:
+            t, y, k = (t1 if last else t + dt), y_new, k_new
+        factor = 5. if error_norm == 0 else 0.9 * error_norm ** -0.2
+        h = abs(dt) * min(5., max(0.2, factor))
+        if error_norm > 1 and h <= 10 * np.spacing(abs(getval(t))):
+            raise RuntimeError("odeint step size {} is negligible at t={}"
+                               .format(h, getval(t)))
+    return y, h
+
+def initial_step(y, k, span, rtol, atol):
+    scale = atol + rtol * np.abs(getval(y))
+    d0 = np.sqrt(np.mean((getval(y) / scale) ** 2))
+    d1 = np.sqrt(np.mean((getval(k) / scale) ** 2))
+    h = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01 * d0 / d1
+    return min(h, abs(getval(span)))
+
+def rk_step(f, y, t, dt, tableau, k0=None):
+    """One explicit Runge-Kutta step. Returns the new y, the derivative there
+    (for tableaus whose last stage is evaluated at the new y) and the error
+    estimate (for tableaus with an embedded lower-order solution)."""
+    c, A, b, b_error = tableau
+    ks = [f(y, t) if k0 is None else k0]
+    for c_i, A_i in zip(c[1:], A):
+        y_i = y + dt * sum(a_ij * k for a_ij, k in zip(A_i, ks) if a_ij)
+        ks.append(f(y_i, t + c_i * dt))
+    y_new = y + dt * sum(b_i * k for b_i, k in zip(b, ks) if b_i)
+    if b_error is None:
+        return y_new, None, None
+    error = dt * sum(e_i * k for e_i, k in zip(b_error, ks) if e_i)
+    return y_new, ks[-1], error
+
+# Each tableau is (c, A, b, b - b_embedded)
+dopri5_b = [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0]
+dopri5_b_embedded = [5179/57600, 0, 7571/16695, 393/640, -92097/339200, 187/2100, 1/40]
+tableaus = {
+    'euler': ([0], [], [1], None),
+    'rk4': ([0, 1/2, 1/2, 1], [[1/2], [0, 1/2], [0, 0, 1]], [1/6, 1/3, 1/3, 1/6], None),
+    'rk45': ([0, 1/5, 3/10, 4/5, 8/9, 1, 1],
+             [[1/5],
+              [3/40, 9/40],
+              [44/45, -56/15, 32/9],
+              [19372/6561, -25360/2187, 64448/6561, -212/729],
+              [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+              dopri5_b[:6]],
+             dopri5_b,
+             [b - b_embedded for b, b_embedded in zip(dopri5_b, dopri5_b_embedded)]),
+}
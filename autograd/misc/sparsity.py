@@ -0,0 +1,354 @@
+"""Jacobians and Hessians with a known or detected sparsity pattern. Columns
+that have no nonzero row in common get the same colour (Curtis-Powell-Reid)
+and their basis vectors are summed into a single seed, so the whole matrix is
+recovered from one batched JVP pass with a tangent per colour. When colouring
+the rows needs fewer colours, one batched VJP pass is used instead.
+
+The pattern is detected by tracing the function once with a DependencyNode,
+which tracks the set of input elements each element of each value depends
+on. Requires scipy."""
+from __future__ import absolute_import
+from functools import partial
+import numpy as onp
+import autograd.numpy as anp
+from autograd.numpy.numpy_wrapper import _array_from_scalar_or_array
+from autograd.numpy.numpy_vjps import untake
+from autograd.numpy.numpy_boxes import ArrayBox
+from autograd.tracer import trace, Node, notrace_primitives
+from autograd.core import (make_batched_jvp, make_batched_vjp, VJPNode, VSpace,
+                           SparseObject, sparse_add, JVPNotDefined)
+from autograd.differential_operators import grad
+from autograd.util import subval, func
+from autograd.wrap_util import wrap_nary_f
+
+# -------------------- dependency analysis --------------------
+
+class DependencyNode(Node):
+    """Holds `pattern`, a scipy.sparse matrix with a row per element of the
+    value and a column per element of the input, which is nonzero where the
+    value's element may depend on the input's. A primitive's output pattern
+    is its local pattern for each boxed argument (from `local_patterns`)
+    times that argument's pattern. Primitives without a local pattern are
+    taken to make each output element depend on every element of their
+    arguments, which can only add structural nonzeros, never miss one."""
+    __slots__ = ['pattern', 'analysis']
+    def __init__(self, value, fun, args, kwargs, parent_argnums, parents):
+        import scipy.sparse
+        self.analysis = parents[0].analysis
+        size = pattern_size(value)
+        pattern = None
+        for argnum, parent in zip(parent_argnums, parents):
+            rule = local_patterns.get(fun)
+            if rule is None and isinstance(getattr(fun, 'fun', None), onp.ufunc):
+                rule = elementwise
+            if rule is None or not (is_array_like(value) and is_array_like(args[argnum])):
+                union = (abs(parent.pattern).sum(axis=0) > 0).A.ravel()
+                term = scipy.sparse.csr_matrix(onp.ones((size, 1))).dot(
+                    scipy.sparse.csr_matrix(union.astype(float)))
+            else:
+                rows, cols = rule(argnum, value, args, kwargs, parent_argnums,
+                                  self.analysis)
+                local = scipy.sparse.csr_matrix(
+                    (onp.ones(len(rows)), (rows, cols)),
+                    shape=(size, parent.pattern.shape[0]))
+                term = local.dot(parent.pattern)
+            pattern = term if pattern is None else pattern + term
+        pattern.data[:] = 1.
+        self.pattern = pattern
+
+    def initialize_root(self, size):
+        import scipy.sparse
+        self.pattern = scipy.sparse.identity(size, format='csr')
+        self.analysis = {'point_dependent': False}
+
+    @classmethod
+    def notrace(cls, f_wrapped, argvals, kwargs, argnums, parents, trace):
+        # Values computed by non-differentiable primitives, like the index from
+        # an argmax, can change the structure from one input to the next.
+        if f_wrapped not in shape_functions:
+            parents[0].analysis['point_dependent'] = True
+        return f_wrapped(*argvals, **kwargs)
+
+notrace_primitives[DependencyNode] = notrace_primitives[VJPNode]
+shape_functions = {anp.shape, anp.ndim, anp.size, anp.result_type, anp.iscomplexobj,
+                   anp.isscalar, anp.zeros_like, anp.ones_like}
+
+def dependency_pattern(fun, x):
+    """Traces `fun` at `x` and returns the pattern of structural nonzeros of its
+    Jacobian, as a scipy.sparse matrix of shape (output size, input size),
+    and whether the pattern may be different at other points."""
+    import scipy.sparse
+    start_node = DependencyNode.new_root(onp.size(x))
+    end_value, end_node = trace(start_node, fun, x)
+    if end_node is None:
+        pattern = scipy.sparse.csr_matrix((pattern_size(end_value), onp.size(x)))
+    else:
+        pattern = end_node.pattern
+    return pattern, start_node.analysis['point_dependent']
+
+def is_array_like(x):
+    return type(x) is SparseObject or isinstance(x, (onp.ndarray, onp.generic,
+                                                     float, complex, int))
+
+def pattern_size(x):
+    if type(x) is SparseObject:
+        return x.vs.size
+    return onp.size(x) if is_array_like(x) else 1
+
+def shape_of(x):
+    return x.vs.shape if type(x) is SparseObject else onp.shape(x)
+
+# Each local pattern returns the rows (output elements) and columns (elements
+# of argument `argnum`) of its structural nonzeros, and may set the analysis's
+# 'point_dependent' flag if they depend on more than the arguments' shapes.
+
+def elementwise(argnum, ans, args, kwargs, argnums, analysis):
+    arg_shape, ans_shape = shape_of(args[argnum]), shape_of(ans)
+    ids = onp.arange(int(onp.prod(arg_shape))).reshape(arg_shape)
+    return onp.arange(int(onp.prod(ans_shape))), onp.broadcast_to(ids, ans_shape).ravel()
+
+def rearrangement(raw_fun, data_argnums, argnum, ans, args, kwargs, argnums, analysis):
+    """For primitives that only move, copy or drop elements (or fill in zeros):
+    the primitive is applied to element numbers, counting from 1, with the
+    other data arguments replaced by zeros."""
+    data_argnums = range(len(args))[data_argnums]
+    ids = onp.arange(1, onp.size(args[argnum]) + 1).reshape(onp.shape(args[argnum]))
+    id_args = [ids if i == argnum else onp.zeros(onp.shape(arg), dtype=int)
+               if i in data_argnums else arg for i, arg in enumerate(args)]
+    out = onp.asarray(raw_fun(*id_args, **kwargs)).ravel()
+    rows = onp.flatnonzero(out)
+    return rows, out[rows] - 1
+
+def reduction(argnum, ans, args, kwargs, argnums, analysis):
+    x = args[0]
+    axis = kwargs.get('axis', args[1] if len(args) > 1 else None)
+    return onp.ravel(output_ids(onp.shape(x), axis)), onp.arange(onp.size(x))
+
+def along_axis(default_axis, argnum, ans, args, kwargs, argnums, analysis):
+    """For primitives whose outputs depend on the whole line of the input along
+    `axis` (or on the whole input, if the axis is None), like cumsum."""
+    import scipy.sparse
+    x = args[0]
+    axis = kwargs.get('axis', args[1] if len(args) > 1 else default_axis)
+    lines = onp.ravel(output_ids(onp.shape(x), axis))
+    out_lines = lines if axis is not None else onp.zeros(onp.size(ans), dtype=int)
+    indicator = lambda l: scipy.sparse.csr_matrix(
+        (onp.ones(len(l)), (onp.arange(len(l)), l)), shape=(len(l), onp.size(x)))
+    local = indicator(out_lines).dot(indicator(lines).T).tocoo()
+    return local.row, local.col
+
+def output_ids(shape, axis):
+    """The index of the output element each input element is reduced into."""
+    if axis is None:
+        return onp.zeros(shape, dtype=int)
+    axes = [a % len(shape) for a in (axis if isinstance(axis, tuple) else (axis,))]
+    kept = tuple(1 if i in axes else n for i, n in enumerate(shape))
+    return onp.broadcast_to(onp.arange(int(onp.prod(kept))).reshape(kept), shape)
+
+def contraction(argnum, A, B, a_axes, b_axes, argnums, analysis):
+    """The local pattern of tensordot(A, B, (a_axes, b_axes)). The other
+    factor's zeros are structural if it doesn't depend on the input, but as
+    it may be a different array in the next call, so may the pattern."""
+    import scipy.sparse
+    a_axes = [a % A.ndim for a in a_axes]
+    b_axes = [b % B.ndim for b in b_axes]
+    a_free = [a for a in range(A.ndim) if a not in a_axes]
+    b_free = [b for b in range(B.ndim) if b not in b_axes]
+    a_ids = onp.transpose(onp.arange(A.size).reshape(A.shape), a_free + a_axes).ravel()
+    b_ids = onp.transpose(onp.arange(B.size).reshape(B.shape), b_axes + b_free).ravel()
+    k = int(onp.prod([A.shape[a] for a in a_axes]))
+    m, n = A.size // k if k else 0, B.size // k if k else 0
+    analysis['point_dependent'] |= len(argnums) < 2
+    if argnum == 0:
+        B2 = onp.ones((k, n)) if 1 in argnums else (onp.transpose(B, b_axes + b_free) != 0)
+        local = scipy.sparse.kron(scipy.sparse.identity(m),
+                                  scipy.sparse.csr_matrix(onp.reshape(B2, (k, n)).T)).tocoo()
+        return local.row, a_ids[local.col]
+    else:
+        A2 = onp.ones((m, k)) if 0 in argnums else (onp.transpose(A, a_free + a_axes) != 0)
+        local = scipy.sparse.kron(scipy.sparse.csr_matrix(onp.reshape(A2, (m, k))),
+                                  scipy.sparse.identity(n)).tocoo()
+        return local.row, b_ids[local.col]
+
+def tensordot_pattern(argnum, ans, args, kwargs, argnums, analysis):
+    A, B = onp.asarray(args[0]), onp.asarray(args[1])
+    axes = kwargs.get('axes', args[2] if len(args) > 2 else 2)
+    if type(axes) is int:
+        axes = (list(range(A.ndim - axes, A.ndim)), list(range(axes)))
+    a_axes, b_axes = axes
+    a_axes = [a_axes] if type(a_axes) is int else list(a_axes)
+    b_axes = [b_axes] if type(b_axes) is int else list(b_axes)
+    return contraction(argnum, A, B, a_axes, b_axes, argnums, analysis)
+
+def dot_pattern(argnum, ans, args, kwargs, argnums, analysis):
+    A, B = onp.asarray(args[0]), onp.asarray(args[1])
+    if A.ndim == 0 or B.ndim == 0:
+        return elementwise(argnum, ans, args, kwargs, argnums, analysis)
+    return contraction(argnum, A, B, [A.ndim - 1], [max(B.ndim - 2, 0)], argnums, analysis)
+
+def matmul_pattern(argnum, ans, args, kwargs, argnums, analysis):
+    if max(onp.ndim(args[0]), onp.ndim(args[1])) > 2:
+        return full_pattern(argnum, ans, args)
+    return dot_pattern(argnum, ans, args, kwargs, argnums, analysis)
+
+def inner_pattern(argnum, ans, args, kwargs, argnums, analysis):
+    A, B = onp.asarray(args[0]), onp.asarray(args[1])
+    if A.ndim == 0 or B.ndim == 0:
+        return elementwise(argnum, ans, args, kwargs, argnums, analysis)
+    return contraction(argnum, A, B, [A.ndim - 1], [B.ndim - 1], argnums, analysis)
+
+def outer_pattern(argnum, ans, args, kwargs, argnums, analysis):
+    m, n = onp.size(args[0]), onp.size(args[1])
+    rows = onp.arange(m * n)
+    return rows, (rows // n if argnum == 0 else rows % n)
+
+def full_pattern(argnum, ans, args):
+    out_size, arg_size = onp.size(ans), onp.size(args[argnum])
+    return onp.repeat(onp.arange(out_size), arg_size), onp.tile(onp.arange(arg_size), out_size)
+
+def untake_pattern(argnum, ans, args, kwargs, argnums, analysis):
+    x, idx, vs = args
+    positions = onp.arange(vs.size).reshape(vs.shape)[idx]
+    return onp.broadcast_to(positions, onp.shape(x)).ravel(), onp.arange(onp.size(x))
+
+def same_elements(argnum, ans, args, kwargs, argnums, analysis):
+    ids = onp.arange(pattern_size(ans))
+    return ids, ids
+
+local_patterns = {}
+for fun in [anp.where, anp.clip, anp.real, anp.imag, anp.angle, anp.nan_to_num,
+            anp.sinc, anp.real_if_close, func(VSpace.scalar_mul)]:
+    local_patterns[fun] = elementwise
+for fun in [anp.reshape, anp.ravel, anp.transpose, anp.swapaxes, anp.moveaxis,
+            anp.rollaxis, anp.expand_dims, anp.squeeze, anp.broadcast_to, anp.roll,
+            anp.flip, anp.fliplr, anp.flipud, anp.rot90, anp.repeat, anp.tile,
+            anp.diag, anp.diagonal, anp.triu, anp.tril, anp.atleast_1d, anp.copy,
+            func(ArrayBox.__getitem__)]:
+    local_patterns[fun] = partial(rearrangement, fun.fun, slice(0, 1))
+for fun, data_argnums in [(anp.concatenate_args, slice(1, None)),
+                          (anp.array_from_args, slice(2, None)),
+                          (_array_from_scalar_or_array, slice(2, 3))]:
+    local_patterns[fun] = partial(rearrangement, fun.fun, data_argnums)
+for fun in [anp.sum, anp.mean, anp.prod, anp.amax, anp.amin, anp.var, anp.std,
+            anp.nansum, anp.nanmean]:
+    local_patterns[fun] = reduction
+for fun in [anp.cumsum, anp.cumprod]:
+    local_patterns[fun] = partial(along_axis, None)
+for fun in [anp.sort, anp.partition]:
+    local_patterns[fun] = partial(along_axis, -1)
+local_patterns[anp.dot] = dot_pattern
+local_patterns[anp.tensordot] = tensordot_pattern
+local_patterns[anp.matmul] = matmul_pattern
+local_patterns[anp.inner] = inner_pattern
+local_patterns[anp.outer] = outer_pattern
+local_patterns[untake] = untake_pattern
+for fun in [sparse_add, func(VSpace.add), func(VSpace.mut_add), func(VSpace.covector)]:
+    local_patterns[fun] = same_elements
+
+# -------------------- colouring --------------------
+
+def color_columns(pattern):
+    """Greedy colouring of the columns of a scipy.sparse `pattern` such that
+    columns with a nonzero in a common row get different colours. Returns an
+    int array holding the colour of each column."""
+    csc, csr = pattern.tocsc(), pattern.tocsr()
+    colors = onp.full(pattern.shape[1], -1, dtype=int)
+    # Colouring the densest columns first tends to need fewer colours.
+    for j in onp.argsort(-onp.diff(csc.indptr), kind='mergesort'):
+        rows = csc.indices[csc.indptr[j]:csc.indptr[j+1]]
+        neighbors = [csr.indices[csr.indptr[i]:csr.indptr[i+1]] for i in rows]
+        used = set(colors[onp.concatenate(neighbors)]) if neighbors else set()
+        color = 0
+        while color in used:
+            color += 1
+        colors[j] = color
+    return colors
+
+def seed_matrix(colors):
+    seeds = onp.zeros((onp.max(colors) + 1 if len(colors) else 0, len(colors)))
+    seeds[colors, onp.arange(len(colors))] = 1.
+    return seeds
+
+class SparsityPattern(object):
+    """The structural nonzeros of a Jacobian of a function from arrays of
+    shape `in_shape`, flattened to a matrix of shape (out size, in size),
+    together with the colourings used to compress it."""
+    def __init__(self, sparsity, in_shape):
+        import scipy.sparse
+        if not scipy.sparse.issparse(sparsity):
+            sparsity = onp.reshape(onp.asarray(sparsity) != 0,
+                                   (-1, int(onp.prod(in_shape))))
+        pattern = scipy.sparse.coo_matrix(sparsity)
+        self.shape = pattern.shape
+        self.in_shape = in_shape
+        self.rows, self.cols = pattern.row, pattern.col
+        self.col_colors = color_columns(pattern)
+        self.row_colors = color_columns(pattern.T)
+        self.num_colors = {'fwd': len(set(self.col_colors)),
+                           'rev': len(set(self.row_colors))}
+
+    def evaluate(self, fun, x):
+        """Returns the Jacobian of `fun` at `x` as a scipy.sparse.csr_matrix."""
+        import scipy.sparse
+        if self.num_colors['fwd'] <= self.num_colors['rev']:
+            try:
+                data = self.evaluate_fwd(fun, x)
+            except JVPNotDefined:
+                data = self.evaluate_rev(fun, x)
+        else:
+            data = self.evaluate_rev(fun, x)
+        return scipy.sparse.csr_matrix((data, (self.rows, self.cols)), shape=self.shape)
+
+    def evaluate_fwd(self, fun, x):
+        seeds = seed_matrix(self.col_colors)
+        seeds = onp.reshape(seeds, seeds.shape[:1] + self.in_shape)
+        _, compressed = make_batched_jvp(fun, x)(seeds)
+        compressed = onp.reshape(compressed, (len(seeds), -1))
+        return compressed[self.col_colors[self.cols], self.rows]
+
+    def evaluate_rev(self, fun, x):
+        vjp, ans = make_batched_vjp(fun, x)
+        seeds = seed_matrix(self.row_colors)
+        seeds = onp.reshape(seeds, seeds.shape[:1] + onp.shape(ans))
+        compressed = onp.reshape(vjp(seeds), (len(seeds), -1))
+        return compressed[self.row_colors[self.rows], self.cols]
+
+def sparse_jacobian(fun, argnum=0, sparsity=None):
+    """Returns a function which computes the Jacobian of `fun` with respect to
+    positional argument number `argnum` as a scipy.sparse matrix of shape
+    (output size, input size), with the output and input flattened.
+    `sparsity` is the pattern of structural nonzeros, as a dense or
+    scipy.sparse matrix of that shape. If it is None, the pattern is detected
+    with `dependency_pattern`, and reused for later inputs of the same shape
+    unless the trace held operations whose structure depends on values."""
+    patterns = {}
+    @wrap_nary_f(fun, sparse_jacobian, argnum)
+    def sparse_jacobian_fun(*args, **kwargs):
+        unary_fun = lambda x: fun(*subval(args, argnum, x), **kwargs)
+        x = args[argnum]
+        return get_pattern(patterns, unary_fun, x, sparsity).evaluate(unary_fun, x)
+    return sparse_jacobian_fun
+
+def sparse_hessian(fun, argnum=0, sparsity=None):
+    """Like `sparse_jacobian`, but returns the Hessian of the scalar-output
+    function `fun`, computed as the sparse Jacobian of its gradient."""
+    patterns = {}
+    @wrap_nary_f(fun, sparse_hessian, argnum)
+    def sparse_hessian_fun(*args, **kwargs):
+        unary_fun = lambda x: fun(*subval(args, argnum, x), **kwargs)
+        x = args[argnum]
+        return get_pattern(patterns, grad(unary_fun), x, sparsity).evaluate(
+            grad(unary_fun), x)
+    return sparse_hessian_fun
+
+def get_pattern(patterns, fun, x, sparsity):
+    in_shape = onp.shape(x)
+    if in_shape in patterns:
+        return patterns[in_shape]
+    point_dependent = False
+    if sparsity is None:
+        sparsity, point_dependent = dependency_pattern(fun, x)
+    pattern = SparsityPattern(sparsity, in_shape)
+    if not point_dependent:
+        patterns[in_shape] = pattern
+    return pattern
@@ -25,7 +25,7 @@ defvjp(slogdet, lambda ans, x: lambda g: add2d(g[1]) * T(inv(x)))
 def grad_inv(ans, x):
     dot = anp.dot if ans.ndim == 2 else partial(anp.einsum, '...ij,...jk->...ik')
     return lambda g: -dot(dot(T(ans), g), T(ans))
-defvjp(inv, grad_inv)
+defvjp(inv, grad_inv, residuals=[('ans',)])
 
 def grad_solve(argnum, ans, a, b):
     updim = lambda x: x if x.ndim == a.ndim else x[...,None]
@@ -34,7 +34,7 @@ def grad_solve(argnum, ans, a, b):
         return lambda g: -dot(updim(solve(T(a), g)), T(updim(ans)))
     else:
         return lambda g: solve(T(a), g)
-defvjp(solve, partial(grad_solve, 0), partial(grad_solve, 1))
+defvjp(solve, partial(grad_solve, 0), partial(grad_solve, 1), residuals=[(0, 'ans'), (0,)])
 
 def grad_norm(ans, x, ord=None, axis=None):
     def check_implemented():
@@ -122,7 +122,7 @@ def grad_cholesky(L, A):
         S = conjugate_solve(L, phi(anp.einsum('...ki,...kj->...ij', L, g)))
         return (S + T(S)) / 2.
     return vjp
-defvjp(cholesky, grad_cholesky)
+defvjp(cholesky, grad_cholesky, residuals=[('ans',)])
 
 def grad_svd(usv_, a, full_matrices=True, compute_uv=True):
     def vjp(g):
@@ -1,10 +1,15 @@
+from functools import partial
+import numpy as onp
 from . import numpy_wrapper as anp
 from .numpy_vjps import (untake, balanced_eq, match_complex, replace_zero,
                          dot_adjoint_0, dot_adjoint_1, tensordot_adjoint_0,
-                         tensordot_adjoint_1, nograd_functions)
+                         tensordot_adjoint_1, nograd_functions, batch_axis,
+                         getitem_batched, untake_batched_f)
 from autograd.extend import (defjvp, defjvp_argnum, def_linear, vspace, JVPNode,
-                             register_notrace)
-from ..util import func
+                             register_notrace, defjvp_batched,
+                             defjvp_batched_argnums, defjvp_batched_same)
+from autograd.core import primitive_jvps
+from ..util import func, subval
 from .numpy_boxes import ArrayBox
 
 for fun in nograd_functions:
@@ -239,3 +244,140 @@ def broadcast(x, target):
     if target_iscomplex and not anp.iscomplexobj(x):
         x = x + 0j  # TODO(mattjj): this might promote the dtype
     return x
+
+# ----- Batched JVPs -----
+# These act on a batch of tangents stacked along a new leading axis. See
+# defjvp_batched. Primitives not listed here are looped over the batch.
+
+def pad_batched(G, ndim):
+    """Inserts axes after the batch axis so that G broadcasts against
+    values with `ndim` dimensions."""
+    shape = anp.shape(G)
+    if len(shape) - 1 < ndim:
+        G = anp.reshape(G, shape[:1] + (1,) * (ndim - len(shape) + 1) + shape[1:])
+    return G
+
+def broadcast_batched(G, target):
+    target_shape, target_ndim, target_dtype, _ = anp.metadata(target)
+    G = pad_batched(G, target_ndim)
+    if anp.shape(G)[1:] == target_shape:
+        return G
+    return G + onp.zeros(anp.shape(G)[:1] + target_shape, target_dtype)
+
+def defjvp_batched_ufunc(fun):
+    # Rules built from broadcasting ops work once the tangents are padded.
+    jvp_argnums = primitive_jvps[fun]
+    def batched_jvp_argnums(argnums, Gs, ans, args, kwargs):
+        Gs = [pad_batched(G, anp.ndim(ans)) for G in Gs]
+        return broadcast_batched(jvp_argnums(argnums, Gs, ans, args, kwargs), ans)
+    defjvp_batched_argnums(fun, batched_jvp_argnums)
+
+def loop_batched(jvp):
+    return lambda G, ans, *args, **kwargs: anp.stack([jvp(g, ans, *args, **kwargs) for g in G])
+
+for fun in [anp.nan_to_num, anp.negative, anp.rad2deg, anp.degrees, anp.deg2rad,
+            anp.radians, anp.abs, anp.fabs, anp.absolute, anp.reciprocal, anp.exp,
+            anp.exp2, anp.expm1, anp.log, anp.log2, anp.log10, anp.log1p, anp.sin,
+            anp.cos, anp.tan, anp.arcsin, anp.arccos, anp.arctan, anp.sinh, anp.cosh,
+            anp.tanh, anp.arcsinh, anp.arccosh, anp.arctanh, anp.square, anp.sqrt,
+            anp.sinc, anp.real_if_close, anp.real, anp.imag, anp.conj, anp.angle]:
+    defjvp_batched_same(fun)
+
+for fun in [anp.multiply, anp.divide, anp.true_divide, anp.maximum, anp.minimum,
+            anp.fmax, anp.fmin, anp.logaddexp, anp.logaddexp2, anp.power, anp.arctan2]:
+    defjvp_batched_ufunc(fun)
+
+defjvp_batched(anp.add,      lambda G, ans, x, y : broadcast_batched(G, ans),
+                             lambda G, ans, x, y : broadcast_batched(G, ans))
+defjvp_batched(anp.subtract, lambda G, ans, x, y : broadcast_batched(G, ans),
+                             lambda G, ans, x, y : broadcast_batched(-G, ans))
+
+def fwd_grad_reshape_batched(G, ans, order=None):
+    if order not in (None, 'C'):
+        return loop_batched(lambda g, ans: anp.reshape(g, anp.shape(ans), order=order))(G, ans)
+    return anp.reshape(G, anp.shape(G)[:1] + anp.shape(ans))
+defjvp_batched(anp.reshape,     lambda G, ans, x, shape, order=None : fwd_grad_reshape_batched(G, ans, order))
+defjvp_batched(anp.ravel,       lambda G, ans, x, order=None        : fwd_grad_reshape_batched(G, ans, order))
+defjvp_batched(anp.expand_dims, lambda G, ans, x, axis              : fwd_grad_reshape_batched(G, ans))
+defjvp_batched(anp.squeeze,     lambda G, ans, x, axis=None         : fwd_grad_reshape_batched(G, ans))
+
+def fwd_grad_transpose_batched(G, ans, x, axes=None):
+    if axes is None:
+        axes = range(anp.ndim(x))[::-1]
+    return anp.transpose(G, (0,) + tuple(onp.array(axes) % anp.ndim(x) + 1))
+defjvp_batched(anp.transpose, fwd_grad_transpose_batched)
+
+defjvp_batched(anp.sum,  lambda G, ans, x, axis=None, keepdims=False, dtype=None:
+               anp.sum(G, axis=batch_axis(axis, anp.ndim(x)), keepdims=keepdims, dtype=dtype))
+defjvp_batched(anp.mean, lambda G, ans, x, axis=None, keepdims=False:
+               anp.mean(G, axis=batch_axis(axis, anp.ndim(x)), keepdims=keepdims))
+
+def fwd_grad_tensordot_batched(argnum, G, ans, A, B, axes=2):
+    if type(axes) is not int:
+        jvp = lambda g, ans: anp.tensordot(*subval((A, B), argnum, g), axes=axes)
+        return loop_batched(jvp)(G, ans)
+    elif argnum == 0:
+        return anp.tensordot(G, B, axes)
+    else:
+        return anp.moveaxis(anp.tensordot(A, anp.moveaxis(G, 0, -1), axes), -1, 0)
+defjvp_batched(anp.tensordot, partial(fwd_grad_tensordot_batched, 0),
+                              partial(fwd_grad_tensordot_batched, 1))
+
+def fwd_grad_dot_batched(argnum, G, ans, A, B):
+    if anp.ndim(A) == 0 or anp.ndim(B) not in (1, 2):
+        jvp = lambda g, ans: anp.dot(*subval((A, B), argnum, g))
+        return loop_batched(jvp)(G, ans)
+    # Here dot(A, B) is tensordot(A, B, 1)
+    return fwd_grad_tensordot_batched(argnum, G, ans, A, B, 1)
+defjvp_batched(anp.dot, partial(fwd_grad_dot_batched, 0),
+                        partial(fwd_grad_dot_batched, 1))
+
+defjvp_batched(func(ArrayBox.__getitem__), lambda G, ans, A, idx: getitem_batched(G, idx))
+defjvp_batched(untake, lambda G, ans, x, idx, vs: untake_batched_f(G, idx, vs.shape, vs.dtype))
+def fwd_grad_array_from_args_batched(argnums, Gs, ans, args, kwargs):
+    Gs = dict(zip(argnums, Gs))
+    batch_shape = anp.shape(Gs[argnums[0]])[:1]
+    elts = [Gs[argnum] if argnum in Gs else
+            onp.zeros(batch_shape + anp.shape(args[argnum]), anp.result_type(ans))
+            for argnum in range(2, len(args))]
+    return anp.stack(elts, axis=1)
+defjvp_batched_argnums(anp.array_from_args, fwd_grad_array_from_args_batched)
+
+# The adjoints appear when differentiating forward-over-reverse. Batching over
+# the cotangent G is expressed through the tensordot adjoints, whose own
+# derivatives stay valid for the batched shapes.
+def loop_linear_batched(fun, argnum):
+    return loop_batched(lambda g, ans, *args: fun(*subval(args, argnum, g)))
+
+def fwd_grad_dot_adjoint_0_batched(G_t, ans, B, G, A_meta, B_meta):
+    _, A_ndim, _, _ = A_meta
+    _, B_ndim, _, _ = B_meta
+    if A_ndim == 0 or B_ndim not in (1, 2):
+        return loop_linear_batched(dot_adjoint_0, 1)(G_t, ans, B, G, A_meta, B_meta)
+    return tensordot_adjoint_0(B, G_t, 1, A_ndim + 1, B_ndim)
+
+def fwd_grad_dot_adjoint_1_batched(G_t, ans, A, G, A_meta, B_meta):
+    _, A_ndim, _, _ = A_meta
+    _, B_ndim, _, _ = B_meta
+    if A_ndim == 0 or B_ndim not in (1, 2):
+        return loop_linear_batched(dot_adjoint_1, 1)(G_t, ans, A, G, A_meta, B_meta)
+    return anp.moveaxis(tensordot_adjoint_1(
+        A, anp.moveaxis(G_t, 0, -1), 1, A_ndim, B_ndim + 1), -1, 0)
+
+def fwd_grad_tensordot_adjoint_0_batched(G_t, ans, B, G, axes, A_ndim, B_ndim):
+    if type(axes) is not int:
+        return loop_linear_batched(tensordot_adjoint_0, 1)(G_t, ans, B, G, axes, A_ndim, B_ndim)
+    return tensordot_adjoint_0(B, G_t, axes, A_ndim + 1, B_ndim)
+
+def fwd_grad_tensordot_adjoint_1_batched(G_t, ans, A, G, axes, A_ndim, B_ndim):
+    if type(axes) is not int:
+        return loop_linear_batched(tensordot_adjoint_1, 1)(G_t, ans, A, G, axes, A_ndim, B_ndim)
+    return anp.moveaxis(tensordot_adjoint_1(
+        A, anp.moveaxis(G_t, 0, -1), axes, A_ndim, B_ndim + 1), -1, 0)
+
+defjvp_batched(dot_adjoint_0, loop_linear_batched(dot_adjoint_0, 0), fwd_grad_dot_adjoint_0_batched)
+defjvp_batched(dot_adjoint_1, loop_linear_batched(dot_adjoint_1, 0), fwd_grad_dot_adjoint_1_batched)
+defjvp_batched(tensordot_adjoint_0, loop_linear_batched(tensordot_adjoint_0, 0),
+               fwd_grad_tensordot_adjoint_0_batched)
+defjvp_batched(tensordot_adjoint_1, loop_linear_batched(tensordot_adjoint_1, 0),
+               fwd_grad_tensordot_adjoint_1_batched)
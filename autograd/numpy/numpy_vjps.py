@@ -6,7 +6,9 @@ from ..util import func
 from . import numpy_wrapper as anp
 from .numpy_boxes import ArrayBox
 from autograd.extend import (primitive, vspace, defvjp, defvjp_argnum,
-                             SparseObject, VJPNode, register_notrace)
+                             defvjp_batched, defvjp_batched_argnums,
+                             defvjp_batched_same, SparseObject, VJPNode,
+                             register_notrace)
 
 # ----- Non-differentiable functions -----
 
@@ -30,13 +32,17 @@ defvjp(anp.nan_to_num, lambda ans, x: lambda g: anp.where(anp.isfinite(x), g, 0.
 # ----- Binary ufuncs -----
 
 defvjp(anp.add,         lambda ans, x, y : unbroadcast_f(x, lambda g: g),
-                        lambda ans, x, y : unbroadcast_f(y, lambda g: g))
+                        lambda ans, x, y : unbroadcast_f(y, lambda g: g),
+       residuals=[(), ()])
 defvjp(anp.multiply,    lambda ans, x, y : unbroadcast_f(x, lambda g: y * g),
-                        lambda ans, x, y : unbroadcast_f(y, lambda g: x * g))
+                        lambda ans, x, y : unbroadcast_f(y, lambda g: x * g),
+       residuals=[(1,), (0,)])
 defvjp(anp.subtract,    lambda ans, x, y : unbroadcast_f(x, lambda g: g),
-                        lambda ans, x, y : unbroadcast_f(y, lambda g: -g))
+                        lambda ans, x, y : unbroadcast_f(y, lambda g: -g),
+       residuals=[(), ()])
 defvjp(anp.divide,      lambda ans, x, y : unbroadcast_f(x, lambda g:   g / y),
-                        lambda ans, x, y : unbroadcast_f(y, lambda g: - g * x / y**2))
+                        lambda ans, x, y : unbroadcast_f(y, lambda g: - g * x / y**2),
+       residuals=[(1,), (0, 1)])
 defvjp(anp.maximum,     lambda ans, x, y : unbroadcast_f(x, lambda g: g * balanced_eq(x, ans, y)),
                         lambda ans, x, y : unbroadcast_f(y, lambda g: g * balanced_eq(y, ans, x)))
 defvjp(anp.minimum,     lambda ans, x, y : unbroadcast_f(x, lambda g: g * balanced_eq(x, ans, y)),
@@ -46,100 +52,113 @@ defvjp(anp.fmax,        lambda ans, x, y : unbroadcast_f(x, lambda g: g * balanc
 defvjp(anp.fmin,        lambda ans, x, y : unbroadcast_f(x, lambda g: g * balanced_eq(x, ans, y)),
                         lambda ans, x, y : unbroadcast_f(y, lambda g: g * balanced_eq(y, ans, x)))
 defvjp(anp.logaddexp,   lambda ans, x, y : unbroadcast_f(x, lambda g: g * anp.exp(x-ans)),
-                        lambda ans, x, y : unbroadcast_f(y, lambda g: g * anp.exp(y-ans)))
+                        lambda ans, x, y : unbroadcast_f(y, lambda g: g * anp.exp(y-ans)),
+       residuals=[(0, 'ans'), (1, 'ans')])
 defvjp(anp.logaddexp2,  lambda ans, x, y : unbroadcast_f(x, lambda g: g * 2**(x-ans)),
-                        lambda ans, x, y : unbroadcast_f(y, lambda g: g * 2**(y-ans)))
+                        lambda ans, x, y : unbroadcast_f(y, lambda g: g * 2**(y-ans)),
+       residuals=[(0, 'ans'), (1, 'ans')])
 defvjp(anp.true_divide, lambda ans, x, y : unbroadcast_f(x, lambda g: g / y),
-                        lambda ans, x, y : unbroadcast_f(y, lambda g: - g * x / y**2))
+                        lambda ans, x, y : unbroadcast_f(y, lambda g: - g * x / y**2),
+       residuals=[(1,), (0, 1)])
 defvjp(anp.mod,         lambda ans, x, y : unbroadcast_f(x, lambda g: g),
-                        lambda ans, x, y : unbroadcast_f(y, lambda g: -g * anp.floor(x/y)))
+                        lambda ans, x, y : unbroadcast_f(y, lambda g: -g * anp.floor(x/y)),
+       residuals=[(), (0, 1)])
 defvjp(anp.remainder,   lambda ans, x, y : unbroadcast_f(x, lambda g: g),
-                        lambda ans, x, y : unbroadcast_f(y, lambda g: -g * anp.floor(x/y)))
+                        lambda ans, x, y : unbroadcast_f(y, lambda g: -g * anp.floor(x/y)),
+       residuals=[(), (0, 1)])
 defvjp(anp.power,
     lambda ans, x, y : unbroadcast_f(x, lambda g: g * y * x ** anp.where(y, y - 1, 1.)),
-    lambda ans, x, y : unbroadcast_f(y, lambda g: g * anp.log(replace_zero(x, 1.)) * x ** y))
+    lambda ans, x, y : unbroadcast_f(y, lambda g: g * anp.log(replace_zero(x, 1.)) * x ** y),
+    residuals=[(0, 1), (0, 1)])
 defvjp(anp.arctan2,     lambda ans, x, y : unbroadcast_f(x, lambda g: g * y / (x**2 + y**2)),
-                        lambda ans, x, y : unbroadcast_f(y, lambda g: g * -x / (x**2 + y**2)))
+                        lambda ans, x, y : unbroadcast_f(y, lambda g: g * -x / (x**2 + y**2)),
+       residuals=[(0, 1), (0, 1)])
 defvjp(anp.hypot,
         lambda ans, x, y : unbroadcast_f(x, lambda g: g * x / ans),
-        lambda ans, x, y : unbroadcast_f(y, lambda g: g * y / ans))
+        lambda ans, x, y : unbroadcast_f(y, lambda g: g * y / ans),
+        residuals=[(0, 'ans'), (1, 'ans')])
 
 # ----- Simple grads -----
 
-defvjp(anp.negative, lambda ans, x: lambda g: -g)
+defvjp(anp.negative, lambda ans, x: lambda g: -g, residuals=[()])
 defvjp(anp.abs,
     lambda ans, x : lambda g: g * replace_zero(anp.conj(x), 0.) / replace_zero(ans, 1.))
-defvjp(anp.fabs,     lambda ans, x : lambda g: anp.sign(x) * g)  # fabs doesn't take complex numbers.
+defvjp(anp.fabs,     lambda ans, x : lambda g: anp.sign(x) * g, residuals=[(0,)])  # fabs doesn't take complex numbers.
 defvjp(anp.absolute, lambda ans, x : lambda g: g * anp.conj(x) / ans)
-defvjp(anp.reciprocal, lambda ans, x : lambda g: - g / x**2)
-defvjp(anp.exp,    lambda ans, x : lambda g: ans * g)
-defvjp(anp.exp2,   lambda ans, x : lambda g: ans * anp.log(2) * g)
-defvjp(anp.expm1,  lambda ans, x : lambda g: (ans + 1) * g)
-defvjp(anp.log,    lambda ans, x : lambda g: g / x)
-defvjp(anp.log2,   lambda ans, x : lambda g: g / x / anp.log(2))
-defvjp(anp.log10,  lambda ans, x : lambda g: g / x / anp.log(10))
-defvjp(anp.log1p,  lambda ans, x : lambda g: g / (x + 1))
-defvjp(anp.sin,    lambda ans, x : lambda g: g * anp.cos(x))
-defvjp(anp.cos,    lambda ans, x : lambda g: - g * anp.sin(x))
-defvjp(anp.tan,    lambda ans, x : lambda g: g / anp.cos(x) **2)
-defvjp(anp.arcsin, lambda ans, x : lambda g: g / anp.sqrt(1 - x**2))
-defvjp(anp.arccos, lambda ans, x : lambda g:-g / anp.sqrt(1 - x**2))
-defvjp(anp.arctan, lambda ans, x : lambda g: g / (1 + x**2))
-defvjp(anp.sinh,   lambda ans, x : lambda g: g * anp.cosh(x))
-defvjp(anp.cosh,   lambda ans, x : lambda g: g * anp.sinh(x))
-defvjp(anp.tanh,   lambda ans, x : lambda g: g / anp.cosh(x) **2)
-defvjp(anp.arcsinh, lambda ans, x : lambda g: g / anp.sqrt(x**2 + 1))
-defvjp(anp.arccosh, lambda ans, x : lambda g: g / anp.sqrt(x**2 - 1))
-defvjp(anp.arctanh, lambda ans, x : lambda g: g / (1 - x**2))
-defvjp(anp.rad2deg, lambda ans, x : lambda g: g / anp.pi * 180.0)
-defvjp(anp.degrees, lambda ans, x : lambda g: g / anp.pi * 180.0)
-defvjp(anp.deg2rad, lambda ans, x : lambda g: g * anp.pi / 180.0)
-defvjp(anp.radians, lambda ans, x : lambda g: g * anp.pi / 180.0)
-defvjp(anp.square,  lambda ans, x : lambda g: g * 2 * x)
-defvjp(anp.sqrt,    lambda ans, x : lambda g: g * 0.5 * x**-0.5)
-defvjp(anp.sinc,    lambda ans, x : lambda g: g * (anp.cos(anp.pi*x)*anp.pi*x - anp.sin(anp.pi*x))/(anp.pi*x**2))
-defvjp(anp.reshape, lambda ans, x, shape, order=None : lambda g: anp.reshape(g, anp.shape(x), order=order))
-defvjp(anp.roll,    lambda ans, x, shift, axis=None  : lambda g: anp.roll(g, -shift, axis=axis))
-defvjp(anp.array_split, lambda ans, ary, idxs, axis=0 : lambda g: anp.concatenate(g, axis=axis))
-defvjp(anp.split,       lambda ans, ary, idxs, axis=0 : lambda g: anp.concatenate(g, axis=axis))
-defvjp(anp.vsplit,      lambda ans, ary, idxs         : lambda g: anp.concatenate(g, axis=0))
-defvjp(anp.hsplit,      lambda ans, ary, idxs         : lambda g: anp.concatenate(g, axis=1))
-defvjp(anp.dsplit,      lambda ans, ary, idxs         : lambda g: anp.concatenate(g, axis=2))
-defvjp(anp.ravel,   lambda ans, x, order=None   : lambda g: anp.reshape(g, anp.shape(x), order=order))
-defvjp(anp.expand_dims, lambda ans, x, axis     : lambda g: anp.reshape(g, anp.shape(x)))
-defvjp(anp.squeeze, lambda ans, x, axis=None    : lambda g: anp.reshape(g, anp.shape(x)))
-defvjp(anp.diag,    lambda ans, x, k=0          : lambda g: anp.diag(g, k))
-defvjp(anp.flipud,  lambda ans, x,              : lambda g: anp.flipud(g))
-defvjp(anp.fliplr,  lambda ans, x,              : lambda g: anp.fliplr(g))
-defvjp(anp.rot90,   lambda ans, x, k=1          : lambda g: anp.rot90(g, -k))
+defvjp(anp.reciprocal, lambda ans, x : lambda g: - g / x**2, residuals=[(0,)])
+defvjp(anp.exp,    lambda ans, x : lambda g: ans * g, residuals=[('ans',)])
+defvjp(anp.exp2,   lambda ans, x : lambda g: ans * anp.log(2) * g, residuals=[('ans',)])
+defvjp(anp.expm1,  lambda ans, x : lambda g: (ans + 1) * g, residuals=[('ans',)])
+defvjp(anp.log,    lambda ans, x : lambda g: g / x, residuals=[(0,)])
+defvjp(anp.log2,   lambda ans, x : lambda g: g / x / anp.log(2), residuals=[(0,)])
+defvjp(anp.log10,  lambda ans, x : lambda g: g / x / anp.log(10), residuals=[(0,)])
+defvjp(anp.log1p,  lambda ans, x : lambda g: g / (x + 1), residuals=[(0,)])
+defvjp(anp.sin,    lambda ans, x : lambda g: g * anp.cos(x), residuals=[(0,)])
+defvjp(anp.cos,    lambda ans, x : lambda g: - g * anp.sin(x), residuals=[(0,)])
+defvjp(anp.tan,    lambda ans, x : lambda g: g / anp.cos(x) **2, residuals=[(0,)])
+defvjp(anp.arcsin, lambda ans, x : lambda g: g / anp.sqrt(1 - x**2), residuals=[(0,)])
+defvjp(anp.arccos, lambda ans, x : lambda g:-g / anp.sqrt(1 - x**2), residuals=[(0,)])
+defvjp(anp.arctan, lambda ans, x : lambda g: g / (1 + x**2), residuals=[(0,)])
+defvjp(anp.sinh,   lambda ans, x : lambda g: g * anp.cosh(x), residuals=[(0,)])
+defvjp(anp.cosh,   lambda ans, x : lambda g: g * anp.sinh(x), residuals=[(0,)])
+defvjp(anp.tanh,   lambda ans, x : lambda g: g / anp.cosh(x) **2, residuals=[(0,)])
+defvjp(anp.arcsinh, lambda ans, x : lambda g: g / anp.sqrt(x**2 + 1), residuals=[(0,)])
+defvjp(anp.arccosh, lambda ans, x : lambda g: g / anp.sqrt(x**2 - 1), residuals=[(0,)])
+defvjp(anp.arctanh, lambda ans, x : lambda g: g / (1 - x**2), residuals=[(0,)])
+defvjp(anp.rad2deg, lambda ans, x : lambda g: g / anp.pi * 180.0, residuals=[()])
+defvjp(anp.degrees, lambda ans, x : lambda g: g / anp.pi * 180.0, residuals=[()])
+defvjp(anp.deg2rad, lambda ans, x : lambda g: g * anp.pi / 180.0, residuals=[()])
+defvjp(anp.radians, lambda ans, x : lambda g: g * anp.pi / 180.0, residuals=[()])
+defvjp(anp.square,  lambda ans, x : lambda g: g * 2 * x, residuals=[(0,)])
+defvjp(anp.sqrt,    lambda ans, x : lambda g: g * 0.5 * x**-0.5, residuals=[(0,)])
+defvjp(anp.sinc,    lambda ans, x : lambda g: g * (anp.cos(anp.pi*x)*anp.pi*x - anp.sin(anp.pi*x))/(anp.pi*x**2), residuals=[(0,)])
+defvjp(anp.reshape, lambda ans, x, shape, order=None : lambda g: anp.reshape(g, anp.shape(x), order=order), residuals=[()])
+defvjp(anp.roll,    lambda ans, x, shift, axis=None  : lambda g: anp.roll(g, -shift, axis=axis), residuals=[(1,)])
+defvjp(anp.array_split, lambda ans, ary, idxs, axis=0 : lambda g: anp.concatenate(g, axis=axis), residuals=[()])
+defvjp(anp.split,       lambda ans, ary, idxs, axis=0 : lambda g: anp.concatenate(g, axis=axis), residuals=[()])
+defvjp(anp.vsplit,      lambda ans, ary, idxs         : lambda g: anp.concatenate(g, axis=0), residuals=[()])
+defvjp(anp.hsplit,      lambda ans, ary, idxs         : lambda g: anp.concatenate(g, axis=1), residuals=[()])
+defvjp(anp.dsplit,      lambda ans, ary, idxs         : lambda g: anp.concatenate(g, axis=2), residuals=[()])
+defvjp(anp.ravel,   lambda ans, x, order=None   : lambda g: anp.reshape(g, anp.shape(x), order=order), residuals=[()])
+defvjp(anp.expand_dims, lambda ans, x, axis     : lambda g: anp.reshape(g, anp.shape(x)), residuals=[()])
+defvjp(anp.squeeze, lambda ans, x, axis=None    : lambda g: anp.reshape(g, anp.shape(x)), residuals=[()])
+defvjp(anp.diag,    lambda ans, x, k=0          : lambda g: anp.diag(g, k), residuals=[()])
+defvjp(anp.flipud,  lambda ans, x,              : lambda g: anp.flipud(g), residuals=[()])
+defvjp(anp.fliplr,  lambda ans, x,              : lambda g: anp.fliplr(g), residuals=[()])
+defvjp(anp.rot90,   lambda ans, x, k=1          : lambda g: anp.rot90(g, -k), residuals=[()])
 defvjp(anp.trace,   lambda ans, x, offset=0     : lambda g:
-                    anp.einsum('ij,...->ij...', anp.eye(x.shape[0], x.shape[1], k=offset), g))
-defvjp(anp.full, lambda ans, shape, fill_value, dtype=None : lambda g: anp.sum(g), argnums=(1,))
-defvjp(anp.triu,    lambda ans, x, k=0          : lambda g: anp.triu(g, k=k))
-defvjp(anp.tril,    lambda ans, x, k=0          : lambda g: anp.tril(g, k=k))
-defvjp(anp.clip,    lambda ans, x, a_min, a_max : lambda g: g * anp.logical_and(ans != a_min, ans != a_max))
-defvjp(anp.swapaxes, lambda ans, x, axis1, axis2: lambda g: anp.swapaxes(g, axis2, axis1))
+                    anp.einsum('ij,...->ij...', anp.eye(x.shape[0], x.shape[1], k=offset), g),
+       residuals=[()])
+defvjp(anp.full, lambda ans, shape, fill_value, dtype=None : lambda g: anp.sum(g), argnums=(1,), residuals=[()])
+defvjp(anp.triu,    lambda ans, x, k=0          : lambda g: anp.triu(g, k=k), residuals=[()])
+defvjp(anp.tril,    lambda ans, x, k=0          : lambda g: anp.tril(g, k=k), residuals=[()])
+defvjp(anp.clip,    lambda ans, x, a_min, a_max : lambda g: g * anp.logical_and(ans != a_min, ans != a_max), residuals=[('ans', 1, 2)])
+defvjp(anp.swapaxes, lambda ans, x, axis1, axis2: lambda g: anp.swapaxes(g, axis2, axis1), residuals=[()])
 defvjp(anp.moveaxis, lambda ans, a, source, destination: lambda g:
-                    anp.moveaxis(g, destination, source))
-defvjp(anp.real_if_close, lambda ans, x : lambda g: match_complex(x, g))
-defvjp(anp.real,   lambda ans, x   : lambda g: match_complex(x, g))
-defvjp(anp.imag,   lambda ans, x   : lambda g: match_complex(x, -1j * g))
-defvjp(anp.conj,   lambda ans, x   : lambda g: anp.conj(g))
-defvjp(anp.conjugate, lambda ans, x: lambda g: anp.conj(g))
-defvjp(anp.angle,  lambda ans, x   : lambda g: match_complex(x, g * anp.conj(x * 1j) / anp.abs(x)**2))
+                    anp.moveaxis(g, destination, source),
+       residuals=[()])
+defvjp(anp.real_if_close, lambda ans, x : lambda g: match_complex(x, g), residuals=[()])
+defvjp(anp.real,   lambda ans, x   : lambda g: match_complex(x, g), residuals=[()])
+defvjp(anp.imag,   lambda ans, x   : lambda g: match_complex(x, -1j * g), residuals=[()])
+defvjp(anp.conj,   lambda ans, x   : lambda g: anp.conj(g), residuals=[()])
+defvjp(anp.conjugate, lambda ans, x: lambda g: anp.conj(g), residuals=[()])
+defvjp(anp.angle,  lambda ans, x   : lambda g: match_complex(x, g * anp.conj(x * 1j) / anp.abs(x)**2), residuals=[(0,)])
 defvjp(anp.where, None,
        lambda ans, c, x=None, y=None : lambda g: anp.where(c, g, anp.zeros(g.shape)),
-       lambda ans, c, x=None, y=None : lambda g: anp.where(c, anp.zeros(g.shape), g))
+       lambda ans, c, x=None, y=None : lambda g: anp.where(c, anp.zeros(g.shape), g),
+       residuals=[(), (0,), (0,)])
 defvjp(anp.cross, lambda ans, a, b, axisa=-1, axisb=-1, axisc=-1, axis=None : lambda g:
                   anp.cross(b, g, axisb, axisc, axisa, axis),
                   lambda ans, a, b, axisa=-1, axisb=-1, axisc=-1, axis=None : lambda g:
                   anp.cross(g, a, axisc, axisa, axisb, axis))
 defvjp(anp.linspace, lambda ans, start, stop, num : lambda g: anp.dot(anp.linspace(1.0, 0.0, num), g),
-                     lambda ans, start, stop, num : lambda g: anp.dot(anp.linspace(0.0, 1.0, num), g))
+                     lambda ans, start, stop, num : lambda g: anp.dot(anp.linspace(0.0, 1.0, num), g),
+       residuals=[(), ()])
 
 defvjp(anp._astype,
        lambda ans, A, dtype, order='K', casting='unsafe', subok=True, copy=True:
-       lambda g: anp._astype(g, A.dtype))
+       lambda g: anp._astype(g, A.dtype),
+       residuals=[()])
 
 # ----- Trickier grads -----
 def grad_rollaxis(ans, a, axis, start=0):
@@ -150,7 +169,7 @@ def grad_rollaxis(ans, a, axis, start=0):
         raise NotImplementedError("Gradient of rollaxis not implemented for start < 0. "
             "Please use moveaxis instead.")
     return lambda g: anp.rollaxis(g, start - 1, axis) if start > axis else anp.rollaxis(g, start, axis + 1)
-defvjp(anp.rollaxis, grad_rollaxis)
+defvjp(anp.rollaxis, grad_rollaxis, residuals=[()])
 
 def grad_diff(ans, a, n=1, axis=-1):
     nd = anp.ndim(a)
@@ -174,7 +193,7 @@ def grad_diff(ans, a, n=1, axis=-1):
         return helper(undiff(g), n-1)
     return lambda g: helper(g, n)
 
-defvjp(anp.diff, grad_diff)
+defvjp(anp.diff, grad_diff, residuals=[()])
 
 def grad_repeat(ans, x, repeats, axis=None):
     shape = anp.shape(x)
@@ -190,7 +209,7 @@ def grad_repeat(ans, x, repeats, axis=None):
                 return anp.sum(expanded, axis=axis+1, keepdims=False)
     return vjp
 
-defvjp(anp.repeat, grad_repeat)
+defvjp(anp.repeat, grad_repeat, residuals=[(1,)])
 
 def grad_tile(ans, x, reps):
     reps = [reps] if anp.isscalar(reps) else reps
@@ -200,7 +219,7 @@ def grad_tile(ans, x, reps):
             g = sum(anp.split(g, rep, axis))
         return anp.reshape(g, x_shape)
     return vjp
-defvjp(anp.tile, grad_tile)
+defvjp(anp.tile, grad_tile, residuals=[(1,)])
 
 def grad_kron(argnum, ans, orig_A, orig_B):
     # kron has different promotion rules than dot. the reshapes are necessary if
@@ -218,13 +237,13 @@ def grad_kron(argnum, ans, orig_A, orig_B):
         else:
             return match_complex(orig_B, anp.reshape(anp.tensordot(A, reshaped_G, axes=anp.ndim(A)), orig_B_shape))
     return vjp
-defvjp(anp.kron, partial(grad_kron, 0), partial(grad_kron, 1))
+defvjp(anp.kron, partial(grad_kron, 0), partial(grad_kron, 1), residuals=[(1,), (0,)])
 
 def grad_transpose(ans, x, axes=None):
     if axes is not None:
         axes = anp.argsort(axes)
     return lambda g: anp.transpose(g, axes)
-defvjp(anp.transpose, grad_transpose)
+defvjp(anp.transpose, grad_transpose, residuals=[(1,)])
 
 def repeat_to_match_shape(g, shape, dtype, axis, keepdims):
     """Returns the array g repeated along axis to fit vector space vs.
@@ -247,12 +266,12 @@ def grad_broadcast_to(ans, x, new_shape):
         onp.array(old_shape) == 1,
         onp.array(new_shape) >  1))[0])
     return lambda g: anp.sum(g, axis=broadcast_axes, keepdims=True)
-defvjp(anp.broadcast_to, grad_broadcast_to)
+defvjp(anp.broadcast_to, grad_broadcast_to, residuals=[()])
 
 def grad_np_sum(ans, x, axis=None, keepdims=False, dtype=None):
     shape, dtype = anp.shape(x), anp.result_type(x)
     return lambda g: repeat_to_match_shape(g, shape, dtype, axis, keepdims)[0]
-defvjp(anp.sum, grad_np_sum)
+defvjp(anp.sum, grad_np_sum, residuals=[()])
 
 def grad_np_mean(ans, x, axis=None, keepdims=False):
     shape, dtype = anp.shape(x), anp.result_type(x)
@@ -260,7 +279,7 @@ def grad_np_mean(ans, x, axis=None, keepdims=False):
         g_repeated, num_reps = repeat_to_match_shape(g, shape, dtype, axis, keepdims)
         return g_repeated / num_reps
     return vjp
-defvjp(anp.mean, grad_np_mean)
+defvjp(anp.mean, grad_np_mean, residuals=[()])
 
 def grad_np_prod(ans, x, axis=None, keepdims=False): # TODO: Support tuples of axes.
     shape, dtype = anp.shape(x), anp.result_type(x)
@@ -322,7 +341,7 @@ def grad_np_cumsum(ans, x, axis=None):
         else:
             return anp.reshape(anp.cumsum(g[::-1], axis)[::-1], x.shape)
     return vjp
-defvjp(anp.cumsum, grad_np_cumsum)
+defvjp(anp.cumsum, grad_np_cumsum, residuals=[()])
 
 def grad_inner(argnum, ans, A, B):
     A_ndim, B_ndim = anp.ndim(A), anp.ndim(B)
@@ -334,7 +353,7 @@ def grad_inner(argnum, ans, A, B):
         return lambda G: tensordot_adjoint_0(B, G, axes, A_ndim, B_ndim)
     elif argnum == 1:
         return lambda G: tensordot_adjoint_1(A, G, axes, A_ndim, B_ndim)
-defvjp(anp.inner, partial(grad_inner, 0), partial(grad_inner, 1))
+defvjp(anp.inner, partial(grad_inner, 0), partial(grad_inner, 1), residuals=[(1,), (0,)])
 
 def matmul_adjoint_0(B, G, A_meta, B_ndim):
     if anp.ndim(G) == 0:  # A_ndim == B_ndim == 1
@@ -377,7 +396,7 @@ def matmul_vjp_1(ans, A, B):
     B_meta = anp.metadata(B)
     return lambda g: matmul_adjoint_1(A, g, A_ndim, B_meta)
 
-defvjp(anp.matmul, matmul_vjp_0, matmul_vjp_1)
+defvjp(anp.matmul, matmul_vjp_0, matmul_vjp_1, residuals=[(1,), (0,)])
 
 @primitive
 def dot_adjoint_0(B, G, A_meta, B_meta):
@@ -411,7 +430,7 @@ def dot_vjp_0(ans, A, B):
 def dot_vjp_1(ans, A, B):
     A_meta, B_meta = anp.metadata(A), anp.metadata(B)
     return lambda g: match_complex(B, dot_adjoint_1(A, g, A_meta, B_meta))
-defvjp(anp.dot, dot_vjp_0, dot_vjp_1)
+defvjp(anp.dot, dot_vjp_0, dot_vjp_1, residuals=[(1,), (0,)])
 
 defvjp(dot_adjoint_0, lambda ans, B, g, An, Bn: lambda A: match_complex(B, dot_adjoint_1(A, g, An, Bn)),
                       lambda ans, B, g, An, Bn: lambda A: match_complex(g, anp.dot(A, B)))
@@ -483,13 +502,14 @@ def tensordot_vjp_1(ans, A, B, axes=2):
     A_ndim, B_ndim = anp.ndim(A), anp.ndim(B)
     return lambda G: match_complex(B, tensordot_adjoint_1(A, G, axes, A_ndim, B_ndim))
 
-defvjp(anp.tensordot, tensordot_vjp_0, tensordot_vjp_1)
+defvjp(anp.tensordot, tensordot_vjp_0, tensordot_vjp_1, residuals=[(1,), (0,)])
 defvjp(tensordot_adjoint_0, lambda ans, B, G, axes, An, Bn: lambda A: match_complex(B, tensordot_adjoint_1(A, G, axes, An, Bn)),
                             lambda ans, B, G, axes, An, Bn: lambda A: match_complex(G, anp.tensordot(A, B, axes)))
 defvjp(tensordot_adjoint_1, lambda ans, A, G, axes, An, Bn: lambda B: match_complex(A, tensordot_adjoint_0(B, G, axes, An, Bn)),
                             lambda ans, A, G, axes, An, Bn: lambda B: match_complex(G, anp.tensordot(A, B, axes)))
 defvjp(anp.outer, lambda ans, a, b : lambda g: match_complex(a, anp.dot(g, b.T)),
-                  lambda ans, a, b : lambda g: match_complex(b, anp.dot(a.T, g)))
+                  lambda ans, a, b : lambda g: match_complex(b, anp.dot(a.T, g)),
+       residuals=[(1,), (0,)])
 
 def grad_concatenate_args(argnum, ans, axis_args, kwargs):
     axis, args = axis_args[0], axis_args[1:]
@@ -537,9 +557,9 @@ def grad_reshape_list(ans, *arys):
     if len(arys) > 1:
         raise NotImplementedError("Can't handle multiple arguments yet.")
     return lambda g: anp.reshape(g, anp.shape(arys[0]))
-defvjp(anp.atleast_1d, grad_reshape_list)
-defvjp(anp.atleast_2d, grad_reshape_list)
-defvjp(anp.atleast_3d, grad_reshape_list)
+defvjp(anp.atleast_1d, grad_reshape_list, residuals=[()])
+defvjp(anp.atleast_2d, grad_reshape_list, residuals=[()])
+defvjp(anp.atleast_3d, grad_reshape_list, residuals=[()])
 
 def grad_einsum(argnum, ans, operands_, kwargs):
     result_meta = anp.metadata(operands_[argnum])
@@ -586,10 +606,12 @@ defvjp_argnum(anp.einsum, grad_einsum)
 
 defvjp(anp.diagonal,
     lambda ans, A, offset=0, axis1=0, axis2=1 :
-    lambda g: anp.make_diagonal(g, offset, axis1, axis2))
+    lambda g: anp.make_diagonal(g, offset, axis1, axis2),
+    residuals=[()])
 defvjp(anp.make_diagonal,
     lambda ans, D, offset=0, axis1=0, axis2=1 :
-    lambda g: anp.diagonal(g, offset, axis1, axis2))
+    lambda g: anp.diagonal(g, offset, axis1, axis2),
+    residuals=[()])
 
 def match_complex(target, x):
     target_iscomplex = anp.iscomplexobj(target)
@@ -645,7 +667,7 @@ def array_from_scalar_or_array_gradmaker(ans, array_args, array_kwargs, scarray)
         return lambda g: anp.squeeze(g, axis=tuple(range(ndmin - scarray_ndim)))
     else:
         return lambda g: g
-defvjp(anp._array_from_scalar_or_array, array_from_scalar_or_array_gradmaker, argnums=(2,3))
+defvjp(anp._array_from_scalar_or_array, array_from_scalar_or_array_gradmaker, argnums=(2,3), residuals=[()])
 
 @primitive
 def untake(x, idx, vs):
@@ -653,5 +675,166 @@ def untake(x, idx, vs):
         onp.add.at(A, idx, x)
         return A
     return SparseObject(vs, mut_add)
-defvjp(func(ArrayBox.__getitem__), lambda ans, A, idx: lambda g: untake(g, idx, vspace(A)))
-defvjp(untake, lambda ans, x, idx, _: lambda g: g[idx])
+defvjp(func(ArrayBox.__getitem__), lambda ans, A, idx: lambda g: untake(g, idx, vspace(A)), residuals=[(1,)])
+defvjp(untake, lambda ans, x, idx, _: lambda g: g[idx], residuals=[(1,)])
+
+# ----- Batched VJPs -----
+# These act on a batch of cotangents stacked along a new leading axis. See
+# defvjp_batched. Primitives not listed here are looped over the batch. Since
+# batched VJPs may themselves be differentiated, they must only apply ops to
+# the batch that are valid for its shape (e.g. not the dot adjoints, whose
+# own VJPs assume unbatched metadata).
+
+def unbroadcast_batched(x, target_meta):
+    target_shape, target_ndim, dtype, target_iscomplex = target_meta
+    while anp.ndim(x) > target_ndim + 1:
+        x = anp.sum(x, axis=1)
+    for axis, size in enumerate(target_shape):
+        if size == 1:
+            x = anp.sum(x, axis=axis + 1, keepdims=True)
+    if anp.iscomplexobj(x) and not target_iscomplex:
+        x = anp.real(x)
+    return x
+
+def unbroadcast_batched_f(target, f):
+    target_meta = anp.metadata(target)
+    return lambda G: unbroadcast_batched(f(G), target_meta)
+
+def batch_axis(axis, ndim):
+    if axis is None:
+        return tuple(range(1, ndim + 1))
+    elif isinstance(axis, tuple):
+        return tuple(a % ndim + 1 for a in axis)
+    else:
+        return axis % ndim + 1
+
+def batch_idx(idx):
+    return (slice(None),) + (idx if isinstance(idx, tuple) else (idx,))
+
+def split_advanced_ndim(idx):
+    """If `idx` has advanced (array) indices separated by basic ones, numpy puts
+    their broadcast axes first, ahead of the batch axis that `batch_idx`
+    adds. Returns the number of those axes, or 0 if the batch axis stays
+    first."""
+    idx = idx if isinstance(idx, tuple) else (idx,)
+    advanced = [i for i, x in enumerate(idx)
+                if not (x is None or x is Ellipsis or type(x) is slice)]
+    arrays = [onp.asarray(idx[i]) for i in advanced]
+    if all(a.ndim == 0 and a.dtype != bool for a in arrays):
+        return 0  # Only integers, which is basic indexing
+    if advanced[-1] - advanced[0] + 1 == len(advanced):
+        return 0
+    return max(1 if a.dtype == bool else a.ndim for a in arrays)
+
+def getitem_batched(G, idx):
+    ndim = split_advanced_ndim(idx)
+    G = G[batch_idx(idx)]
+    return anp.moveaxis(G, ndim, 0) if ndim else G
+
+def untake_batched_f(G, idx, shape, dtype):
+    batch_vs = vspace(onp.zeros(anp.shape(G)[:1] + shape, dtype))
+    ndim = split_advanced_ndim(idx)
+    if ndim:
+        G = anp.moveaxis(G, 0, ndim)
+    return untake(G, batch_idx(idx), batch_vs)
+
+def loop_batched(vjp):
+    return lambda G: anp.stack([vjp(g) for g in G])
+
+for fun in [anp.nan_to_num, anp.negative, anp.abs, anp.fabs, anp.absolute,
+            anp.reciprocal, anp.exp, anp.exp2, anp.expm1, anp.log, anp.log2,
+            anp.log10, anp.log1p, anp.sin, anp.cos, anp.tan, anp.arcsin, anp.arccos,
+            anp.arctan, anp.sinh, anp.cosh, anp.tanh, anp.arcsinh, anp.arccosh,
+            anp.arctanh, anp.rad2deg, anp.degrees, anp.deg2rad, anp.radians,
+            anp.square, anp.sqrt, anp.sinc, anp.real_if_close, anp.real, anp.imag,
+            anp.conj, anp.conjugate, anp.angle]:
+    defvjp_batched_same(fun)
+
+defvjp_batched(anp.add,         lambda ans, x, y : unbroadcast_batched_f(x, lambda G: G),
+                                lambda ans, x, y : unbroadcast_batched_f(y, lambda G: G))
+defvjp_batched(anp.multiply,    lambda ans, x, y : unbroadcast_batched_f(x, lambda G: y * G),
+                                lambda ans, x, y : unbroadcast_batched_f(y, lambda G: x * G))
+defvjp_batched(anp.subtract,    lambda ans, x, y : unbroadcast_batched_f(x, lambda G: G),
+                                lambda ans, x, y : unbroadcast_batched_f(y, lambda G: -G))
+defvjp_batched(anp.divide,      lambda ans, x, y : unbroadcast_batched_f(x, lambda G:   G / y),
+                                lambda ans, x, y : unbroadcast_batched_f(y, lambda G: - G * x / y**2))
+defvjp_batched(anp.true_divide, lambda ans, x, y : unbroadcast_batched_f(x, lambda G:   G / y),
+                                lambda ans, x, y : unbroadcast_batched_f(y, lambda G: - G * x / y**2))
+defvjp_batched(anp.maximum,     lambda ans, x, y : unbroadcast_batched_f(x, lambda G: G * balanced_eq(x, ans, y)),
+                                lambda ans, x, y : unbroadcast_batched_f(y, lambda G: G * balanced_eq(y, ans, x)))
+defvjp_batched(anp.minimum,     lambda ans, x, y : unbroadcast_batched_f(x, lambda G: G * balanced_eq(x, ans, y)),
+                                lambda ans, x, y : unbroadcast_batched_f(y, lambda G: G * balanced_eq(y, ans, x)))
+defvjp_batched(anp.power,
+    lambda ans, x, y : unbroadcast_batched_f(x, lambda G: G * y * x ** anp.where(y, y - 1, 1.)),
+    lambda ans, x, y : unbroadcast_batched_f(y, lambda G: G * anp.log(replace_zero(x, 1.)) * x ** y))
+
+def reshape_batched(x, order=None):
+    shape = anp.shape(x)
+    if order in (None, 'C'):
+        return lambda G: anp.reshape(G, anp.shape(G)[:1] + shape)
+    return loop_batched(lambda g: anp.reshape(g, shape, order=order))
+defvjp_batched(anp.reshape, lambda ans, x, shape, order=None : reshape_batched(x, order))
+defvjp_batched(anp.ravel,   lambda ans, x, order=None        : reshape_batched(x, order))
+defvjp_batched(anp.expand_dims, lambda ans, x, axis          : reshape_batched(x))
+defvjp_batched(anp.squeeze, lambda ans, x, axis=None         : reshape_batched(x))
+
+def grad_transpose_batched(ans, x, axes=None):
+    if axes is None:
+        axes = range(anp.ndim(x))[::-1]
+    axes = (0,) + tuple(anp.argsort(axes) + 1)
+    return lambda G: anp.transpose(G, axes)
+defvjp_batched(anp.transpose, grad_transpose_batched)
+
+def grad_np_sum_batched(ans, x, axis=None, keepdims=False, dtype=None):
+    shape, dtype = anp.shape(x), anp.result_type(x)
+    axis = batch_axis(axis, len(shape))
+    return lambda G: repeat_to_match_shape(G, anp.shape(G)[:1] + shape, dtype, axis, keepdims)[0]
+defvjp_batched(anp.sum, grad_np_sum_batched)
+
+def grad_np_mean_batched(ans, x, axis=None, keepdims=False):
+    shape, dtype = anp.shape(x), anp.result_type(x)
+    axis = batch_axis(axis, len(shape))
+    def vjp(G):
+        G_repeated, num_reps = repeat_to_match_shape(G, anp.shape(G)[:1] + shape, dtype, axis, keepdims)
+        return G_repeated / num_reps
+    return vjp
+defvjp_batched(anp.mean, grad_np_mean_batched)
+
+def tensordot_vjp_0_batched(ans, A, B, axes=2):
+    if type(axes) is not int:
+        return loop_batched(tensordot_vjp_0(ans, A, B, axes))
+    A_ndim, B_ndim = anp.ndim(A), anp.ndim(B)
+    return lambda G: match_complex(A, tensordot_adjoint_0(B, G, axes, A_ndim + 1, B_ndim))
+
+def tensordot_vjp_1_batched(ans, A, B, axes=2):
+    if type(axes) is not int:
+        return loop_batched(tensordot_vjp_1(ans, A, B, axes))
+    A_ndim, B_ndim = anp.ndim(A), anp.ndim(B)
+    return lambda G: match_complex(B, anp.moveaxis(tensordot_adjoint_1(
+        A, anp.moveaxis(G, 0, -1), axes, A_ndim, B_ndim + 1), -1, 0))
+defvjp_batched(anp.tensordot, tensordot_vjp_0_batched, tensordot_vjp_1_batched)
+
+def dot_vjp_batched(argnum, ans, A, B):
+    if anp.ndim(A) == 0 or anp.ndim(B) not in (1, 2):
+        return loop_batched([dot_vjp_0, dot_vjp_1][argnum](ans, A, B))
+    # Here dot(A, B) is tensordot(A, B, 1)
+    return [tensordot_vjp_0_batched, tensordot_vjp_1_batched][argnum](ans, A, B, 1)
+defvjp_batched(anp.dot, partial(dot_vjp_batched, 0), partial(dot_vjp_batched, 1))
+
+def untake_batched(ans, A, idx):
+    shape, dtype = anp.shape(A), anp.result_type(A)
+    return lambda G: untake_batched_f(G, idx, shape, dtype)
+defvjp_batched(func(ArrayBox.__getitem__), untake_batched)
+defvjp_batched(untake, lambda ans, x, idx, _: lambda G: getitem_batched(G, idx))
+
+defvjp_batched_argnums(anp.array_from_args,
+    lambda argnums, ans, args, kwargs: lambda G: [G[:, argnum-2] for argnum in argnums])
+
+def array_from_scalar_or_array_batched(ans, array_args, array_kwargs, scarray):
+    ndmin = array_kwargs.get('ndmin', 0)
+    scarray_ndim = anp.ndim(scarray)
+    if ndmin > scarray_ndim:
+        return lambda G: anp.squeeze(G, axis=tuple(range(1, ndmin - scarray_ndim + 1)))
+    else:
+        return lambda G: G
+defvjp_batched(anp._array_from_scalar_or_array, array_from_scalar_or_array_batched, argnums=(2,3))
@@ -1,5 +1,6 @@
 import numpy as np
-from autograd.extend import VSpace
+from autograd.extend import VSpace, residual_placeholders
+from . import numpy_wrapper as anp
 
 class ArrayVSpace(VSpace):
     def __init__(self, value):
@@ -23,6 +24,12 @@ class ArrayVSpace(VSpace):
     def randn(self):
         return np.array(np.random.randn(*self.shape)).astype(self.dtype)
 
+    def batch_stack(self, xs):
+        return anp.stack(xs)
+
+    def batch_unstack(self, x):
+        return [x[i] for i in range(anp.shape(x)[0])]
+
     def _inner_prod(self, x, y):
         return np.dot(np.ravel(x), np.ravel(y))
 
@@ -63,3 +70,20 @@ for type_ in [float, np.float64, np.float32, np.float16]:
 
 for type_ in [complex, np.complex64, np.complex128]:
     ComplexArrayVSpace.register(type_)
+
+# A zero-strided array with the shape and dtype of x, occupying a single element.
+# Floats are NaN, so a VJP reading a value it didn't declare gives NaN gradients
+# rather than plausible wrong ones. They're read-only, so one per shape and
+# dtype is shared.
+placeholders = {}
+def array_placeholder(x):
+    key = (x.shape, x.dtype)
+    try:
+        return placeholders[key]
+    except KeyError:
+        if len(placeholders) > 1000:
+            placeholders.clear()
+        fill = np.nan if np.issubdtype(x.dtype, np.inexact) else 0
+        placeholder = placeholders[key] = np.broadcast_to(np.full((), fill, x.dtype), x.shape)
+        return placeholder
+residual_placeholders[np.ndarray] = array_placeholder
@@ -0,0 +1,190 @@
+"""Per-primitive profiling of tracing and backward passes.
+
+    with profile() as prof:
+        grad(loss)(params, data)
+    print(prof.summary())
+    prof.export_chrome_trace('grad.json')  # Open in chrome://tracing or Perfetto
+
+For each primitive, this records the number of traced calls and their wall
+time, the time spent building their nodes (the tracer's own overhead), the
+number and wall time of their VJP calls in `backward_pass`, and the bytes of
+the values they return. Accumulating gradients in `add_outgrads` is recorded
+as '(add_outgrads)'. In `tape_backward_pass` only the VJP calls are recorded,
+not the accumulation. Only calls on boxes are recorded; the primitive calls of
+an untraced function cost nothing extra. Times include nested calls, e.g. a
+primitive whose implementation calls `grad`. Profiling applies to the thread
+that entered the context, and serializes `parallel_backward_pass`."""
+from __future__ import absolute_import
+import json
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from timeit import default_timer as clock
+from .tracer import trace_stack, new_box, check_cancelled
+from .core import add_outgrads, VJPNode, BatchedVJPNode, TapeNode
+from .util import toposort
+
+@contextmanager
+def profile():
+    """Context manager recording the primitives traced and differentiated in
+    it by the current thread. Yields the Profiler."""
+    profiler = Profiler()
+    previous, trace_stack.profiler = trace_stack.profiler, profiler
+    try:
+        yield profiler
+    finally:
+        trace_stack.profiler = previous
+
+def new_stats():
+    return dict(forward_calls=0, forward_time=0., node_time=0., forward_bytes=0,
+                backward_calls=0, backward_time=0., backward_bytes=0)
+
+class Profiler(object):
+    """Holds `stats`, a dict from primitive name to a dict of counts, times (in
+    seconds) and bytes, and `events`, the timed calls as tuples of name,
+    category, start, duration and bytes."""
+    def __init__(self):
+        self.stats = defaultdict(new_stats)
+        self.events = []
+        self.start = clock()
+        self.thread_id = threading.current_thread().ident
+
+    def apply(self, f_wrapped, argvals, kwargs, argnums, parents, trace, node_constructor):
+        start = clock()
+        if node_constructor.replays:
+            ans = parents[0].evaluate(f_wrapped, argvals, kwargs)
+        else:
+            ans = f_wrapped(*argvals, **kwargs)
+        traced = clock()
+        node = node_constructor(ans, f_wrapped, argvals, kwargs, argnums, parents)
+        end = clock()
+        name = getattr(f_wrapped, '__name__', repr(f_wrapped))
+        # The name goes with the node's VJP, so it lives as long as the node
+        if type(node) is VJPNode:
+            vjpmaker, parent_argnums, value, args, kwargs = node.recipe
+            node.recipe = (NamedVJPMaker(name, vjpmaker), parent_argnums,
+                           value, args, kwargs)
+        elif type(node) is BatchedVJPNode:
+            node.vjp = Named(name, node.vjp)
+        elif type(node) is TapeNode:
+            node.tape.vjps[node.id] = TimedVJP(self, name, node.tape.vjps[node.id])
+        stats, size = self.stats[name], nbytes(ans)
+        stats['forward_calls'] += 1
+        stats['forward_time'] += traced - start
+        stats['node_time'] += end - traced
+        stats['forward_bytes'] += size
+        self.record(name, 'forward', start, traced, size)
+        self.record(name, 'node', traced, end, 0)
+        return new_box(ans, trace, node)
+
+    def backward_pass(self, g, end_node, consume=False):
+        """Same as core.backward_pass, timing each VJP and accumulation."""
+        outgrads = {end_node : (g, False)}
+        add_stats = self.stats['(add_outgrads)']
+        for node in toposort(end_node):
+            check_cancelled()
+            outgrad = outgrads.pop(node)
+            if not node.parents:
+                continue  # The root, which has no VJP to apply
+            name = node_name(node)
+            start = clock()
+            ingrads = tuple(node.vjp(outgrad[0]))
+            end = clock()
+            if consume and type(node) is VJPNode:
+                node.recipe = None
+            self.record_backward(name, start, end, ingrads)
+            for parent, ingrad in zip(node.parents, ingrads):
+                start = clock()
+                outgrads[parent] = add_outgrads(outgrads.get(parent), ingrad)
+                end = clock()
+                add_stats['backward_calls'] += 1
+                add_stats['backward_time'] += end - start
+                self.record('(add_outgrads)', 'backward', start, end, 0)
+        return outgrad[0]
+
+    def record_backward(self, name, start, end, ingrads):
+        stats, size = self.stats[name], nbytes(ingrads)
+        stats['backward_calls'] += 1
+        stats['backward_time'] += end - start
+        stats['backward_bytes'] += size
+        self.record(name, 'backward', start, end, size)
+
+    def record(self, name, category, start, end, size):
+        self.events.append((name, category, start, end - start, size))
+
+    def summary(self, limit=None):
+        """A table of the recorded primitives, slowest first."""
+        total = lambda item: (item[1]['forward_time'] + item[1]['node_time']
+                              + item[1]['backward_time'])
+        rows = sorted(self.stats.items(), key=total, reverse=True)[:limit]
+        header = "{:<24}{:>10}{:>10}{:>10}{:>10}{:>10}{:>12}".format(
+            "primitive", "fwd calls", "fwd ms", "node ms", "bwd calls", "bwd ms", "MB")
+        lines = [header, "-" * len(header)]
+        for name, s in rows:
+            lines.append("{:<24}{:>10}{:>10.3f}{:>10.3f}{:>10}{:>10.3f}{:>12.3f}".format(
+                name[:23], s['forward_calls'], 1e3 * s['forward_time'],
+                1e3 * s['node_time'], s['backward_calls'], 1e3 * s['backward_time'],
+                (s['forward_bytes'] + s['backward_bytes']) / 2.**20))
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """The events in Chrome's trace_event format, as a dict."""
+        pid, tid = os.getpid(), self.thread_id
+        return {'traceEvents': [
+            {'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid,
+             'ts': 1e6 * (start - self.start), 'dur': 1e6 * duration,
+             'args': {'bytes': size}}
+            for name, category, start, duration, size in self.events],
+                'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+def node_name(node):
+    if type(node) is VJPNode:
+        named = node.recipe[0] if type(node.recipe) is tuple else node.recipe
+    else:
+        named = getattr(node, 'vjp', None)
+    return getattr(named, 'name', type(node).__name__)
+
+class Named(object):
+    """A VJP or vjpmaker labelled with the name of its primitive."""
+    __slots__ = ['name', 'fun']
+    def __init__(self, name, fun):
+        self.name, self.fun = name, fun
+
+    def __call__(self, *args):
+        return self.fun(*args)
+
+class NamedVJPMaker(Named):
+    """Labels the VJPs it makes, which VJPNodes keep in place of their recipe."""
+    __slots__ = []
+    def __call__(self, *args):
+        return Named(self.name, self.fun(*args))
+
+class TimedVJP(object):
+    __slots__ = ['profiler', 'name', 'vjp']
+    def __init__(self, profiler, name, vjp):
+        self.profiler, self.name, self.vjp = profiler, name, vjp
+
+    def __call__(self, g):
+        if trace_stack.profiler is not self.profiler:
+            return self.vjp(g)
+        start = clock()
+        ingrads = tuple(self.vjp(g))
+        self.profiler.record_backward(self.name, start, clock(), ingrads)
+        return ingrads
+
+def nbytes(value):
+    t = type(value)
+    if t in (tuple, list):
+        return sum(map(nbytes, value))
+    elif t is dict:
+        return sum(map(nbytes, value.values()))
+    elif t in (float, int):
+        return 8
+    elif t is complex:
+        return 16
+    return getattr(value, 'nbytes', 0)
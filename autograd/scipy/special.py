@@ -33,10 +33,10 @@ multigammaln = primitive(scipy.special.multigammaln)
 
 defvjp(gammasgn, None)
 defvjp(polygamma, None, lambda ans, n, x: lambda g: g * polygamma(n + 1, x))
-defvjp(psi,      lambda ans, x: lambda g: g * polygamma(1, x))
-defvjp(digamma,  lambda ans, x: lambda g: g * polygamma(1, x))
-defvjp(gamma,    lambda ans, x: lambda g: g * ans * psi(x))
-defvjp(gammaln,  lambda ans, x: lambda g: g * psi(x))
+defvjp(psi,      lambda ans, x: lambda g: g * polygamma(1, x), residuals=[(0,)])
+defvjp(digamma,  lambda ans, x: lambda g: g * polygamma(1, x), residuals=[(0,)])
+defvjp(gamma,    lambda ans, x: lambda g: g * ans * psi(x), residuals=[('ans', 0)])
+defvjp(gammaln,  lambda ans, x: lambda g: g * psi(x), residuals=[(0,)])
 defvjp(rgamma,   lambda ans, x: lambda g: g * psi(x) / -gamma(x))
 defvjp(multigammaln,lambda ans, a, d: lambda g:
        g * np.sum(digamma(np.expand_dims(a, -1) - np.arange(d)/2.), -1),
@@ -58,10 +58,10 @@ y1 = primitive(scipy.special.y1)
 jn = primitive(scipy.special.jn)
 yn = primitive(scipy.special.yn)
 
-defvjp(j0,lambda ans, x: lambda g: -g * j1(x))
-defvjp(y0,lambda ans, x: lambda g: -g * y1(x))
-defvjp(j1,lambda ans, x: lambda g: g * (j0(x) - jn(2, x)) / 2.0)
-defvjp(y1,lambda ans, x: lambda g: g * (y0(x) - yn(2, x)) / 2.0)
+defvjp(j0,lambda ans, x: lambda g: -g * j1(x), residuals=[(0,)])
+defvjp(y0,lambda ans, x: lambda g: -g * y1(x), residuals=[(0,)])
+defvjp(j1,lambda ans, x: lambda g: g * (j0(x) - jn(2, x)) / 2.0, residuals=[(0,)])
+defvjp(y1,lambda ans, x: lambda g: g * (y0(x) - yn(2, x)) / 2.0, residuals=[(0,)])
 defvjp(jn, None, lambda ans, n, x: lambda g: g * (jn(n - 1, x) - jn(n + 1, x)) / 2.0)
 defvjp(yn, None, lambda ans, n, x: lambda g: g * (yn(n - 1, x) - yn(n + 1, x)) / 2.0)
 
@@ -70,8 +70,8 @@ inv_root_pi = 0.56418958354775627928
 erf = primitive(scipy.special.erf)
 erfc = primitive(scipy.special.erfc)
 
-defvjp(erf, lambda ans, x: lambda g:  2.*g*inv_root_pi*np.exp(-x**2))
-defvjp(erfc,lambda ans, x: lambda g: -2.*g*inv_root_pi*np.exp(-x**2))
+defvjp(erf, lambda ans, x: lambda g:  2.*g*inv_root_pi*np.exp(-x**2), residuals=[(0,)])
+defvjp(erfc,lambda ans, x: lambda g: -2.*g*inv_root_pi*np.exp(-x**2), residuals=[(0,)])
 
 
 ### Inverse error function ###
@@ -79,12 +79,12 @@ root_pi = 1.7724538509055159
 erfinv = primitive(scipy.special.erfinv)
 erfcinv = primitive(scipy.special.erfcinv)
 
-defvjp(erfinv,lambda ans, x: lambda g: g * root_pi / 2 * np.exp(erfinv(x)**2))
-defvjp(erfcinv,lambda ans, x: lambda g: -g * root_pi / 2 * np.exp(erfcinv(x)**2))
+defvjp(erfinv,lambda ans, x: lambda g: g * root_pi / 2 * np.exp(erfinv(x)**2), residuals=[(0,)])
+defvjp(erfcinv,lambda ans, x: lambda g: -g * root_pi / 2 * np.exp(erfcinv(x)**2), residuals=[(0,)])
 
 ### Logit and Expit ###
 logit = primitive(scipy.special.logit)
 expit = primitive(scipy.special.expit)
 
-defvjp(logit,lambda ans, x: lambda g: g / ( x * (1 - x)))
-defvjp(expit,lambda ans, x: lambda g: g * ans * (1 - ans))
+defvjp(logit,lambda ans, x: lambda g: g / ( x * (1 - x)), residuals=[(0,)])
+defvjp(expit,lambda ans, x: lambda g: g * ans * (1 - ans), residuals=[('ans',)])
@@ -1,4 +1,5 @@
 import warnings
+import threading
 from contextlib import contextmanager
 from collections import defaultdict
 from .util import subvals, toposort
@@ -16,6 +17,10 @@ def trace(start_node, fun, x):
 
 class Node(object):
     __slots__ = []
+    # If True, primitive calls on boxes of this node type get their value from
+    # the parent node's `evaluate(f_wrapped, args, kwargs)` instead of calling
+    # the primitive, e.g. to reuse values saved by an earlier pass.
+    replays = False
     def __init__(self, value, fun, args, kwargs, parent_argnums, parents):
         assert False
 
@@ -28,20 +33,53 @@ class Node(object):
         root.initialize_root(*args, **kwargs)
         return root
 
+    @classmethod
+    def notrace(cls, f_wrapped, argvals, kwargs, argnums, parents, trace):
+        """Called instead of recording a call of a primitive registered with
+        `register_notrace` for this node type. By default its result is a
+        constant of the trace."""
+        return f_wrapped(*argvals, **kwargs)
+
 def primitive(f_raw):
     """
     Wraps a function so that its gradient can be specified and its invocation
     can be recorded. For examples, see the docs."""
     @wraps(f_raw)
     def f_wrapped(*args, **kwargs):
+        # Fast paths for the common one- and two-argument calls without kwargs
+        if not kwargs:
+            if len(args) == 1:
+                x, = args
+                if type(x) in box_types:
+                    return apply_unary(f_wrapped, x)
+                return f_raw(x)
+            elif len(args) == 2:
+                x, y = args
+                x_boxed, y_boxed = type(x) in box_types, type(y) in box_types
+                if not (x_boxed or y_boxed):
+                    return f_raw(x, y)
+                elif x_boxed and y_boxed and x._trace == y._trace:
+                    return apply_binary(f_wrapped, x, y)
+                elif x_boxed and (not y_boxed or x._trace > y._trace):
+                    return apply_binary_argnum(f_wrapped, x, y, 0)
+                else:
+                    return apply_binary_argnum(f_wrapped, x, y, 1)
         boxed_args, trace, node_constructor = find_top_boxed_args(args)
         if boxed_args:
             argvals = subvals(args, [(argnum, box._value) for argnum, box in boxed_args])
-            if f_wrapped in notrace_primitives[node_constructor]:
-                return f_wrapped(*argvals, **kwargs)
             parents = tuple(box._node for _     , box in boxed_args)
             argnums = tuple(argnum    for argnum, _   in boxed_args)
-            ans = f_wrapped(*argvals, **kwargs)
+            if f_wrapped in notrace_primitives[node_constructor]:
+                return node_constructor.notrace(f_wrapped, argvals, kwargs, argnums,
+                                                parents, trace)
+            profiler = trace_stack.profiler
+            if profiler is not None:
+                return profiler.apply(f_wrapped, argvals, kwargs, argnums, parents,
+                                      trace, node_constructor)
+            if node_constructor.replays:
+                ans = parents[0].evaluate(f_wrapped, argvals, kwargs)
+            else:
+                ans = f_wrapped(*argvals, **kwargs)
             node = node_constructor(ans, f_wrapped, argvals, kwargs, argnums, parents)
             return new_box(ans, trace, node)
         else:
@@ -62,6 +100,59 @@ def notrace_primitive(f_raw):
     f_wrapped._is_primitive = True
     return f_wrapped
 
+def apply_unary(f_wrapped, box):
+    node_constructor = type(box._node)
+    x = box._value
+    if f_wrapped in notrace_primitives[node_constructor]:
+        return node_constructor.notrace(f_wrapped, (x,), {}, (0,), (box._node,),
+                                        box._trace)
+    profiler = trace_stack.profiler
+    if profiler is not None:
+        return profiler.apply(f_wrapped, (x,), {}, (0,), (box._node,),
+                              box._trace, node_constructor)
+    if node_constructor.replays:
+        ans = box._node.evaluate(f_wrapped, (x,), {})
+    else:
+        ans = f_wrapped(x)
+    node = node_constructor(ans, f_wrapped, (x,), {}, (0,), (box._node,))
+    return new_box(ans, box._trace, node)
+
+def apply_binary(f_wrapped, x_box, y_box):
+    node_constructor = type(x_box._node)
+    argvals = (x_box._value, y_box._value)
+    if f_wrapped in notrace_primitives[node_constructor]:
+        return node_constructor.notrace(f_wrapped, argvals, {}, (0, 1),
+                                        (x_box._node, y_box._node), x_box._trace)
+    profiler = trace_stack.profiler
+    if profiler is not None:
+        return profiler.apply(f_wrapped, argvals, {}, (0, 1), (x_box._node, y_box._node),
+                              x_box._trace, node_constructor)
+    if node_constructor.replays:
+        ans = x_box._node.evaluate(f_wrapped, argvals, {})
+    else:
+        ans = f_wrapped(*argvals)
+    node = node_constructor(ans, f_wrapped, argvals, {}, (0, 1),
+                            (x_box._node, y_box._node))
+    return new_box(ans, x_box._trace, node)
+
+def apply_binary_argnum(f_wrapped, x, y, argnum):
+    box = x if argnum == 0 else y
+    node_constructor = type(box._node)
+    argvals = (box._value, y) if argnum == 0 else (x, box._value)
+    if f_wrapped in notrace_primitives[node_constructor]:
+        return node_constructor.notrace(f_wrapped, argvals, {}, (argnum,), (box._node,),
+                                        box._trace)
+    profiler = trace_stack.profiler
+    if profiler is not None:
+        return profiler.apply(f_wrapped, argvals, {}, (argnum,), (box._node,),
+                              box._trace, node_constructor)
+    if node_constructor.replays:
+        ans = box._node.evaluate(f_wrapped, argvals, {})
+    else:
+        ans = f_wrapped(*argvals)
+    node = node_constructor(ans, f_wrapped, argvals, {}, (argnum,), (box._node,))
+    return new_box(ans, box._trace, node)
+
 def find_top_boxed_args(args):
     top_trace = -1
     top_boxes = []
@@ -77,16 +168,30 @@ def find_top_boxed_args(args):
                 top_boxes.append((argnum, arg))
     return top_boxes, top_trace, top_node_type
 
-class TraceStack(object):
+class TraceStack(threading.local):
+    """Trace levels are counted per thread, so gradients can be computed
+    concurrently in different threads. A box belongs to the thread whose trace
+    created it. If `cancel_event` (a threading.Event) is set, the thread's
+    traces raise TraceCancelled at the next primitive. If `profiler` is set
+    (see autograd.profiler), traced primitive calls and backward passes go
+    through it."""
     def __init__(self):
         self.top = -1
+        self.cancel_event = None
+        self.profiler = None
     @contextmanager
     def new_trace(self):
         self.top += 1
-        yield self.top
-        self.top -= 1
+        try:
+            yield self.top
+        finally:
+            self.top -= 1
 trace_stack = TraceStack()
 
+# Guards registrations of box and vspace types, which may happen while other
+# threads are tracing.
+registry_lock = threading.Lock()
+
 class Box(object):
     type_mappings = {}
     types = set()
@@ -108,12 +213,22 @@ class Box(object):
 
     @classmethod
     def register(cls, value_type):
-        Box.types.add(cls)
-        Box.type_mappings[value_type] = cls
-        Box.type_mappings[cls] = cls
+        with registry_lock:
+            Box.types.add(cls)
+            Box.type_mappings[value_type] = cls
+            Box.type_mappings[cls] = cls
+
+class TraceCancelled(Exception):
+    pass
+
+def check_cancelled():
+    event = trace_stack.cancel_event
+    if event is not None and event.is_set():
+        raise TraceCancelled("Cancelled while tracing")
 
 box_type_mappings = Box.type_mappings
 def new_box(value, trace, node):
+    check_cancelled()
     try:
         return box_type_mappings[type(value)](value, trace, node)
     except KeyError:
@@ -1,25 +1,64 @@
+from functools import partial
+from importlib import import_module
+from pickle import PicklingError
 from .util import subvals
 
 def unary_to_nary(unary_operator):
     @wraps(unary_operator)
     def nary_operator(fun, argnum=0, *nary_op_args, **nary_op_kwargs):
         assert type(argnum) in (int, tuple, list), argnum
-        @wrap_nary_f(fun, unary_operator, argnum)
-        def nary_f(*args, **kwargs):
-            @wraps(fun)
-            def unary_f(x):
-                if isinstance(argnum, int):
-                    subargs = subvals(args, [(argnum, x)])
-                else:
-                    subargs = subvals(args, zip(argnum, x))
-                return fun(*subargs, **kwargs)
+        return NaryFunction(unary_operator, fun, argnum, nary_op_args, nary_op_kwargs)
+    nary_operator.unary_operator = unary_operator
+    return nary_operator
+
+class NaryFunction(object):
+    """The function returned by an nary operator, e.g. `grad(fun, argnum)`.
+    It pickles as a reference to the operator together with `fun`, `argnum`
+    and the operator's arguments, so it can be sent to worker processes as
+    long as `fun` can be pickled."""
+    def __init__(self, unary_operator, fun, argnum, op_args, op_kwargs):
+        self.unary_operator = unary_operator
+        self.fun = fun
+        self.argnum = argnum
+        self.op_args = op_args
+        self.op_kwargs = op_kwargs
+        wrap_nary_f(fun, unary_operator, argnum)(self)
+
+    def __call__(self, *args, **kwargs):
+        fun, argnum = self.fun, self.argnum
+        @wraps(fun)
+        def unary_f(x):
             if isinstance(argnum, int):
-                x = args[argnum]
+                subargs = subvals(args, [(argnum, x)])
             else:
-                x = tuple(args[i] for i in argnum)
-            return unary_operator(unary_f, x, *nary_op_args, **nary_op_kwargs)
-        return nary_f
-    return nary_operator
+                subargs = subvals(args, zip(argnum, x))
+            return fun(*subargs, **kwargs)
+        if isinstance(argnum, int):
+            x = args[argnum]
+        else:
+            x = tuple(args[i] for i in argnum)
+        return self.unary_operator(unary_f, x, *self.op_args, **self.op_kwargs)
+
+    def __get__(self, obj, objtype=None):
+        # Bind like a function when used as a method
+        return self if obj is None else partial(self, obj)
+
+    def __reduce__(self):
+        op = self.unary_operator
+        if find_unary_operator(op.__module__, op.__name__) is not op:
+            raise PicklingError("Can't pickle {}: operator {} is not importable "
+                                "by name".format(get_name(self), get_name(op)))
+        return (rebuild_nary_function, (op.__module__, op.__name__, self.fun,
+                                        self.argnum, self.op_args, self.op_kwargs))
+
+def find_unary_operator(module, name):
+    # The module attribute may be the unary operator or the nary one wrapping it
+    operator = getattr(import_module(module), name, None)
+    return getattr(operator, 'unary_operator', operator)
+
+def rebuild_nary_function(module, name, fun, argnum, op_args, op_kwargs):
+    operator = find_unary_operator(module, name)
+    return NaryFunction(operator, fun, argnum, op_args, op_kwargs)
 
 def wraps(fun, namestr="{fun}", docstr="{doc}", **kwargs):
     def _wraps(f):
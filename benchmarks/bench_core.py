@@ -1,6 +1,39 @@
 import numpy as onp
 import autograd.numpy as np
-from autograd import grad
+from autograd import grad, jacobian, hessian
+try:
+    from autograd import jacobian_fwd
+except ImportError:
+    jacobian_fwd = jacobian
+try:
+    from autograd import make_jvp, linearize
+except ImportError:
+    linearize = None
+try:
+    from autograd.misc import compiled_grad
+except ImportError:
+    compiled_grad = grad
+try:
+    from autograd.misc import data_parallel_grad
+except ImportError:
+    data_parallel_grad = lambda fun, shard_argnum, n_workers: grad(fun)
+try:
+    from autograd.misc import scan
+except ImportError:
+    def scan(step, carry, xs, params):
+        ys = []
+        for x in xs:
+            carry, y = step(carry, x, params)
+            ys.append(y)
+        return carry, np.stack(ys)
+try:
+    from autograd.misc import odeint
+except ImportError:
+    odeint = None
+try:
+    from autograd import make_tape_vjp
+except ImportError:
+    make_tape_vjp = None
 try:
     from autograd.core import vspace, VJPNode, backward_pass
     from autograd.tracer import trace, new_box
@@ -21,7 +54,7 @@ def time_short_forward_pass():
     if MASTER_BRANCH:
         forward_pass(f_short, (2.,), {})
     else:
-        start_node = VJPNode.new_root(x)
+        start_node = VJPNode.new_root()
         trace(start_node, f_short, x)
 
 def time_short_backward_pass():
@@ -46,7 +79,7 @@ def time_long_forward_pass():
     if MASTER_BRANCH:
         forward_pass(f_long, (2.,), {})
     else:
-        start_node = VJPNode.new_root(x)
+        start_node = VJPNode.new_root()
         trace(start_node, f_long, x)
 
 def time_long_backward_pass():
@@ -71,7 +104,7 @@ def time_fan_out_fan_in_forward_pass():
     if MASTER_BRANCH:
         forward_pass(fan_out_fan_in, (2.,), {})
     else:
-        start_node = VJPNode.new_root(x)
+        start_node = VJPNode.new_root()
         trace(start_node, fan_out_fan_in, x)
 
 def time_fan_out_fan_in_backward_pass():
@@ -83,6 +116,174 @@ def time_fan_out_fan_in_backward_pass():
 def time_fan_out_fan_in_grad():
     grad(fan_out_fan_in)(2.)
 
+def time_fan_out_fan_in_tape_grad():
+    make_tape_vjp(fan_out_fan_in)(2.)[0](1.)
+
+## REPEATED SUBEXPRESSIONS
+def repeated_subexpressions(x):
+    y = 0.
+    for i in range(100):
+        y = y + np.sum(np.cos(x) * np.sin(x))
+    return y
+
+def time_repeated_subexpressions_grad():
+    grad(repeated_subexpressions)(onp.ones(100))
+
+## ELEMENTWISE CHAINS
+chain_W = onp.random.randn(200, 200)
+chain_b = onp.random.randn(200)
+def elementwise_chain(x):
+    h = np.tanh(np.dot(x, chain_W) * 0.5 + chain_b) * 2. - 1.
+    return np.sum(np.log1p(np.exp(h)) * 0.5 + 1.)
+
+def time_elementwise_chain_grad():
+    grad(elementwise_chain)(onp.ones((100, 200)))
+
+## COMPILED GRADIENTS
+class CompiledSuite:
+    """The programs are compiled in setup, by their first call, so only replaying
+    them is timed."""
+    def setup(self):
+        self.long_grad = compiled_grad(f_long)
+        self.fan_grad = compiled_grad(fan_out_fan_in)
+        self.repeated_grad = compiled_grad(repeated_subexpressions)
+        self.chain_grad = compiled_grad(elementwise_chain)
+        self.long_grad(2.)
+        self.fan_grad(2.)
+        self.repeated_grad(onp.ones(100))
+        self.chain_grad(onp.ones((100, 200)))
+
+    def time_long_compiled_grad(self):
+        self.long_grad(2.)
+
+    def time_fan_out_fan_in_compiled_grad(self):
+        self.fan_grad(2.)
+
+    def time_repeated_subexpressions_compiled_grad(self):
+        self.repeated_grad(onp.ones(100))
+
+    def time_elementwise_chain_compiled_grad(self):
+        self.chain_grad(onp.ones((100, 200)))
+
+## DATA PARALLEL MINIBATCH
+mlp_params = [(onp.random.randn(784, 200) * 0.1, onp.zeros(200)),
+              (onp.random.randn(200, 10) * 0.1, onp.zeros(10))]
+mlp_inputs = onp.random.randn(2048, 784)
+mlp_targets = onp.eye(10)[onp.random.randint(10, size=2048)]
+def minibatch_loss(params, inputs, targets):
+    for W, b in params:
+        outputs = np.dot(inputs, W) + b
+        inputs = np.tanh(outputs)
+    return -np.sum((outputs - np.log(np.sum(np.exp(outputs), axis=1, keepdims=True))) * targets)
+
+def time_minibatch_grad():
+    grad(minibatch_loss)(mlp_params, mlp_inputs, mlp_targets)
+
+class DataParallelSuite:
+    """Scales with the number of cores; on a single core it only adds overhead."""
+    def setup(self):
+        self.grad_fn = data_parallel_grad(minibatch_loss, (1, 2), n_workers=None)
+        self.grad_fn(mlp_params, mlp_inputs, mlp_targets)  # Starts the worker pool
+
+    def teardown(self):
+        self.grad_fn.close()
+
+    def time_minibatch_data_parallel_grad(self):
+        self.grad_fn(mlp_params, mlp_inputs, mlp_targets)
+
+## RNN LOOP
+rnn_params = (onp.random.randn(20, 20) * 0.3, onp.zeros(20))
+rnn_inputs = onp.random.randn(500, 20)
+def rnn_step(h, x, params):
+    W, b = params
+    h = np.tanh(np.dot(h, W) + b + x)
+    return h, np.sum(h)
+
+def rnn_unrolled(params, xs):
+    h, ys = onp.zeros(20), []
+    for x in xs:
+        h, y = rnn_step(h, x, params)
+        ys.append(y)
+    return np.sum(h) + np.sum(np.stack(ys) ** 2)
+
+def rnn_scan(params, xs):
+    h, ys = scan(rnn_step, onp.zeros(20), xs, params)
+    return np.sum(h) + np.sum(ys ** 2)
+
+def time_rnn_unrolled_grad():
+    grad(rnn_unrolled)(rnn_params, rnn_inputs)
+
+def time_rnn_scan_grad():
+    grad(rnn_scan)(rnn_params, rnn_inputs)
+
+ode_params = (onp.random.randn(20, 20) * 0.3, onp.zeros(20))
+ode_times = onp.linspace(0., 5., 6)
+def ode_dynamics(y, t, params):
+    W, b = params
+    return np.tanh(np.dot(W, y) + b)
+
+def ode_rk4_unrolled(params, y0, step_size=0.01):
+    ys, y = [y0], y0
+    for t0, t1 in zip(ode_times[:-1], ode_times[1:]):
+        n = int(round((t1 - t0) / step_size))
+        for i in range(n):
+            t = t0 + i * step_size
+            k1 = ode_dynamics(y, t, params)
+            k2 = ode_dynamics(y + step_size / 2 * k1, t + step_size / 2, params)
+            k3 = ode_dynamics(y + step_size / 2 * k2, t + step_size / 2, params)
+            k4 = ode_dynamics(y + step_size * k3, t + step_size, params)
+            y = y + step_size / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        ys.append(y)
+    return np.stack(ys)
+
+def ode_adjoint(params, y0):
+    if odeint is None:
+        return ode_rk4_unrolled(params, y0)
+    return odeint(ode_dynamics, y0, ode_times, params, method='rk4', step_size=0.01)
+
+def time_ode_unrolled_grad():
+    grad(lambda params: np.sum(ode_rk4_unrolled(params, onp.ones(20)) ** 2))(ode_params)
+
+def time_ode_adjoint_grad():
+    grad(lambda params: np.sum(ode_adjoint(params, onp.ones(20)) ** 2))(ode_params)
+
+## JACOBIAN
+jac_W = onp.random.randn(50, 50)
+def f_jac(x):
+    return np.tanh(np.dot(jac_W, np.sin(x))) * x
+
+def time_jacobian():
+    jacobian(f_jac)(onp.random.randn(50))
+
+tall_W = onp.random.randn(500, 5)
+def f_tall(x):
+    return np.tanh(np.dot(tall_W, np.sin(x))) * np.sum(x)
+
+def time_jacobian_tall():
+    jacobian(f_tall)(onp.random.randn(5))
+
+def time_jacobian_fwd_tall():
+    jacobian_fwd(f_tall)(onp.random.randn(5))
+
+hess_W = onp.random.randn(20, 200)
+def f_hess(x):
+    return np.sum(np.tanh(np.dot(hess_W, x)) ** 2) + np.sum(x ** 4)
+
+def time_hessian():
+    hessian(f_hess)(onp.random.randn(200))
+
+jvp_x = onp.random.randn(50)
+jvp_vs = onp.random.randn(20, 50)
+def time_repeated_make_jvp():
+    jvp = make_jvp(f_jac)(jvp_x)
+    for v in jvp_vs:
+        jvp(v)
+
+def time_repeated_linearize_jvp():
+    _, jvp = linearize(f_jac)(jvp_x)
+    for v in jvp_vs:
+        jvp(v)
+
 ## UNIT BENCHMARKS
 def time_vspace_float():
     vspace(1.)
@@ -110,6 +311,21 @@ def time_exp_primitive_call_boxed():
     else:
         np.exp(start_box)
 
+def time_add_call():
+    onp.add(2., 3.)
+
+def time_add_primitive_call_boxed():
+    if MASTER_BRANCH:
+        np.add(progenitor, 3.)
+    else:
+        np.add(start_box, 3.)
+
+def time_add_primitive_call_both_boxed():
+    if MASTER_BRANCH:
+        np.add(progenitor, progenitor)
+    else:
+        np.add(start_box, start_box)
+
 def time_no_autograd_control():
     # Test whether the benchmarking machine is running slowly independent of autograd
     A = np.random.randn(200, 200)
@@ -122,8 +338,8 @@ if MASTER_BRANCH:
     progenitor = new_progenitor(2.)
 else:
     x = 2.
-    start_node = VJPNode.new_root(x)
+    start_node = VJPNode.new_root()
     start_box = new_box(x, 0, start_node)
-    _, short_end_node = trace(VJPNode.new_root(x), f_short, x)
-    _, long_end_node  = trace(VJPNode.new_root(x), f_long, x)
-    _, fan_end_node   = trace(VJPNode.new_root(x), fan_out_fan_in, x)
+    _, short_end_node = trace(VJPNode.new_root(), f_short, x)
+    _, long_end_node  = trace(VJPNode.new_root(), f_long, x)
+    _, fan_end_node   = trace(VJPNode.new_root(), fan_out_fan_in, x)
@@ -9,3 +9,48 @@ def peakmem_needless_nodes():
         return np.sum(x)
 
     grad(fun)(np.zeros((N, N)))
+
+try:
+    from autograd.misc import checkpointed_loop
+except ImportError:
+    checkpointed_loop = None
+try:
+    from autograd.misc import odeint
+except ImportError:
+    odeint = None
+
+def diffusion_step(x):
+    return np.tanh(x + 0.1 * (np.roll(x, 1, axis=0) + np.roll(x, -1, axis=0) - 2 * x))
+
+def peakmem_unrolled_loop():
+    def fun(x):
+        for i in range(200):
+            x = diffusion_step(x)
+        return np.sum(x ** 2)
+    grad(fun)(np.ones((500, 500)))
+
+def peakmem_checkpointed_loop():
+    loop = checkpointed_loop(diffusion_step, 200, memory_budget=10 * 500 * 500 * 8)
+    grad(lambda x: np.sum(loop(x) ** 2))(np.ones((500, 500)))
+
+def heat_dynamics(y, t, params):
+    return params * (np.roll(y, 1, axis=0) + np.roll(y, -1, axis=0) - 2 * y)
+
+def peakmem_unrolled_rk4():
+    def fun(c):
+        y, h = np.ones((300, 300)), 0.01
+        for i in range(100):
+            k1 = heat_dynamics(y, 0., c)
+            k2 = heat_dynamics(y + h / 2 * k1, 0., c)
+            k3 = heat_dynamics(y + h / 2 * k2, 0., c)
+            k4 = heat_dynamics(y + h * k3, 0., c)
+            y = y + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        return np.sum(y ** 2)
+    grad(fun)(1.)
+
+def peakmem_adjoint_odeint():
+    def fun(c):
+        ys = odeint(heat_dynamics, np.ones((300, 300)), [0., 1.], c,
+                    method='rk4', step_size=0.01)
+        return np.sum(ys[-1] ** 2)
+    grad(fun)(1.)
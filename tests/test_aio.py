@@ -0,0 +1,71 @@
+from __future__ import absolute_import
+import threading
+import autograd.numpy as np
+import autograd.numpy.random as npr
+from autograd import grad, value_and_grad, jacobian
+from autograd.test_util import check_equivalent
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    from warnings import warn
+    warn('Skipping asyncio tests.')
+else:
+    from autograd import aio
+
+    def run(awaitables):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            return loop.run_until_complete(asyncio.gather(*awaitables()))
+        finally:
+            loop.close()
+
+    def fun(x, y):
+        return np.sum(np.tanh(np.dot(x, y)) ** 2)
+
+    def test_aio_operators():
+        x, y = npr.randn(3, 4), npr.randn(4)
+        results = run(lambda: [aio.grad(fun)(x, y), aio.value_and_grad(fun, 1)(x, y),
+                               aio.jacobian(np.tanh)(y), aio.jacobian(np.tanh, mode='fwd')(y)])
+        check_equivalent(results[0], grad(fun)(x, y))
+        check_equivalent(results[1], value_and_grad(fun, 1)(x, y))
+        check_equivalent(results[2], jacobian(np.tanh)(y))
+        check_equivalent(results[3], jacobian(np.tanh)(y))
+        assert aio.grad(fun).__name__ == 'grad_of_fun_wrt_argnum_0'
+
+    def test_aio_cancel():
+        started, release = threading.Event(), threading.Event()
+        reached = []
+        def blocking_fun(x):
+            y = np.sin(x)
+            started.set()
+            release.wait()
+            y = np.cos(y)
+            reached.append(True)
+            return y
+        executor = ThreadPoolExecutor(1)
+        def cancel_while_running():
+            future = aio.grad(blocking_fun, executor=executor)(1.)
+            loop = asyncio.get_event_loop()
+            loop.run_in_executor(None, started.wait).add_done_callback(
+                lambda _: future.cancel())
+            return future
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            future = cancel_while_running()
+            try:
+                loop.run_until_complete(future)
+            except asyncio.CancelledError:
+                pass
+            assert future.cancelled()
+            release.set()
+            # The worker stops at the next primitive and is usable afterwards
+            check_equivalent(loop.run_until_complete(aio.grad(np.sin, executor=executor)(1.)),
+                             np.cos(1.))
+        finally:
+            loop.close()
+            executor.shutdown()
+        assert not reached
@@ -0,0 +1,147 @@
+import warnings
+import autograd.numpy as np
+import autograd.numpy.random as npr
+from autograd import grad, value_and_grad
+from autograd.test_util import check_equivalent
+from autograd.extend import primitive, defvjp
+from autograd.misc import compiled_grad, compiled_value_and_grad
+from autograd.misc.compiled import FusedChain
+
+npr.seed(0)
+
+def test_compiled_grad_matches_grad():
+    def fun(W, b, x):
+        h = np.tanh(np.dot(x, W) + b)
+        return np.sum(h**2) + np.sum(np.sin(W))
+    W, b, x = npr.randn(3, 4), npr.randn(4), npr.randn(5, 3)
+    for argnum in [0, 1, 2]:
+        compiled = compiled_grad(fun, argnum)
+        check_equivalent(compiled(W, b, x), grad(fun, argnum)(W, b, x))
+        check_equivalent(compiled(W, b, x), grad(fun, argnum)(W, b, x))
+
+def test_compiled_grad_traces_once_per_signature():
+    L = []
+    @primitive
+    def record(x):
+        L.append(None)
+        return x
+    defvjp(record, lambda ans, x: lambda g: g)
+    def fun(x, y):
+        return np.sum(record(x) * y)
+
+    gradfun = compiled_grad(fun)
+    x, y = npr.randn(3), npr.randn(3)
+    check_equivalent(gradfun(x, y), y)
+    num_calls = len(L)
+    y2 = npr.randn(3)
+    check_equivalent(gradfun(x, y2), y2)
+    assert len(L) == num_calls + 1  # replay calls the primitive, no retrace
+    check_equivalent(gradfun(npr.randn(4), np.ones(4)), np.ones(4))
+    assert len(gradfun.__name__) > 0
+
+def test_compiled_value_and_grad():
+    fun = lambda x, y: np.sum(np.exp(x) * y) + y[0]
+    x, y = npr.randn(4), npr.randn(4)
+    val, (gx, gy) = compiled_value_and_grad(fun, (0, 1))(x, y)
+    check_equivalent(val, fun(x, y))
+    check_equivalent(gx, grad(fun, 0)(x, y))
+    check_equivalent(gy, grad(fun, 1)(x, y))
+
+def test_compiled_grad_containers_and_fanout():
+    def fun(params, x):
+        W, b = params
+        y = np.dot(x, W) + b
+        return np.sum(y * y) + np.sum(y)
+    params = [npr.randn(2, 2), npr.randn(2)]
+    x = npr.randn(3, 2)
+    compiled = compiled_grad(fun)
+    for _ in range(2):
+        for a, b in zip(compiled(params, x), grad(fun)(params, x)):
+            check_equivalent(a, b)
+
+def test_compiled_grad_independent_output():
+    with warnings.catch_warnings(record=True):
+        check_equivalent(compiled_grad(lambda x: 1.0)(npr.randn(3)), np.zeros(3))
+
+def test_compiled_grad_nested():
+    def fun(x):
+        return np.sum(compiled_grad(lambda y: np.sum(np.sin(y) * y))(x))
+    x = npr.randn(3)
+    check_equivalent(grad(fun)(x),
+                     grad(lambda x: np.sum(grad(lambda y: np.sum(np.sin(y) * y))(x)))(x))
+
+def test_compiled_grad_nondifferentiable_primitives():
+    def fun(x):
+        return np.sum(np.where(x > 0, x, 0.) * np.floor(x))
+    x = npr.randn(5) * 3
+    check_equivalent(compiled_grad(fun)(x), grad(fun)(x))
+
+def test_compiled_grad_replays_nondifferentiable_primitives():
+    fun = lambda x: np.sum(np.where(x > 0, x**2, -x)) + x[np.argmax(x)] * np.floor(x[0])
+    compiled = compiled_grad(fun)
+    x = np.array([1., 2., -3.])
+    for y in [x, -x, x]:
+        check_equivalent(compiled(y), grad(fun)(y))
+    assert len(compiled.programs) == 1
+    scaled = lambda x, scale=1.: np.sum(np.sin(x) * scale)
+    compiled = compiled_grad(scaled)
+    for scale in [np.ones(3), 2 * np.ones(3)]:
+        check_equivalent(compiled(x, scale=scale), grad(scaled)(x, scale=scale))
+    assert len(compiled.programs) == 1
+
+def test_compiled_grad_only_keeps_declared_residuals():
+    import weakref
+    refs = []
+    @primitive
+    def track(x):
+        refs.append(weakref.ref(x))
+        return x
+    defvjp(track, lambda ans, x: lambda g: g, residuals=[()])
+    @primitive
+    def check_freed(x):
+        return x
+    def check_freed_vjp(ans, x):
+        def vjp(g):
+            assert refs[-1]() is None
+            return g
+        return vjp
+    defvjp(check_freed, check_freed_vjp, residuals=[()])
+    def fun(x):
+        return np.sum(check_freed(track(np.sin(x)) + 1.))
+    gradfun = compiled_grad(fun)
+    x = npr.randn(3)
+    gradfun(x)
+    check_equivalent(gradfun(x), np.cos(x))
+
+def test_compiled_grad_merges_duplicates_and_drops_dead_calls():
+    W = npr.randn(3, 3)
+    def fun(x):
+        unused = np.exp(x) * 2.
+        a = np.cos(x[:2]) * np.dot(W, x)[:2]
+        b = np.cos(x[:2]) * np.dot(W, x)[:2]
+        return np.sum(a + b + np.tanh(x[:2]))
+    gradfun = compiled_grad(fun)
+    x = npr.randn(3)
+    check_equivalent(gradfun(x), grad(fun)(x))
+    check_equivalent(gradfun(x + 1.), grad(fun)(x + 1.))
+    report, = [program.report for program in gradfun.programs.values()]
+    assert report.num_duplicates == 6
+    assert report.num_dead == 2
+
+def test_compiled_grad_fuses_elementwise_chains():
+    def fun(x, y):
+        z = np.tanh(x * 2. + y) - 3.
+        return np.sum(np.exp(z) * z)
+    gradfun = compiled_grad(fun, argnum=(0, 1))
+    x, y = npr.randn(4), npr.randn(4)
+    for _ in range(2):
+        check_equivalent(gradfun(x, y), grad(fun, argnum=(0, 1))(x, y))
+    program, = gradfun.programs.values()
+    assert program.report.num_fused == 4
+    fused = [fun for _, fun, _, _, _, _, _ in program.instructions
+             if type(fun) is FusedChain]
+    assert [[step[-1] for step in chain.steps] for chain in fused] \
+        == [[False, True, False, True], [False, False]]
+    nested = lambda x: np.sum(gradfun(x, y)[0] ** 2)
+    check_equivalent(grad(nested)(x),
+                     grad(lambda x: np.sum(grad(fun)(x, y) ** 2))(x))
@@ -174,3 +174,151 @@ def test_assignment_raises_error():
 # Taking grad again after returning const
 # Empty functions
 # 2nd derivatives with fanout, thinking about the outgrad adder
+
+def test_grad_frees_intermediates_during_backward_pass():
+    import weakref
+    from autograd.extend import primitive, defvjp
+    refs = []
+
+    @primitive
+    def track(x):
+        refs.append(weakref.ref(x))
+        return x
+    defvjp(track, lambda ans, x: lambda g: g)
+
+    @primitive
+    def check_freed(x):
+        return x
+    def check_freed_vjp(ans, x):
+        def vjp(g):
+            assert refs[0]() is None
+            return g
+        return vjp
+    defvjp(check_freed, check_freed_vjp)
+
+    def fun(x):
+        z = track(np.exp(check_freed(x)))
+        return np.sum(np.sin(z))
+    grad(fun)(npr.randn(5))
+
+@raises(RuntimeError)
+def test_consumed_vjp_can_only_be_called_once():
+    from autograd.core import make_vjp
+    vjp, ans = make_vjp(lambda x: np.sin(x) * x, npr.randn(3), consume=True)
+    vjp(np.ones(3))
+    vjp(np.ones(3))
+
+def test_declared_residuals_replace_unneeded_values():
+    import autograd.core as core
+    from autograd.extend import primitive, defvjp
+    received = []
+
+    @primitive
+    def scale(x, c):
+        return c * x
+    def scale_vjp(ans, x, c):
+        received.append((ans, x))
+        return lambda g: c * g
+    defvjp(scale, scale_vjp, residuals=[(1,)])
+
+    x = npr.randn(4)
+    check_residuals, core.check_residuals = core.check_residuals, False
+    try:
+        assert np.allclose(grad(lambda x: np.sum(scale(x, 3.)))(x), 3.)
+    finally:
+        core.check_residuals = check_residuals
+    ans, x_placeholder = received[0]
+    assert ans.shape == x_placeholder.shape == x.shape
+    assert ans.strides == x_placeholder.strides == (0,)
+    check_grads(lambda x: np.sum(scale(x, 3.)), modes=['rev'])(x)
+
+def test_declared_residuals_agree_with_all_values():
+    # Reruns the numerical tests with every declared VJP also given the
+    # placeholders, which raises ResidualsError if the ingrads differ.
+    import importlib
+    import autograd.core as core
+    checked = []
+    checked_vjpmaker = core.checked_vjpmaker
+    def recording_vjpmaker(fun, *args):
+        checked.append(fun)
+        return checked_vjpmaker(fun, *args)
+    state = npr.get_state()
+    core.check_residuals, core.checked_vjpmaker = True, recording_vjpmaker
+    try:
+        for name in ['test_systematic', 'test_numpy', 'test_scalar_ops', 'test_linalg',
+                     'test_scipy', 'test_fft', 'test_binary_ops', 'test_complex']:
+            module = importlib.import_module(name)
+            for test_name in dir(module):
+                if test_name.startswith('test_'):
+                    getattr(module, test_name)()
+        x = npr.randn(3)
+        check_grads(lambda x: np.broadcast_to(np.conjugate(x[None]), (2, 3)), modes=['rev'])(x)
+        check_grads(lambda x: np.full((2, 3), x[0]) * x, modes=['rev'])(x)
+    finally:
+        core.check_residuals, core.checked_vjpmaker = False, checked_vjpmaker
+        npr.set_state(state)
+    declared = {fun for fun, needed in core.primitive_residuals.items()
+                if needed is not None
+                and not (getattr(fun.fun, '__module__', None) or '').startswith('test_')}
+    assert declared <= set(checked)
+
+def test_undeclared_residuals_fail_loudly():
+    import autograd.core as core
+    from autograd.extend import primitive, defvjp
+
+    @primitive
+    def scale(x, c):
+        return c * x
+    defvjp(scale, lambda ans, x, c: lambda g: c * g * x / x, residuals=[(1,)])
+
+    x = npr.randn(4)
+    f = lambda x: np.sum(scale(x, 3.))
+    check_residuals, core.check_residuals = core.check_residuals, False
+    try:
+        assert np.all(np.isnan(grad(f)(x)))
+        core.check_residuals = True
+        try:
+            grad(f)(x)
+        except core.ResidualsError as e:
+            assert 'scale' in str(e)
+        else:
+            assert False, "Expected ResidualsError"
+    finally:
+        core.check_residuals = check_residuals
+
+def test_vjps_are_built_only_when_reached():
+    from autograd.extend import primitive, defvjp
+    from autograd.core import make_vjp
+    from autograd import profile
+    built = []
+
+    @primitive
+    def double(x):
+        return 2 * x
+    def double_vjp(ans, x):
+        built.append(x)
+        return lambda g: 2 * g
+    defvjp(double, double_vjp)
+
+    def fun(x):
+        unused = double(x)
+        return np.sum(double(np.sin(x)))
+    vjp, ans = make_vjp(fun, npr.randn(3))
+    assert not built
+    vjp(1.)
+    assert len(built) == 1
+    vjp(2.)  # A non-consuming vjp reuses the VJPs it built
+    assert len(built) == 1
+    with profile():
+        vjp(3.)
+    assert len(built) == 1
+
+def test_binary_primitives_across_nested_traces():
+    # Exercises the fast dispatch paths for each combination of trace levels.
+    f = lambda x, y: np.sin(x) * np.cos(y) + np.multiply(y, x)
+    check_grads(f, modes=['rev', 'fwd'], order=2)(0.7, 1.3)
+    outer_inner = lambda x: grad(lambda y: f(x, y))(1.3)
+    inner_outer = lambda y: grad(lambda x: f(x, y))(0.7)
+    check_grads(outer_inner, modes=['rev'])(0.7)
+    check_grads(inner_outer, modes=['rev'])(1.3)
+    check_grads(lambda x: np.sum(np.sum(x, axis=0) ** 2), modes=['rev'])(npr.randn(3, 2))
@@ -41,3 +41,93 @@ def test_jacobian_higher_order():
 
     check_grads(lambda x: np.sum(np.sin(jacobian(fun)(x))))(npr.randn(2))
     check_grads(lambda x: np.sum(np.sin(jacobian(jacobian(fun))(x))))(npr.randn(2))
+
+def test_batched_vjp_matches_vjp():
+    from autograd import make_vjp, make_batched_vjp
+    A, B = npr.randn(3, 4), npr.randn(4)
+    funs = [
+        lambda x: np.sin(x) * B + np.exp(x) / 2.,
+        lambda x: np.maximum(x, 0.3) - np.reshape(np.sum(x, axis=0), (1, 4)) ** 2,
+        lambda x: np.mean(x, axis=(0, 1)) * np.transpose(x),
+        lambda x: np.dot(x, B) + np.dot(A, x.T)[0],
+        lambda x: np.tensordot(A, x, 2) + np.tensordot(x, B, 1)[1:],
+        lambda x: np.array([x[0, 1], x[2, 3] ** 2, np.sum(x[:, 1:])]),
+        lambda x: np.ravel(np.cumsum(x, axis=1)),
+    ]
+    x = npr.randn(3, 4)
+    for fun in funs:
+        vjp, ans = make_vjp(fun)(x)
+        batched_vjp, batched_ans = make_batched_vjp(fun)(x)
+        G = npr.randn(5, *np.shape(ans))
+        assert np.allclose(ans, batched_ans)
+        assert np.allclose(batched_vjp(G), np.stack([vjp(g) for g in G]))
+
+def test_hessian_through_batched_vjps():
+    from autograd import hessian
+    fun = lambda x: np.sum(np.tanh(np.dot(x, x)) * x ** 3) + np.mean(x[1:] / x[0])
+    H = hessian(fun)(npr.randn(3))
+    assert np.allclose(H, H.T)
+    check_grads(lambda x: np.sum(jacobian(jacobian(fun))(x)))(npr.randn(3))
+
+def test_jacobian_fwd_matches_jacobian():
+    from autograd import jacobian_fwd
+    A, B = npr.randn(3, 4), npr.randn(4)
+    funs = [
+        lambda x: np.sin(x) * B + np.exp(x) / 2.,
+        lambda x: np.maximum(x, 0.3) - np.reshape(np.sum(x, axis=0), (1, 4)) ** 2,
+        lambda x: np.mean(x, axis=(0, 1)) * np.transpose(x),
+        lambda x: np.dot(x, B) + np.dot(A, x.T)[0],
+        lambda x: np.tensordot(A, x, 2) + np.tensordot(x, B, 1)[1:],
+        lambda x: np.array([x[0, 1], x[2, 3] ** 2, np.sum(x[:, 1:])]),
+        lambda x: np.ravel(np.cumsum(x, axis=1)) + np.sqrt(np.sum(x**2)),
+    ]
+    x = npr.randn(3, 4)
+    for fun in funs:
+        assert np.allclose(jacobian_fwd(fun)(x), jacobian(fun)(x))
+
+def test_jacobian_fwd_scalar_input():
+    from autograd import jacobian_fwd
+    fun = lambda x: np.array([x, x**2, np.sin(x)])
+    val = npr.randn()
+    assert np.allclose(jacobian_fwd(fun)(val), np.array([1., 2*val, np.cos(val)]))
+
+def test_batched_jvp_matches_jvp():
+    from autograd import make_jvp, make_batched_jvp
+    A = npr.randn(6, 4)
+    fun = lambda x: np.tanh(np.dot(A, x))[::2]
+    x, V = npr.randn(4), npr.randn(3, 4)
+    ans, batched = make_batched_jvp(fun)(x)(V)
+    assert np.allclose(batched, np.stack([make_jvp(fun)(x)(v)[1] for v in V]))
+
+def test_jacobian_split_advanced_indices():
+    # Advanced indices separated by a slice put their axes first in numpy
+    x = np.arange(24.).reshape(2, 3, 4)
+    for idx in [([0, 1], slice(None), [1, 2]), (0, slice(None), [1, 2]),
+                (np.array([[0], [1]]), slice(1, 3), np.array([[1, 2, 3]])),
+                ([0, 1], slice(None), x[0, 0] > 1)]:
+        fun = lambda x: np.sin(x[idx])
+        expected = np.stack([grad(lambda x: fun(x)[i])(x)
+                             for i in np.ndindex(*fun(x).shape)])
+        expected = expected.reshape(fun(x).shape + x.shape)
+        assert np.allclose(jacobian(fun)(x), expected)
+        assert np.allclose(jacobian(fun, mode='fwd')(x), expected)
+
+def test_jacobian_auto_mode():
+    from autograd.extend import primitive, defvjp, BatchedJVPNode
+    from nose.tools import assert_raises
+    @primitive
+    def vjp_only(x):
+        return 2 * x
+    defvjp(vjp_only, lambda ans, x: lambda g: 2 * g)
+    x = npr.randn(3)
+    wide = lambda x: np.outer(np.sin(x), x)
+    narrow = lambda x: np.sum(vjp_only(x) ** 2, keepdims=True)
+    for fun in [wide, narrow, lambda x: np.outer(vjp_only(x), x)]:
+        assert np.allclose(jacobian(fun, mode='auto')(x), jacobian(fun)(x))
+    def fails_in_forward_mode(x):
+        if isinstance(getattr(x, '_node', None), BatchedJVPNode):
+            raise NotImplementedError("raised by fun")
+        return wide(x)
+    # Only a missing JVP makes it fall back to reverse mode
+    with assert_raises(NotImplementedError):
+        jacobian(fails_in_forward_mode, mode='auto')(x)
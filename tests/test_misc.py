@@ -102,3 +102,196 @@ def test_flatten_complex():
     val = 1 + 1j
     flat, unflatten = flatten(val)
     assert np.all(val == unflatten(flat))
+
+def minibatch_loss(params, inputs, targets, scale):
+    preds = np.tanh(np.dot(inputs, params['W']) + params['b'][0])
+    return scale * np.sum((preds - targets)**2)
+
+def test_data_parallel_grad():
+    from autograd.misc import data_parallel_grad
+    params = {'W': npr.randn(3, 2), 'b': [npr.randn(2)]}
+    inputs, targets = npr.randn(11, 3), npr.randn(11, 2)
+    expected = grad(minibatch_loss)(params, inputs, targets, 0.5)
+    grad_fun = data_parallel_grad(minibatch_loss, (1, 2), n_workers=3)
+    try:
+        for _ in range(2):
+            g = grad_fun(params, inputs, targets, scale=0.5)
+            assert np.allclose(g['W'], expected['W'])
+            assert np.allclose(g['b'][0], expected['b'][0])
+        g = grad_fun(params, inputs[:2], targets[:2], scale=0.5)
+        assert np.allclose(g['W'], grad(minibatch_loss)(params, inputs[:2], targets[:2], 0.5)['W'])
+    finally:
+        grad_fun.close()
+
+def rnn_step(h, x, params):
+    W, b = params
+    h = np.tanh(np.dot(h, W) + b + x)
+    return h, np.sum(h ** 2)
+
+def test_scan():
+    from autograd.misc import scan
+    from autograd.test_util import check_grads
+    def rnn_scan(h, xs, W, b):
+        h, ys = scan(rnn_step, h, xs, (W, b))
+        return np.sum(h) + np.sum(np.sin(ys))
+    def rnn_unrolled(h, xs, W, b):
+        ys = []
+        for x in xs:
+            h, y = rnn_step(h, x, (W, b))
+            ys.append(y)
+        return np.sum(h) + np.sum(np.sin(np.array(ys)))
+    args = (npr.randn(3), npr.randn(5, 3), 0.5 * npr.randn(3, 3), npr.randn(3))
+    for argnum in range(4):
+        assert np.allclose(grad(rnn_scan, argnum)(*args), grad(rnn_unrolled, argnum)(*args))
+    check_grads(rnn_scan, modes=['fwd', 'rev'], order=2)(*args)
+
+def test_scan_is_one_node():
+    from autograd.misc import scan
+    from autograd import profile, make_vjp
+    def step(carry, x, params):
+        h, (c,) = carry
+        h = np.tanh(np.dot(h, params['W'][0]) + params['b'] + x)
+        return (h, [c + h]), np.sum(h)
+    def fun(W, h, xs, b):
+        (h, [c]), ys = scan(step, (h, [h]), xs, {'W': (W,), 'b': b})
+        return np.sum(c) + np.sum(ys)
+    rs = npr.RandomState(0)
+    args = (rs.randn(3, 3), rs.randn(3), rs.randn(5, 3), rs.randn(3))
+    for argnum in range(4):
+        with profile() as prof:
+            make_vjp(fun, argnum)(*args)
+        assert prof.stats['scan_loop']['forward_calls'] == 1
+        assert 'tanh' not in prof.stats
+
+def test_scan_empty():
+    from autograd.misc import scan
+    step = lambda h, x: (h * x, np.outer(h, x))
+    h, xs = npr.RandomState(0).randn(3), np.zeros((0, 3))
+    assert scan(step, h, xs)[1].shape == (0, 3, 3)
+    fun = lambda h, xs: np.sum(scan(step, h, xs)[0])
+    assert np.allclose(grad(fun, 0)(h, xs), np.ones(3))
+    assert grad(fun, 1)(h, xs).shape == (0, 3)
+
+def test_fori_loop():
+    from autograd.misc import fori_loop
+    from autograd.test_util import check_grads
+    def body(i, carry, W):
+        h, c = carry
+        return np.tanh(np.dot(W, h) * i), c * 2.
+    fun = lambda h, W: np.sum(fori_loop(1, 4, body, (h, h), W)[0])
+    check_grads(fun, modes=['fwd', 'rev'], order=2)(npr.randn(3), npr.randn(3, 3))
+
+def test_checkpointed_loop():
+    from autograd.misc import checkpointed_loop
+    from autograd.test_util import check_grads
+    step = lambda h, W: np.tanh(np.dot(W, h))
+    def unrolled(h, W, n_steps):
+        for _ in range(n_steps):
+            h = step(h, W)
+        return np.sum(h)
+    h, W = npr.randn(4), 0.4 * npr.randn(4, 4)
+    expected = grad(unrolled, (0, 1))(h, W, 50)
+    factors = []
+    for n_carries in [0, 1, 3, 49]:
+        loop = checkpointed_loop(step, 50, memory_budget=n_carries * h.nbytes)
+        g = grad(lambda h, W: np.sum(loop(h, W)), (0, 1))(h, W)
+        assert np.allclose(g[0], expected[0]) and np.allclose(g[1], expected[1])
+        assert loop.stats['checkpoints'] == n_carries
+        assert loop.stats['peak_bytes'] == n_carries * h.nbytes
+        factors.append(loop.stats['recompute_factor'])
+    assert factors == sorted(factors, reverse=True) and np.isclose(factors[-1], 99. / 50)
+    loop = checkpointed_loop(step, 6, memory_budget=2 * h.nbytes)
+    check_grads(lambda h, W: np.sum(loop(h, W)), modes=['fwd', 'rev'], order=2)(h, W)
+
+def test_revolve_split_is_optimal():
+    from autograd.misc.loops import revolve_split
+    def cost(steps, snaps):
+        # Iterations advanced to reverse `steps`, with `snaps` free checkpoints
+        if steps == 1:
+            return 0
+        elif snaps == 0:
+            return steps * (steps - 1) // 2
+        split = revolve_split(steps, snaps + 1)
+        return split + cost(steps - split, snaps - 1) + cost(split, snaps)
+    optimal = {}
+    for snaps in range(4):
+        for steps in range(1, 40):
+            if steps == 1 or snaps == 0:
+                optimal[steps, snaps] = cost(steps, snaps)
+            else:
+                optimal[steps, snaps] = min(m + optimal[steps - m, snaps - 1] + optimal[m, snaps]
+                                            for m in range(1, steps))
+            assert cost(steps, snaps) == optimal[steps, snaps]
+
+def test_fixed_point():
+    from autograd import jacobian
+    from autograd.misc.fixed_points import fixed_point
+    from autograd.test_util import check_grads
+    W = 0.9 * npr.RandomState(0).randn(6, 6) / np.sqrt(6)
+    f = lambda params: lambda z: np.tanh(np.dot(params[0], z) + params[1])
+    distance = lambda x, y: np.sqrt(np.sum((x - y) ** 2))
+    def equilibrium(b, solver, W=W):
+        return fixed_point(f, (W, b), np.zeros(6), distance, 1e-12, solver=solver)
+    b = npr.randn(6)
+    expected = jacobian(lambda b: equilibrium(b, 'iterate'), mode='rev')(b)
+    assert np.allclose(jacobian(lambda b: equilibrium(b, 'gmres'), mode='rev')(b), expected)
+    assert np.allclose(jacobian(lambda b: equilibrium(b, 'gmres'), mode='fwd')(b), expected)
+    loss = lambda W, b: np.sum(equilibrium(b, 'gmres', W) ** 2)
+    check_grads(loss, modes=['fwd', 'rev'], order=2)(W, b)
+
+def test_gmres():
+    import warnings
+    from autograd.core import vspace
+    from autograd.misc.fixed_points import gmres
+    rs = npr.RandomState(0)
+    A = 0.3 * (rs.randn(6, 6) + 1j * rs.randn(6, 6))
+    b = rs.randn(6) + 1j * rs.randn(6)
+    # Non-holomorphic derivatives are only linear over the reals
+    for matvec in [lambda u: u - np.dot(A, u), lambda u: u - np.conj(np.dot(A, u))]:
+        assert np.allclose(matvec(gmres(matvec, b, vspace(b), 1e-12)), b)
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        gmres(lambda u: u - 3 * np.roll(u, 1), rs.randn(40), None, 1e-12,
+              restart=2, max_restarts=2)
+    assert any('did not converge' in str(warning.message) for warning in w)
+
+def test_odeint():
+    from autograd.misc import odeint
+    from autograd.test_util import check_grads
+    rs = npr.RandomState(0)
+    W, y0, b = 0.5 * rs.randn(3, 3), rs.randn(3), rs.randn(3)
+    def f(y, t, params):
+        W, b = params
+        return np.tanh(np.dot(W, y) + b * np.sin(t))
+    def rk4(y0, t, params, n=100):
+        ys, y = [y0], y0
+        for t0, t1 in zip(t[:-1], t[1:]):
+            h = (t1 - t0) / n
+            for i in range(n):
+                s = t0 + i * h
+                k1 = f(y, s, params)
+                k2 = f(y + h / 2 * k1, s + h / 2, params)
+                k3 = f(y + h / 2 * k2, s + h / 2, params)
+                k4 = f(y + h * k3, s + h, params)
+                y = y + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            ys.append(y)
+        return np.stack(ys)
+    t = np.array([0., 0.5, 1.3, 2.])
+    loss = lambda ys: np.sum(ys ** 2) + np.sum(ys[1])
+    expected = grad(lambda *args: loss(rk4(args[0], args[1], args[2:])), (0, 1, 2, 3))(y0, t, W, b)
+    L = lambda *args: loss(odeint(f, args[0], args[1], args[2:], rtol=1e-10, atol=1e-12))
+    for g, g_expected in zip(grad(L, (0, 1, 2, 3))(y0, t, W, b), expected):
+        assert np.allclose(g, g_expected)
+    # The adjoint gradient of a fixed-step solution is only exact as the step
+    # size goes to zero, so the step has to be small for check_grads.
+    L = lambda y0, W: loss(odeint(f, y0, t, (W, b), method='rk4', step_size=0.02))
+    check_grads(L, modes=['rev'], order=2)(y0, W)
+    assert np.allclose(odeint(lambda y, t, p: -y, 1., [0., 1.]), [1., np.exp(-1)])
+
+def test_odeint_fails_loudly():
+    from autograd.misc import odeint
+    from nose.tools import assert_raises
+    for f in [lambda y, t, p: y ** 2,  # Blows up at t = 1
+              lambda y, t, p: np.nan * y,
+              lambda y, t, p: -1e7 * (y - np.cos(t))]:  # Stiff
+        assert_raises(RuntimeError, odeint, f, np.ones(2), [0., 2.], max_steps=2000)
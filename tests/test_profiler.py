@@ -0,0 +1,113 @@
+from __future__ import absolute_import
+import json
+import os
+import tempfile
+import autograd.numpy as np
+import autograd.numpy.random as npr
+from autograd import grad, jacobian, hessian, profile
+from autograd.core import make_vjp, make_tape_vjp
+from autograd.tracer import trace_stack
+from autograd.test_util import check_equivalent
+from concurrent.futures import ThreadPoolExecutor
+
+W = npr.randn(5, 5)
+def fun(x):
+    for i in range(3):
+        x = np.tanh(np.dot(W, x)) + x
+    return np.sum(x ** 2)
+
+def test_profile_counts():
+    x = npr.randn(5)
+    with profile() as prof:
+        g = grad(fun)(x)
+    assert trace_stack.profiler is None
+    check_equivalent(g, grad(fun)(x))
+    for name, calls in [('dot', 3), ('tanh', 3), ('add', 3), ('power', 1), ('sum', 1)]:
+        assert prof.stats[name]['forward_calls'] == calls
+        assert prof.stats[name]['backward_calls'] == calls
+        assert prof.stats[name]['forward_bytes'] > 0
+    assert prof.stats['(add_outgrads)']['backward_calls'] > 0
+    assert all(stats['forward_time'] >= 0 for stats in prof.stats.values())
+    lines = prof.summary().splitlines()
+    assert lines[0].split()[0] == 'primitive' and len(lines) == len(prof.stats) + 2
+    assert len(prof.summary(limit=2).splitlines()) == 4
+
+def test_profile_nested():
+    x = npr.randn(5)
+    with profile() as outer:
+        with profile() as inner:
+            grad(fun)(x)
+        assert trace_stack.profiler is outer
+        grad(fun)(x)
+    assert inner.stats['dot']['forward_calls'] == 3
+    assert outer.stats['dot']['forward_calls'] == 3
+
+def test_profile_second_order():
+    x = npr.randn(5)
+    second = lambda x: np.sum(grad(fun)(x))
+    with profile() as prof:
+        g = grad(second)(x)
+    check_equivalent(g, grad(second)(x))
+    # The first-order backward pass is traced, so its VJPs' primitives show up too
+    assert prof.stats['dot']['forward_calls'] > 3
+
+def test_profile_parallel_backward_pass():
+    x = npr.randn(5)
+    executor = ThreadPoolExecutor(2)
+    try:
+        with profile() as prof:
+            vjp, _ = make_vjp(fun, x, executor=executor)
+            g = vjp(1.)
+    finally:
+        executor.shutdown()
+    check_equivalent(g, grad(fun)(x))
+    assert prof.stats['dot']['backward_calls'] == 3
+
+def test_profile_tape_backward_pass():
+    x = npr.randn(5)
+    with profile() as prof:
+        vjp, _ = make_tape_vjp(fun, x)
+        g = vjp(1.)
+    check_equivalent(g, grad(fun)(x))
+    assert prof.stats['dot']['backward_calls'] == 3
+    vjp(1.)
+    assert prof.stats['dot']['backward_calls'] == 3
+
+def test_profile_names_go_with_nodes():
+    x = npr.randn(5)
+    with profile() as prof:
+        vjps = [make_vjp(fun, x)[0] for _ in range(20)]
+        make_vjp(lambda x: np.sum(np.sin(x)), x)[0](1.)
+    assert prof.stats['sin']['backward_calls'] == 1
+    assert prof.stats['dot']['backward_calls'] == 0
+
+def test_profile_jacobian_and_hessian():
+    x = npr.randn(5)
+    for mode in ['rev', 'fwd']:
+        with profile() as prof:
+            J = jacobian(lambda x: np.tanh(np.dot(W, x)), mode=mode)(x)
+            H = hessian(fun, mode=mode)(x)
+        check_equivalent(J, jacobian(lambda x: np.tanh(np.dot(W, x)))(x))
+        check_equivalent(H, hessian(fun)(x))
+        assert prof.stats['tanh']['forward_calls'] > 0
+    with profile() as prof:
+        jacobian(lambda x: np.tanh(np.dot(W, x)), mode='rev')(x)
+    assert prof.stats['tanh']['backward_calls'] == 1
+
+def test_chrome_trace():
+    x = npr.randn(5)
+    with profile() as prof:
+        grad(fun)(x)
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        prof.export_chrome_trace(path)
+        with open(path) as f:
+            events = json.load(f)['traceEvents']
+    finally:
+        os.remove(path)
+    assert len(events) == len(prof.events)
+    assert set(event['cat'] for event in events) == {'forward', 'node', 'backward'}
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+    starts = [event['ts'] for event in events if event['cat'] == 'forward']
+    assert starts == sorted(starts)
@@ -0,0 +1,86 @@
+from __future__ import absolute_import
+
+try:
+    import scipy.sparse
+except:
+    from warnings import warn
+    warn('Skipping sparsity tests.')
+else:
+    import numpy as onp
+    import autograd.numpy as np
+    import autograd.numpy.random as npr
+    from autograd import jacobian, hessian
+    from autograd.misc import sparse_jacobian, sparse_hessian
+    from autograd.misc.sparsity import SparsityPattern, dependency_pattern
+
+    npr.seed(0)
+
+    def banded(x):
+        # Tridiagonal Jacobian
+        return np.sin(x) * np.concatenate([x[1:], np.zeros(1)]) + x**2 \
+            - np.concatenate([np.zeros(1), np.cos(x[:-1])])
+
+    def test_sparse_jacobian_detected_pattern():
+        x = npr.randn(20)
+        J = sparse_jacobian(banded)(x)
+        assert scipy.sparse.issparse(J)
+        assert onp.allclose(J.toarray(), jacobian(banded)(x))
+
+    def test_sparse_jacobian_pattern_holds_at_other_points():
+        J = sparse_jacobian(lambda x: np.maximum(x, 0.) * 2)
+        assert onp.allclose(J(-np.ones(4)).toarray(), onp.zeros((4, 4)))
+        assert onp.allclose(J(np.ones(4)).toarray(), 2 * onp.eye(4))
+
+    def test_dependency_pattern():
+        x = npr.randn(6)
+        pattern, point_dependent = dependency_pattern(banded, x)
+        assert not point_dependent
+        assert (pattern.toarray() == (jacobian(banded)(x) != 0)).all()
+        A = onp.eye(6) + onp.eye(6, k=2)
+        pattern, point_dependent = dependency_pattern(lambda x: np.dot(A, x**2), x)
+        assert point_dependent  # A may be a different array next time
+        assert (pattern.toarray() == A).all()
+        pattern, point_dependent = dependency_pattern(lambda x: x[np.argmax(x)] * x, x)
+        assert point_dependent
+        J = sparse_jacobian(lambda x: x[np.argmax(x)] * x)
+        for x in [npr.randn(6), npr.randn(6)]:
+            assert onp.allclose(J(x).toarray(), jacobian(lambda x: x[np.argmax(x)] * x)(x))
+
+    def test_sparse_jacobian_doesnt_hide_errors():
+        from autograd.extend import primitive, defvjp, defjvp
+        def raise_error(*args):
+            raise NotImplementedError("not supported for this input")
+        unsupported = primitive(lambda x: x)
+        defvjp(unsupported, lambda ans, x: lambda g: g)
+        defjvp(unsupported, raise_error)
+        try:
+            sparse_jacobian(lambda x: unsupported(x) + x)(npr.randn(4))
+        except NotImplementedError as e:
+            assert "not supported" in str(e)
+        else:
+            assert False
+
+    def test_sparse_jacobian_given_pattern():
+        x = npr.randn(20)
+        pattern = scipy.sparse.diags([1, 1, 1], [-1, 0, 1], shape=(20, 20))
+        assert SparsityPattern(pattern, (20,)).num_colors['fwd'] == 3
+        J = sparse_jacobian(banded, sparsity=pattern)(x)
+        assert onp.allclose(J.toarray(), jacobian(banded)(x))
+
+    def test_sparse_jacobian_uses_rows_for_wide_outputs():
+        A = npr.randn(3, 10)
+        fun = lambda x: np.dot(A, np.tanh(np.ravel(x)))
+        x = npr.randn(2, 5)
+        pattern = SparsityPattern(onp.ones((3, 10)), (2, 5))
+        assert pattern.num_colors['rev'] == 3
+        J = sparse_jacobian(fun)(x)
+        assert J.shape == (3, 10)
+        assert onp.allclose(J.toarray(), jacobian(fun)(x).reshape((3, 10)))
+
+    def test_sparse_hessian():
+        fun = lambda x: np.sum(np.sin(x[1:] * x[:-1])) + np.sum(x**3)
+        x = npr.randn(15)
+        H = sparse_hessian(fun)(x)
+        assert onp.allclose(H.toarray(), hessian(fun)(x))
+        diag = sparse_hessian(lambda x: np.sum(np.exp(x)))(x)
+        assert onp.allclose(diag.toarray(), onp.diag(onp.exp(x)))
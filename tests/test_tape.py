@@ -0,0 +1,44 @@
+import autograd.numpy as np
+import autograd.numpy.random as npr
+from autograd.test_util import check_equivalent, check_grads
+from autograd import make_vjp, make_tape_vjp, grad
+
+npr.seed(0)
+
+def check_tape_vjp(fun, x):
+    vjp, ans = make_vjp(fun)(x)
+    tape_vjp, tape_ans = make_tape_vjp(fun)(x)
+    check_equivalent(ans, tape_ans)
+    g = npr.randn(*np.shape(ans))
+    check_equivalent(vjp(g), tape_vjp(g))
+
+def test_tape_vjp_basic():
+    check_tape_vjp(lambda x: np.sin(x) * np.cos(x) + x, npr.randn(4))
+    check_tape_vjp(lambda x: np.dot(x, x.T), npr.randn(3, 2))
+
+def test_tape_vjp_fanout_and_indexing():
+    def fun(x):
+        for _ in range(3):
+            x = (x + x) / 2.0 + x[0]
+        return np.where(x > 0, x, -x)
+    check_tape_vjp(fun, npr.randn(5))
+
+def test_tape_vjp_dead_nodes():
+    def fun(x):
+        unused = np.exp(x) * 2.0
+        y = np.tanh(x)
+        unused = unused + y
+        return y
+    check_tape_vjp(fun, npr.randn(3))
+
+def test_tape_vjp_higher_order():
+    def tape_grad(fun):
+        def gradfun(x):
+            vjp, ans = make_tape_vjp(fun)(x)
+            return vjp(np.ones_like(ans))
+        return gradfun
+    fun = lambda x: np.sum(np.sin(x) * x**2)
+    x = npr.randn(3)
+    check_equivalent(tape_grad(lambda x: np.sum(tape_grad(fun)(x)))(x),
+                     grad(lambda x: np.sum(grad(fun)(x)))(x))
+    check_grads(lambda x: np.sum(tape_grad(fun)(x)))(x)
@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+import sys
+import threading
+import autograd.numpy as np
+import autograd.numpy.random as npr
+from autograd import grad, hessian
+from autograd.test_util import check_equivalent
+
+def test_trace_levels_are_per_thread():
+    # Thread b finishes its gradient while thread a is inside one. With a shared
+    # trace stack, a's nested gradient would then reuse a's outer trace level.
+    a_inside, b_inside, b_done = threading.Event(), threading.Event(), threading.Event()
+    def fun_a(x):
+        a_inside.set()
+        b_done.wait()
+        return x * grad(lambda y: np.sin(x * y))(1.)
+    def fun_b(x):
+        b_inside.set()
+        a_inside.wait()
+        return x ** 2
+    results = {}
+    def run_a():
+        b_inside.wait()
+        results['a'] = grad(fun_a)(0.5)
+    def run_b():
+        results['b'] = grad(fun_b)(3.)
+        b_done.set()
+    threads = [threading.Thread(target=run_a), threading.Thread(target=run_b)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    x = 0.5
+    check_equivalent(results['a'], 2 * x * np.cos(x) - x ** 2 * np.sin(x))
+    check_equivalent(results['b'], 6.)
+
+def test_concurrent_grads():
+    # Nested derivatives in many threads at once: each thread needs its own
+    # trace levels for the results to come out right.
+    num_threads, num_iters = 8, 30
+    fun = lambda x, c: np.sum(np.tanh(c * x) ** 2 * np.sin(x))
+    third_order = lambda x, c: grad(lambda x: np.sum(hessian(fun)(x, c)))(x)
+    x = npr.randn(4)
+    expected = [third_order(x, c) for c in range(num_threads)]
+    results = [[] for c in range(num_threads)]
+    def worker(c):
+        for _ in range(num_iters):
+            results[c].append(third_order(x, c))
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker, args=(c,)) for c in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    for c in range(num_threads):
+        assert len(results[c]) == num_iters
+        for result in results[c]:
+            check_equivalent(result, expected[c])
+
+def test_parallel_backward_pass():
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError:
+        return
+    from autograd.core import make_vjp
+    Ws = [npr.randn(120, 120) for _ in range(4)]
+    def fun(x):
+        heads = [np.tanh(np.dot(W, x)) for W in Ws]
+        return sum(np.sum(np.dot(head, head.T)) for head in heads) + np.sum(np.dot(x, x.T))
+    x = npr.randn(120, 120)
+    expected = make_vjp(fun, x)[0](1.)
+    submitted = []
+    class CountingExecutor(ThreadPoolExecutor):
+        def submit(self, *args):
+            submitted.append(args)
+            return ThreadPoolExecutor.submit(self, *args)
+    with CountingExecutor(4) as executor:
+        vjp, _ = make_vjp(fun, x, executor=executor)
+        assert np.all(vjp(1.) == expected)
+        assert submitted
+        assert np.all(vjp(1.) == expected)
+        vjp, _ = make_vjp(fun, x, consume=True, executor=executor)
+        assert np.all(vjp(1.) == expected)
+        nested = lambda x: np.sum(make_vjp(fun, x, executor=executor)[0](1.) ** 2)
+        check_equivalent(grad(nested)(x), grad(lambda x: np.sum(grad(fun)(x) ** 2))(x))
@@ -9,7 +9,12 @@ from autograd.tracer import primitive, isbox
 from autograd import (grad, elementwise_grad, jacobian, value_and_grad,
                       hessian_tensor_product, hessian, make_hvp,
                       tensor_jacobian_product, checkpoint, make_jvp,
-                      make_ggnvp, grad_and_aux)
+                      make_ggnvp, grad_and_aux, linearize, linear_transpose,
+                      make_vjp)
+from autograd.differential_operators import make_jvp_reversemode
+from autograd.extend import defjvp, defvjp, def_linear
+from nose.tools import raises
+from pickle import PicklingError
 
 npr.seed(1)
 
@@ -115,6 +120,29 @@ def test_elementwise_grad_multiple_args():
     explicit = np.array([grad(simple_fun, argnum)(A, B[i]) for i in range(len(B))])
     check_equivalent(wrapped, explicit)
 
+def test_hessian_modes():
+    A = npr.randn(4, 4)
+    fun = lambda x: (np.sum(np.tanh(np.dot(A, x)) ** 2) + np.prod(x)
+                     + np.dot(x, x) * np.tensordot(x, A, 1)[0])
+    x = npr.randn(4)
+    H = hessian(fun, mode='rev')(x)
+    check_equivalent(hessian(fun)(x), H)
+    check_equivalent(hessian(fun, mode='auto')(x), H)
+    check_grads(lambda x: np.sum(np.sin(hessian(fun)(x))), modes=['rev'])(x)
+
+def test_hessian_falls_back_without_jvps():
+    fun = lambda x: np.linalg.det(np.outer(x, x) + np.eye(3))
+    x = npr.randn(3)
+    check_equivalent(hessian(fun)(x), hessian(fun, mode='rev')(x))
+
+def test_jacobian_modes():
+    A = npr.randn(6, 3)
+    fun = lambda x: np.sin(np.dot(A, x))
+    x = npr.randn(3)
+    J = jacobian(fun, mode='rev')(x)
+    check_equivalent(jacobian(fun, mode='fwd')(x), J)
+    check_equivalent(jacobian(fun)(x), J)
+
 def test_hessian_tensor_product():
     fun = lambda a: np.sum(np.sin(a))
     a = npr.randn(5)
@@ -250,6 +278,27 @@ def test_checkpoint_correctness():
     assert np.allclose(foobaz(3.), foobaz2(3.))
     assert np.allclose(grad(foobaz)(3.), grad(foobaz2)(3.))
 
+def test_checkpoint_save_policy():
+    calls = []
+    @primitive
+    def counted_dot(a, b):
+        calls.append(None)
+        return np.dot(a, b)
+    defvjp(counted_dot, lambda ans, a, b: lambda g: np.dot(g, b.T),
+                        lambda ans, a, b: lambda g: np.dot(a.T, g))
+    layer = lambda x, W: np.tanh(counted_dot(x, W)) * 2.
+    fun = lambda layer: lambda x, W: np.sum(layer(layer(x, W), W) ** 2)
+    x, W = npr.randn(4, 3), npr.randn(3, 3)
+    expected = grad(fun(layer), (0, 1))(x, W)
+    for save, num_calls in [(None, 6), (('counted_dot',), 2),
+                            (lambda primitive, nbytes: nbytes > 48, 2),
+                            (lambda primitive, nbytes: nbytes > 96, 4)]:
+        del calls[:]
+        result = grad(fun(checkpoint(layer, save=save)), (0, 1))(x, W)
+        check_equivalent(result, expected)
+        assert len(calls) == num_calls
+    check_grads(fun(checkpoint(layer, save=('counted_dot',))), modes=['rev'], order=2)(x, W)
+
 def checkpoint_memory():
     '''This test is meant to be run manually, since it depends on
     memory_profiler and its behavior may vary.'''
@@ -287,6 +336,64 @@ def test_make_jvp():
 
     check_equivalent(jvp_explicit(x)(v), jvp(x)(v)[1])
 
+def test_linearize():
+    A = npr.randn(3, 5)
+    calls = []
+    def fun(x):
+        calls.append(x)
+        unused = np.exp(x)
+        return np.tanh(np.dot(A, x)) * np.sum(x ** 2)
+    x = npr.randn(5)
+    ans, jvp = linearize(fun)(x)
+    check_equivalent(ans, fun(x))
+    for _ in range(3):
+        v = npr.randn(5)
+        check_equivalent(jvp(v), make_jvp(fun)(x)(v)[1])
+    assert len(calls) == 1 + 1 + 3
+    check_grads(jvp, modes=['rev'])(npr.randn(5))
+    check_equivalent(linearize(lambda x: A)(x)[1](v), np.zeros((3, 5)))
+
+def test_make_jvp_reversemode():
+    A = npr.randn(3, 5)
+    fun = lambda x: np.tanh(np.dot(A, x)) * np.linalg.det(np.outer(x, x) + np.eye(5))
+    x, v = npr.randn(5), npr.randn(5)
+    check_equivalent(make_jvp_reversemode(np.tanh)(x)(v), make_jvp(np.tanh)(x)(v)[1])
+    check_equivalent(make_jvp_reversemode(fun)(x)(v), np.dot(jacobian(fun)(x), v))
+
+def test_linear_transpose():
+    A = npr.randn(3, 5)
+    fun = lambda x: np.dot(A, np.transpose(x)[::-1]).sum(1) * 2.
+    x, ct = npr.randn(4, 5), npr.randn(3)
+    check_equivalent(linear_transpose(fun)(x)(ct), make_vjp(fun)(x)[0](ct))
+
+def test_vjp_from_jvp():
+    @primitive
+    def fun(x, y):
+        return np.sin(x) * y
+    defjvp(fun, lambda g, ans, x, y: np.cos(x) * y * g,
+                lambda g, ans, x, y: np.sin(x) * g)
+    x, y = npr.randn(4), npr.randn(4)
+    check_grads(fun, modes=['rev'])(x, y)
+    check_equivalent(grad(lambda x: np.sum(fun(x, y)))(x), np.cos(x) * y)
+
+@raises(NotImplementedError)
+def test_linear_primitive_needs_vjp():
+    fun = primitive(lambda x: 2. * x)
+    def_linear(fun)
+    grad(fun)(1.)
+
+def test_vjp_from_jvp_nonlinear_argnums_only():
+    scale = primitive(lambda c, x: c * x**2)
+    defjvp(scale, 'same', lambda g, ans, c, x: 2 * c * x * g)
+    c, x = npr.randn(), npr.randn(4)
+    check_grads(lambda x: scale(c, x), modes=['rev'], order=2)(x)
+    try:
+        grad(lambda c: np.sum(scale(c, x)))(c)
+    except NotImplementedError as e:
+        assert "give its transpose with defvjp" in str(e)
+    else:
+        assert False
+
 def _make_explicit_ggnvp(f, g=lambda x: 1./2*np.dot(x, x)):
     def ggnvp_maker(x):
         J = jacobian(f)(x)
@@ -307,6 +414,28 @@ def test_make_ggnvp():
     fun2 = lambda x: np.tanh(np.dot(A, x))
     check_equivalent(make_ggnvp(fun2)(x)(v), _make_explicit_ggnvp(fun2)(x)(v))
 
+def test_make_ggnvp_stacked_vectors():
+    A = npr.randn(5, 4)
+    x = npr.randn(4)
+    V = npr.randn(3, 4)
+
+    fun = lambda x: np.tanh(np.dot(A, x))
+    explicit_ggnvp = _make_explicit_ggnvp(fun)(x)
+    check_equivalent(make_ggnvp(fun, batched=True)(x)(V),
+                     np.stack([explicit_ggnvp(v) for v in V]))
+
+def test_make_ggnvp_containers_and_scalars():
+    A = npr.randn(5, 4)
+    fun = lambda x: np.tanh(np.dot(A, x[0]) * x[1]['c'])
+    x, v = [npr.randn(4), {'c': npr.randn()}], [npr.randn(4), {'c': npr.randn()}]
+    explicit = _make_explicit_ggnvp(lambda z: fun([z[:4], {'c': z[4]}]))
+    ggnvp = make_ggnvp(fun)(x)(v)
+    z, w = np.append(x[0], x[1]['c']), np.append(v[0], v[1]['c'])
+    check_equivalent(np.append(ggnvp[0], ggnvp[1]['c']), explicit(z)(w))
+    scalar_fun = lambda x: np.sin(x) * x
+    check_equivalent(make_ggnvp(scalar_fun)(0.7)(1.3),
+                     _make_explicit_ggnvp(scalar_fun, lambda y: 0.5 * y**2)(0.7)(1.3))
+
 def test_make_ggnvp_nondefault_g():
     A = npr.randn(5, 4)
     x = npr.randn(4)
@@ -349,3 +478,34 @@ def test_wrapped_name_and_docs():
     assert grad.__doc__.startswith("\n    Returns a function which")
     assert grad(foo, 1).__name__ == 'grad_of_foo_wrt_argnum_1'
     assert grad(foo, 1).__doc__.startswith("    grad of function foo with")
+
+def picklable_fun(x, y):
+    return np.sum(np.sin(x) * y ** 2)
+
+def test_pickle_nary_functions():
+    import pickle
+    x, y = npr.randn(3), npr.randn(3)
+    for f in [grad(picklable_fun, 1), value_and_grad(picklable_fun),
+              grad(picklable_fun, (0, 1)), jacobian(grad(picklable_fun), 1),
+              hessian(picklable_fun), make_vjp(picklable_fun)]:
+        g = pickle.loads(pickle.dumps(f))
+        assert g.__name__ == f.__name__
+        if f.unary_operator is make_vjp.unary_operator:
+            check_equivalent(g(x, y)[0](1.), f(x, y)[0](1.))
+        else:
+            check_equivalent(g(x, y), f(x, y))
+
+def test_nary_functions_across_processes():
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+    except ImportError:
+        return
+    xs = npr.randn(4, 3)
+    with ProcessPoolExecutor(2) as executor:
+        results = list(executor.map(grad(picklable_fun), xs, xs))
+    check_equivalent(np.array(results), np.array([grad(picklable_fun)(x, x) for x in xs]))
+
+@raises(PicklingError)
+def test_pickle_local_operator_fails_early():
+    import pickle
+    pickle.dumps(make_ggnvp(picklable_fun))